@@ -1,32 +1,78 @@
-' Generate executable files in various formats from ASL .p files. '
+''' Generate executable files in various formats from ASL .p files.
+
+    The input may also be in any other format known to `binary.loader`,
+    such as Intel HEX or S-records.
+
+    In batch mode (``-b``) many input files are converted to several
+    formats at once. Each input is parsed only once, inputs are processed
+    in parallel, and outputs newer than their input are not regenerated.
+'''
 
 from    argparse  import ArgumentParser
-from    os.path  import basename
+from    functools  import partial
+from    os  import stat
+from    os.path  import basename, join, splitext
+import  os.path
 from    struct  import pack
 from    sys  import argv, stderr
 import  sys
 
-from    binary.tool.asl  import MemImage, parse_obj_fromfile
+from    binary.memimage  import MemImage
+from    binary.parallel  import pmap
+from    binary.tool.intelhex  import iterhex, EOFREC
+from    binary  import loader
 
 FORMATS = {
-    'a2':   'Apple II DOS type `B` file',
-    'kc85': '.CO file for Kyocera 85/Tandy Model 100/NEC PC-8201/etc.',
+    'a2':       'Apple II DOS type `B` file',
+    'kc85':     '.CO file for Kyocera 85/Tandy Model 100/NEC PC-8201/etc.',
+    'intelhex': 'Intel HEX with LF line terminators',
+    'bin':      'raw binary from lowest to highest address',
 }
 
+EXTENSIONS = {
+    'a2':       '.a2',
+    'kc85':     '.co',
+    'intelhex': '.hex',
+    'bin':      '.bin',
+}
+' Output filename extensions for each format, used in batch mode. '
+
 def main():
     args = parseargs()
     #   This is a very quick and dirty way of handling this, but conforms
     #   to our long-term interface.
-    if args.format not in FORMATS:
-        print(f"p2b: Unknown format: '{args.format} (`-L` to list formats)'",
-            file=stderr)
+    formats = args.format.split(',') if args.batch else [args.format]
+    for format in formats:
+        if format not in FORMATS:
+            print(f"p2b: Unknown format: '{format} (`-L` to list formats)'",
+                file=stderr)
+            exit(2)
+    if args.batch:
+        exit(main_batch(args, formats))
+    if len(args.files) != 2:
+        print('p2b: exactly one input and one output file required'
+            ' (or use -b)', file=stderr)
         exit(2)
-    pfile = parse_obj_fromfile(args.input)
-    bin = globals()['bin_' + args.format](pfile)
-    if args.output == '-':
+    input, output = args.files
+    mi = loader.load_fromfile(input)
+    bin = convert(mi, args.format)
+    if output == '-':
         sys.stdout.buffer.write(bin)
     else:
-        with open(args.output, 'wb') as f:  f.write(bin)
+        with open(output, 'wb') as f:  f.write(bin)
+
+def main_batch(args, formats):
+    exitcode = 0
+    results = batch(args.files, formats, outdir=args.outdir,
+        force=args.force, jobs=args.jobs)
+    for input, outputs in zip(args.files, results):
+        for path, status in outputs:
+            if status not in ('written', 'uptodate'):
+                print(f'p2b: {path}: {status}', file=stderr)
+                exitcode = 1
+            elif args.verbose > 1 or args.verbose and status == 'written':
+                print(f'{status}: {path}', file=stderr)
+    return exitcode
 
 def parseargs():
     #   Rather a hack, since it doesn't handle e.g. `--`.
@@ -42,9 +88,21 @@ def parseargs():
         help='print list of known output formats')
     a('-v', '--verbose', action='count', default=0,
         help='increase verbosity; may be used multiple times')
+    a('-b', '--batch', action='store_true',
+        help='batch mode: FORMAT is a comma-separated list of formats and'
+            ' all FILEs are inputs; each output is named after its input'
+            ' with the extension for its format')
+    a('-d', '--outdir', metavar='DIR',
+        help='batch mode: directory for output files (default: same'
+            ' directory as the input file)')
+    a('-f', '--force', action='store_true',
+        help='batch mode: regenerate output files even if up to date')
+    a('-j', '--jobs', metavar='N', type=int,
+        help='batch mode: number of parallel processes (default: CPU count)')
     a('format', help="binary format for output; 'list' to see formats")
-    a('input', help='path to input .p file')
-    a('output', help='path to output file')
+    a('files', nargs='+', metavar='FILE',
+        help='path to input .p (or Intel HEX, S-record, etc.) file'
+            ' followed by path to output file; with -b, input files')
     return p.parse_args()
 
 def listformats():
@@ -53,6 +111,84 @@ def listformats():
         print(f'  {name:>8}: {desc}')
     exit(0)
 
+####################################################################
+#   Conversion
+
+def convert(mi:MemImage, format) -> bytes:
+    ' Return the contents of `mi` converted to `format`. '
+    return globals()['bin_' + format](mi)
+
+def outpath(input, format, outdir=None):
+    ''' Return the batch mode output path for converting `input` to
+        `format`: the input path with its extension replaced by the
+        one for `format`, in `outdir` if given.
+    '''
+    base = splitext(input)[0]
+    if outdir is not None:
+        base = join(outdir, basename(base))
+    return base + EXTENSIONS[format]
+
+def samefile(a, b):
+    try:
+        return os.path.samefile(a, b)
+    except FileNotFoundError:
+        return False
+
+def _mtime(path):
+    try:
+        return stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def convert_file(input, formats, outdir=None, force=False):
+    ''' Convert file `input` to each of `formats`, writing the outputs to
+        the paths given by `outpath()`. The input is read and parsed only
+        if at least one output is missing or not newer than the input (or
+        `force` is set), and then only once for all formats.
+
+        Outputs that would overwrite the input are not written.
+
+        Returns a list of ``(output path, status)`` pairs where status
+        is ``written``, ``uptodate`` or an error message. Errors are
+        returned rather than raised so that one bad input does not stop
+        a batch.
+    '''
+    inmtime = _mtime(input)
+    outputs = [ (format, outpath(input, format, outdir)) for format in formats ]
+    if not force and inmtime is not None:
+        todo = [ (f, p) for f, p in outputs
+            if (_mtime(p) or 0) <= inmtime ]
+    else:
+        todo = list(outputs)
+    results = { p: 'uptodate' for _, p in outputs }
+    for format, path in outputs:
+        if samefile(path, input):
+            results[path] = 'output would overwrite input'
+            todo.remove((format, path))
+    if todo:
+        try:
+            mi = loader.load_fromfile(input)
+        except (OSError, ValueError) as ex:
+            return [ (p, str(ex)) for _, p in outputs ]
+        for format, path in todo:
+            try:
+                bin = convert(mi, format)
+                with open(path, 'wb') as f:  f.write(bin)
+                results[path] = 'written'
+            except (OSError, ValueError) as ex:
+                results[path] = str(ex)
+    return list(results.items())
+
+def batch(inputs, formats, outdir=None, force=False, jobs=None):
+    ''' Run `convert_file()` on each of `inputs`, returning a list of
+        the results for each input in the same order.
+
+        The conversions are run in parallel by `pmap()` with `jobs`
+        processes.
+    '''
+    f = partial(convert_file, formats=formats, outdir=outdir, force=force)
+    return list(pmap(f, inputs, jobs))
+
 ####################################################################
 
 def bin_a2(mi:MemImage):
@@ -75,3 +211,9 @@ def bin_kc85(mi:MemImage):
         + pack('<H', mi.entrypoint)
         + mi.contigbytes()
     )
+
+def bin_intelhex(mi:MemImage):
+    return b'\n'.join((*iterhex(mi), EOFREC, b''))
+
+def bin_bin(mi:MemImage):
+    return mi.contigbytes()
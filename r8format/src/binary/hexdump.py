@@ -0,0 +1,97 @@
+''' Fast hexadecimal dumps of binary data.
+
+    Output lines are in a typical address/hex/char format, though not
+    exactly the same as either ``hexdump -C`` or ``xxd``::
+
+        0400: 41 42 43 44 00 01 02 03 - ff fe fd fc 7e 7f 80 20  ABCD.... ....~..
+
+    The line address is always a multiple of 16 and locations without
+    data are displayed as spaces. As with ``hexdump``, a run of lines with
+    the same data as the preceding line may be collapsed to a single
+    ``*`` line. Unlike ``hexdump``, the last line of the data is always
+    shown, so that the extent of the data is clear.
+
+    The data are formatted 16 bytes at a time from a `memoryview` using
+    a table of hex digit pairs and `bytes.translate()`, rather than
+    formatting each byte.
+'''
+
+import  sys
+
+LINELEN = 16
+
+HEXDIGITS = tuple( '{:02x}'.format(b) for b in range(256) )
+' The two hex digits of each byte value. '
+
+PRINTABLE = bytes( b if 0x20 <= b < 0x7F else ord('.') for b in range(256) )
+' `bytes.translate()` table mapping non-printable characters to ``.``. '
+
+def _view(data):
+    ' Return a `memoryview` of `data`, which may also be a sequence of ints. '
+    try:
+        return memoryview(data).cast('B')
+    except TypeError:
+        return memoryview(bytes(data))
+
+def formatline(addr, data, lead=0):
+    ''' Return a dump line for `addr`, which must be a multiple of
+        `LINELEN`, displaying `data` starting `lead` bytes after `addr`.
+        `lead` + ``len(data)`` must not exceed `LINELEN`; positions
+        before and after the data are displayed as spaces.
+    '''
+    hex = ' '.join(map(HEXDIGITS.__getitem__, data))
+    chars = bytes(data).translate(PRINTABLE).decode('ASCII')
+    if lead or len(data) < LINELEN:
+        hex = ('   ' * lead + hex + ' ').ljust(LINELEN * 3)
+        chars = (' ' * lead + chars).ljust(LINELEN)
+    else:
+        hex += ' '
+    return '{:04x}: {}- {} {} {}'.format(
+        addr, hex[:24], hex[24:], chars[:8], chars[8:])
+
+def dumplines(addr, data, collapse=True):
+    ''' Generate dump lines for `data` (any bytes-like object or sequence
+        of ints) starting at `addr`. If `collapse` is true, consecutive
+        complete lines with the same data as the preceding line are
+        replaced by a single ``*`` line, except for the last line.
+    '''
+    view = _view(data)
+    end = len(view)
+    if end == 0:
+        return
+    lead = addr % LINELEN
+    addr -= lead
+    first = LINELEN - lead
+    yield formatline(addr, view[:first], lead)
+
+    prev = view[:first] if lead == 0 else None
+    starred = False
+    last = end - LINELEN
+    for pos in range(first, end, LINELEN):
+        addr += LINELEN
+        chunk = view[pos:pos+LINELEN]
+        if collapse and pos < last and chunk == prev:
+            if not starred:
+                yield '*'
+                starred = True
+            continue
+        starred = False
+        prev = chunk
+        yield formatline(addr, chunk)
+
+def dump(addr, data, file=None, collapse=True):
+    ''' Write a dump of `data` starting at `addr` to `file` (default
+        `sys.stdout`). See `dumplines()`. Lines are written as they are
+        generated, so the whole dump is never held in memory.
+    '''
+    if file is None: file = sys.stdout
+    file.writelines( l + '\n' for l in dumplines(addr, data, collapse) )
+
+def dumpimage(mi, file=None, collapse=True):
+    ''' Write a dump of each record in `MemImage` `mi` to `file` (default
+        `sys.stdout`), in order of address. Overlapping records are
+        dumped separately, and so appear as adjacent lines with the same
+        address.
+    '''
+    for addr, data in sorted(mi, key=lambda rec: rec[0]):
+        dump(addr, data, file, collapse)
@@ -0,0 +1,109 @@
+''' binary.loader - Load memory images from files of any known format.
+
+    Each format is registered with a name, a description, a "sniff"
+    function that recognises the format from the first few bytes of
+    a file, and a parse function that reads a binary stream and returns
+    a `MemImage`. `load()` and `load_fromfile()` use these to determine
+    the format of a file (unless it's given explicitly) and parse it.
+
+    Further formats may be added with `register()`.
+'''
+
+from    collections  import namedtuple as ntup
+from    string  import hexdigits
+
+from    binary.tool  import asl, asxxxx, intelhex, srec
+
+####################################################################
+
+Format = ntup('Format', 'name description sniff parse')
+
+FORMATS = {}
+' Registered formats, by name, in the order they are tried by `sniff()`. '
+
+SNIFFLEN = 16
+' The number of bytes at the start of a file passed to sniff functions. '
+
+class UnknownFormat(ValueError):
+    ' The format of a file could not be determined or is not registered. '
+
+def register(name, description, sniff, parse):
+    ''' Register a file format. `sniff` is given up to `SNIFFLEN` bytes
+        from the start of a file and returns true if the file appears to
+        be in this format. `parse` is given a binary stream positioned at
+        the start of the file and returns a `MemImage`.
+    '''
+    FORMATS[name] = Format(name, description, sniff, parse)
+
+def sniff(head):
+    ''' Return the name of the first registered format whose sniff function
+        accepts `head`, the first bytes of a file, or `None` if none do.
+    '''
+    for f in FORMATS.values():
+        if f.sniff(head):
+            return f.name
+    return None
+
+def load(bytestream, format=None):
+    ''' Parse `bytestream` and return a `MemImage`. If `format` is not
+        given, it is determined with `sniff()`; this requires that the
+        stream support `peek()` (as do files opened in binary mode) or
+        `seek()`.
+    '''
+    if format is None:
+        format = sniff(_peek(bytestream, SNIFFLEN))
+        if format is None:
+            raise UnknownFormat('unknown file format')
+    if format not in FORMATS:
+        raise UnknownFormat(f'unknown format name: {format!r}')
+    return FORMATS[format].parse(bytestream)
+
+def load_fromfile(path, format=None):
+    ' Open `path` and `load()` it. '
+    with open(path, 'rb') as stream:
+        try:
+            return load(stream, format)
+        except UnknownFormat as ex:
+            raise UnknownFormat(f'{path}: {ex}') from None
+
+def _peek(stream, n):
+    if hasattr(stream, 'peek'):
+        return stream.peek(n)[:n]
+    head = stream.read(n)
+    stream.seek(-len(head), 1)
+    return head
+
+####################################################################
+#   Standard formats
+
+_HEXDIGITS = frozenset(hexdigits.encode('ASCII'))
+
+def _ishex(bs):
+    return bs and all(b in _HEXDIGITS for b in bs)
+
+def sniff_asl(head):
+    return head[:2] == b'\x89\x14'
+
+def sniff_intelhex(head):
+    head = head.lstrip()
+    return head[:1] == b':' and _ishex(head[1:9])
+
+def sniff_srec(head):
+    head = head.lstrip()
+    return head[:1] == b'S' and _ishex(head[1:10])
+
+def sniff_cocobin(head):
+    ''' CoCo binaries have no magic number; we accept anything starting
+        with a data ($00) or end ($FF) record header, so this format
+        should be tried last.
+    '''
+    return len(head) >= 5 and head[0] in (0x00, 0xFF)
+
+register('asl', 'Macroassembler AS code file (.p)',
+    sniff_asl, asl.parse_obj)
+register('intelhex', 'Intel HEX',
+    sniff_intelhex, intelhex.parse_intelhex)
+register('srec', 'Motorola S-record (S19/S28/S37)',
+    sniff_srec, srec.parse_srec)
+register('cocobin', 'CoCo Disk BASIC binary (ASxxxx .bin)',
+    sniff_cocobin, asxxxx.parse_cocobin)
@@ -44,6 +44,26 @@ class MemImage(list):
             raise TypeError(f'data type {type(data)} not int sequence')
         self.append(MemImage.MemRecord(addr, data))
 
+    def addchunks(self, chunks):
+        ''' Add records for an iterable of ``(addr, data)`` chunks, merging
+            each chunk that starts at the address where the previous one
+            ended into a single record. This is for parsers of formats,
+            such as Intel HEX and S-records, that split the data into many
+            short records; it is done in a single pass over `chunks`, which
+            may be a generator.
+        '''
+        start = None
+        buf = bytearray()
+        for addr, data in chunks:
+            if start is not None and addr == start + len(buf):
+                buf += data
+                continue
+            if start is not None:
+                self.addrec(start, bytes(buf))
+            start, buf = addr, bytearray(data)
+        if start is not None:
+            self.addrec(start, bytes(buf))
+
     def append(self, rec):
         ''' Append an additional data record to the list of records for
             this image. This will update `startaddr` to the start address
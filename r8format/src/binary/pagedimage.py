@@ -0,0 +1,320 @@
+''' A sparse memory image stored as fixed-size pages.
+
+    A `MemImage` is a list of records that may overlap and are in no
+    particular order, so combining, patching or comparing images
+    requires first materialising them with `MemImage.contigbytes()`. A
+    `PagedImage` instead stores data in 256-byte pages, each a
+    `bytearray` with a bitmap of which of its bytes have been set.
+    Only pages containing data are stored, so large, sparse address
+    spaces cost nothing, and operations on whole images work page by
+    page rather than byte by byte.
+
+    `PagedImage` can be converted to and from `MemImage` and `RomImage`,
+    so code can be moved to it gradually.
+'''
+
+from    binary.memimage  import MemImage
+from    binary.romimage  import RomImage
+
+PAGESIZE = 0x100
+FULLPAGE = (1 << PAGESIZE) - 1
+' The presence bitmap of a page with every byte set. '
+
+def _runs(bits):
+    ''' Generate ``(start, end)`` offsets of each run of consecutive set
+        bits in the int `bits`, from least to most significant.
+    '''
+    offset = 0
+    while bits:
+        skip = (bits & -bits).bit_length() - 1
+        bits >>= skip; offset += skip
+        length = (~bits & (bits + 1)).bit_length() - 1
+        yield offset, offset + length
+        bits >>= length; offset += length
+
+def _mask(start, end):
+    ' Return a bitmap with bits `start` up to but not including `end` set. '
+    return ((1 << (end - start)) - 1) << start
+
+class PagedImage:
+    ''' A sparse memory image of `PAGESIZE`-byte pages.
+
+        `pages` is a dict mapping page number (address // `PAGESIZE`) to
+        a `bytearray` of the page's data, and `present` maps the same
+        page numbers to an int bitmap with bit *n* set if byte *n* of
+        the page has been set. Bytes that have not been set read as
+        `fill`. Pages with no bytes set are not stored.
+
+        As with `MemImage`, `entrypoint` is the optional start address
+        of the program.
+    '''
+
+    def __init__(self, fill=0x00):
+        self.pages = {}
+        self.present = {}
+        self.entrypoint = None
+        self.fill = fill
+
+    def __repr__(self):
+        return '{}(pages={}, bytes={}, entrypoint={})'.format(
+            type(self).__name__, len(self.pages), len(self),
+            None if self.entrypoint is None else f'${self.entrypoint:04X}')
+
+    def __len__(self):
+        ' The number of bytes that have been set. '
+        return sum(bits.bit_count() if hasattr(bits, 'bit_count')
+            else bin(bits).count('1') for bits in self.present.values())
+
+    def __eq__(self, other):
+        if not isinstance(other, PagedImage):
+            return NotImplemented
+        return self.entrypoint == other.entrypoint \
+            and next(self.diff(other), None) is None
+
+    def _page(self, pageno):
+        page = self.pages.get(pageno)
+        if page is None:
+            page = self.pages[pageno] = bytearray([self.fill]) * PAGESIZE
+            self.present[pageno] = 0
+        return page
+
+    ####################################################################
+    #   Reading and writing
+
+    def write(self, addr, data):
+        ''' Set the bytes starting at `addr` to `data`, which may be any
+            bytes-like object or sequence of ints.
+        '''
+        data = memoryview(bytes(data))
+        pos, end = 0, len(data)
+        while pos < end:
+            pageno, offset = divmod(addr + pos, PAGESIZE)
+            n = min(PAGESIZE - offset, end - pos)
+            self._page(pageno)[offset:offset+n] = data[pos:pos+n]
+            self.present[pageno] |= _mask(offset, offset + n)
+            pos += n
+
+    def read(self, addr, length):
+        ''' Return the `length` bytes starting at `addr` as a `bytes`.
+            Bytes that have not been set are `fill`.
+        '''
+        out = bytearray([self.fill]) * length
+        pos = 0
+        while pos < length:
+            pageno, offset = divmod(addr + pos, PAGESIZE)
+            n = min(PAGESIZE - offset, length - pos)
+            page = self.pages.get(pageno)
+            if page is not None:
+                out[pos:pos+n] = page[offset:offset+n]
+            pos += n
+        return bytes(out)
+
+    def __contains__(self, addr):
+        ' `True` if the byte at `addr` has been set. '
+        pageno, offset = divmod(addr, PAGESIZE)
+        return bool(self.present.get(pageno, 0) >> offset & 1)
+
+    def __getitem__(self, addr):
+        ''' Return the byte at `addr`, or `None` if it has not been set. '''
+        pageno, offset = divmod(addr, PAGESIZE)
+        if self.present.get(pageno, 0) >> offset & 1:
+            return self.pages[pageno][offset]
+        return None
+
+    @property
+    def startaddr(self):
+        ' The lowest address set, or `None` if the image is empty. '
+        if not self.present: return None
+        pageno = min(self.present)
+        bits = self.present[pageno]
+        return pageno * PAGESIZE + (bits & -bits).bit_length() - 1
+
+    @property
+    def endaddr(self):
+        ' The address after the highest address set, or `None` if empty. '
+        if not self.present: return None
+        pageno = max(self.present)
+        return pageno * PAGESIZE + self.present[pageno].bit_length()
+
+    ####################################################################
+    #   Export
+
+    def chunks(self):
+        ''' Generate ``(addr, memoryview)`` for each run of set bytes
+            within a page, in address order. The memoryviews refer
+            directly to the page data; no data are copied. A run that
+            continues into the next page is returned as a separate chunk.
+        '''
+        for pageno in sorted(self.pages):
+            view = memoryview(self.pages[pageno])
+            base = pageno * PAGESIZE
+            for start, end in _runs(self.present[pageno]):
+                yield base + start, view[start:end]
+
+    def spans(self):
+        ''' Generate ``(addr, data)`` for each contiguous run of set bytes
+            in address order. When a run lies within a single page `data`
+            is a `memoryview` of the page data (as with `chunks()`);
+            otherwise the chunks are joined into a `bytes`.
+        '''
+        start, end, parts = None, None, []
+        for addr, view in self.chunks():
+            if parts and addr == end:
+                parts.append(view); end += len(view)
+                continue
+            if parts:
+                yield start, parts[0] if len(parts) == 1 else b''.join(parts)
+            start, end, parts = addr, addr + len(view), [view]
+        if parts:
+            yield start, parts[0] if len(parts) == 1 else b''.join(parts)
+
+    def contigbytes(self):
+        ''' Return the bytes from `startaddr` to `endaddr`, with unset
+            bytes as `fill`, as `MemImage.contigbytes()` does.
+        '''
+        if not self.present: return b''
+        return self.read(self.startaddr, self.endaddr - self.startaddr)
+
+    ####################################################################
+    #   Combining and comparing images
+
+    def merge(self, other, style='conflict'):
+        ''' Overlay the data in PagedImage `other` on this image.
+
+            `style` determines what happens when a byte is set in both
+            images, as with `SymTab.merge()`:
+            - ``ignorenew``: Ignore all data in `other` (no-op).
+            - ``prefcur``: Keep the existing byte.
+            - ``prefnew``: Replace the existing byte with the new one.
+            - ``conflict``: Raise a `ValueError` if the bytes differ.
+              If no bytes differ, the data are merged as with ``prefnew``;
+              if any do, this image is not changed.
+
+            The entry point is taken from `other` if this image does not
+            have one. This works a page at a time; pages present only in
+            `other` are copied whole if both images have the same `fill`.
+            Returns `self`.
+        '''
+        if style == 'ignorenew':
+            return self
+        if style not in ('prefcur', 'prefnew', 'conflict'):
+            raise ValueError('Bad `style` parameter: ' + style)
+        if style == 'conflict':
+            conflict = next(self._conflicts(other), None)
+            if conflict is not None:
+                raise ValueError('memory conflict at ${:04X}: ${:02X} != ${:02X}'
+                    .format(conflict, self[conflict], other[conflict]))
+        for pageno, opage in other.pages.items():
+            obits = other.present[pageno]
+            page = self.pages.get(pageno)
+            if page is None:
+                if other.fill == self.fill:
+                    self.pages[pageno] = bytearray(opage)
+                    self.present[pageno] = obits
+                    continue
+                page = self._page(pageno)
+            bits = self.present[pageno]
+            if style == 'prefcur':
+                copy = obits & ~bits
+            else:
+                copy = obits
+            if copy == FULLPAGE:
+                page[:] = opage
+            else:
+                for start, end in _runs(copy):
+                    page[start:end] = opage[start:end]
+            self.present[pageno] = bits | obits
+        if self.entrypoint is None:
+            self.entrypoint = other.entrypoint
+        return self
+
+    def _conflicts(self, other):
+        ' Generate the addresses set in both images to different values. '
+        for pageno in sorted(self.pages.keys() & other.pages.keys()):
+            both = self.present[pageno] & other.present[pageno]
+            a, b = self.pages[pageno], other.pages[pageno]
+            if not both or a == b:
+                continue
+            for start, end in _runs(both):
+                if a[start:end] == b[start:end]:
+                    continue
+                for i in range(start, end):
+                    if a[i] != b[i]:
+                        yield pageno * PAGESIZE + i
+
+    def diff(self, other):
+        ''' Generate ``(start, end)`` address ranges (`end` exclusive) in
+            which this image and `other` differ, in address order. A byte
+            differs if it is set in only one image or is set to different
+            values in each. Pages whose data and bitmaps are identical are
+            compared with a single `bytearray` comparison.
+        '''
+        start = end = None
+        for pageno in sorted(self.pages.keys() | other.pages.keys()):
+            bits = self.present.get(pageno, 0)
+            obits = other.present.get(pageno, 0)
+            page, opage = self.pages.get(pageno), other.pages.get(pageno)
+            differs = bits ^ obits
+            both = bits & obits
+            if both and page != opage:
+                for s, e in _runs(both):
+                    if page[s:e] == opage[s:e]:
+                        continue
+                    for i in range(s, e):
+                        if page[i] != opage[i]:
+                            differs |= 1 << i
+            base = pageno * PAGESIZE
+            for s, e in _runs(differs):
+                if start is not None and base + s == end:
+                    end = base + e
+                    continue
+                if start is not None:
+                    yield start, end
+                start, end = base + s, base + e
+        if start is not None:
+            yield start, end
+
+    ####################################################################
+    #   Conversion
+
+    @classmethod
+    def from_memimage(cls, mi, style='prefnew'):
+        ''' Create a `PagedImage` from a `MemImage` (or any iterable of
+            ``(addr, data)`` records). Records are written in order;
+            `style` (as for `merge()`) determines what happens when
+            records overlap. The default, ``prefnew``, lets later records
+            overwrite earlier ones.
+        '''
+        pi = cls(fill=getattr(mi, 'fill', 0x00))
+        for addr, data in mi:
+            if style == 'prefnew':
+                pi.write(addr, data)
+            else:
+                rec = cls(); rec.write(addr, data)
+                pi.merge(rec, style)
+        pi.entrypoint = getattr(mi, 'entrypoint', None)
+        return pi
+
+    def to_memimage(self):
+        ' Return a `MemImage` with one record per contiguous span. '
+        mi = MemImage(fill=self.fill)
+        mi.addchunks((addr, bytes(data)) for addr, data in self.spans())
+        mi.entrypoint = self.entrypoint
+        return mi
+
+    @classmethod
+    def from_romimage(cls, ri):
+        ' Create a `PagedImage` from the data in `RomImage` `ri`. '
+        pi = cls()
+        pi.write(0, ri.image)
+        return pi
+
+    def to_romimage(self, name, cachedir=None):
+        ''' Return a new `RomImage` named `name` (with optional `cachedir`)
+            holding this image's data from address $0000 to `endaddr`,
+            with unset bytes as `fill`.
+        '''
+        ri = RomImage(name, cachedir)
+        if self.present:
+            ri.set_image(0, self.read(0, self.endaddr))
+        return ri
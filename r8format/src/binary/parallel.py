@@ -0,0 +1,30 @@
+''' binary.parallel - Run a function over many inputs in worker processes.
+
+    Batch conversions (``p2b -b``, ``cmtconv -b`` and the parameter grid
+    of `cmtconv.autodecode`) use `pmap()` so that small batches, and
+    ``--jobs 1``, run in the calling process without the cost of
+    starting a process pool.
+'''
+
+from    concurrent.futures  import ProcessPoolExecutor
+
+def pmap(f, items, jobs=None, initializer=None, initargs=()):
+    ''' Generate ``f(item)`` for each of the sequence `items`, in order.
+
+        The calls are run in parallel using a pool of `jobs` processes
+        (default: the number of CPUs), or serially in this process if
+        `jobs` is 1 or there is only one item. `initializer`, if given,
+        is called with `initargs` once in each worker process, or once
+        in this process before the serial calls.
+
+        `f`, the items and the results must be picklable when run in
+        parallel.
+    '''
+    if jobs == 1 or len(items) < 2:
+        if initializer is not None:
+            initializer(*initargs)
+        yield from map(f, items)
+        return
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer,
+            initargs=initargs) as pool:
+        yield from pool.map(f, items)
@@ -12,12 +12,20 @@
     optionally use `patches()` to apply the relevant patches from a
     sequence of *patchspecs,* and then use `writefile()` or `writefd()` to
     write out the image.
+
+    Downloads are cached by content: each file is stored under its SHA-256
+    hash, with a small index mapping URLs to hashes. Cache files are
+    written atomically and verified when read, so a cache directory may
+    be shared by several projects or concurrent jobs, and a partial or
+    corrupted download is never used.
 '''
 
+from    hashlib  import sha256
 from    pathlib  import Path
+from    tempfile  import NamedTemporaryFile
 from    urllib.request  import HTTPError, urlopen
 from    urllib.parse  import urlparse
-import  re
+import  os, re, stat
 
 class RomImage:
     ''' A `RomImage` is a sequence of bytes always starting at address
@@ -33,6 +41,9 @@ class RomImage:
         A loadspec is a path or URL, called a *source*, optionally prefixed
         by ``@hhhh:`` where *hhhh* is any number of hexadecimal digits
         specifying an offset in this ROM image at which to load the source.
+        The source may be followed by ``#sha256=`` and the 64 hex digits of
+        the expected SHA-256 hash of its contents; loading fails with a
+        `ValueError` if the data do not match.
 
         A patchspec is a loadspec prefixed by ``name=`` where *name*
         matches the name assigned to this RomImage at instantiation, as
@@ -49,8 +60,8 @@ class RomImage:
             will always be fetched. Otherwise `cachedir` must be a
             path-like object in which local copies of the downloaded URLs
             will be stored to be read the next time the same URL is
-            encountered. (The subdirectories under this will be generated
-            with `cache_file(url)`)
+            encountered. (See `cache_path()` and `index_path()` for the
+            layout.)
         '''
         self.name       = name
         if cachedir is None:    self.cachedir = None
@@ -67,6 +78,7 @@ class RomImage:
 
     LOADSPEC = re.compile(r'(@[0-9A-Fa-f]+:)?(.*)')
     SCHEME   = re.compile(r'^[A-Za-z][A-Za-z0-9+.-]+:')
+    HASHSPEC = re.compile(r'#sha256=([0-9A-Fa-f]{64})$')
 
     @staticmethod
     def parse_loadspec(loadspec):
@@ -84,10 +96,64 @@ class RomImage:
         elif addr:          return (int(addr[1:-1], 16), rhs)
         else:               return (0, rhs)
 
+    @staticmethod
+    def split_hash(source):
+        ''' Split a source (path or URL) with an optional ``#sha256=…``
+            suffix into the source and the lower-case hash, or `None`
+            if no hash was given.
+        '''
+        m = RomImage.HASHSPEC.search(source)
+        if m is None:   return source, None
+        else:           return source[:m.start()], m.group(1).lower()
+
+    def cache_path(self, digest):
+        ' The path in the cache directory of the file with SHA-256 `digest`. '
+        return self.cachedir.joinpath('sha256', digest)
+
+    def index_path(self, url):
+        ''' The path of the cache index entry for `url`, which contains
+            the SHA-256 digest of the data last downloaded from it.
+
+            Each URL has its own entry file, named by the hash of the URL,
+            so that concurrent writers never need to update the same file.
+        '''
+        urlhash = sha256(url.encode('UTF-8')).hexdigest()
+        return self.cachedir.joinpath('url', urlhash)
+
+    def cache_lookup(self, url):
+        ' Return the digest recorded in the index for `url`, or `None`. '
+        try:
+            entry = self.index_path(url).read_text(encoding='UTF-8')
+        except FileNotFoundError:
+            return None
+        digest, _, entryurl = entry.rstrip('\n').partition(' ')
+        return digest if entryurl == url else None
+
+    @staticmethod
+    def _atomic_write(path, data):
+        ''' Write `data` to `path` via a temporary file in the same
+            directory that is renamed into place, so that readers never
+            see a partially written file.
+        '''
+        path.parent.mkdir(exist_ok=True, parents=True)
+        with NamedTemporaryFile(dir=str(path.parent), prefix='.tmp-',
+                delete=False) as f:
+            try:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            except BaseException:
+                os.unlink(f.name)
+                raise
+        os.replace(f.name, str(path))
+
     def cache_file(self, url, mkdir=True):
         ''' Given a URL return a (hopefully) unique filesystem path in which
             to cache the downloaded ROM image.
 
+            This is the old cache layout, no longer used by `load()`,
+            which uses the content-addressed `cache_path()` instead.
+
             There are two instances that can cause collisions that we
             (currently) don't deal with:
 
@@ -118,6 +184,25 @@ class RomImage:
             self.image += b'\x00' * (offset - len(self.image))
         self.image[offset:offset+len(bs)] = bs
 
+    def _readinto(self, offset, f, size):
+        ''' Read `size` bytes from binary file `f` directly into the image
+            at `offset`, extending the image if necessary, and return the
+            SHA-256 hex digest of the data read.
+        '''
+        if not isinstance(self.image, bytearray):
+            self.image = bytearray(self.image)
+        end = offset + size
+        if end > len(self.image):
+            self.image += bytes(end - len(self.image))
+        with memoryview(self.image) as mv, mv[offset:end] as view:
+            pos = 0
+            while pos < size:
+                n = f.readinto(view[pos:])
+                if not n:
+                    raise EOFError(f'{f.name}: file truncated while reading')
+                pos += n
+            return sha256(view).hexdigest()
+
     def writefile(self, path):
         ' Write this binary image to the given filename. '
         with open(path, 'wb') as f:  self.writefd(f)
@@ -126,33 +211,80 @@ class RomImage:
         ' Write this binary image to the given file descriptor. '
         fd.write(self.image)
 
-    def readfile(self, startaddr, path):
-        with open(path, 'rb') as f:  self.set_image(startaddr, f.read())
+    def readfile(self, startaddr, path, digest=None):
+        ''' Read the file at `path` into the image at `startaddr`. Regular
+            files are read directly into the image without intermediate
+            copies. If `digest` is given and the SHA-256 digest of the
+            file's contents does not match, `ValueError` is raised and
+            the image is left as it was.
+        '''
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if not stat.S_ISREG(st.st_mode):
+                data = f.read()
+                self._checkdigest(path, digest, sha256(data).hexdigest())
+                self.set_image(startaddr, data)
+                return
+            #   Save just the part of the image the file overwrites, so
+            #   that it can be restored if the file is bad.
+            oldlen = len(self.image)
+            saved = bytes(self.image[startaddr:startaddr+st.st_size])
+            try:
+                actual = self._readinto(startaddr, f, st.st_size)
+                self._checkdigest(path, digest, actual)
+            except (ValueError, EOFError):
+                self.image[startaddr:startaddr+len(saved)] = saved
+                del self.image[oldlen:]
+                raise
+
+    @staticmethod
+    def _checkdigest(source, expected, actual):
+        if expected is not None and expected != actual:
+            raise ValueError(f'{source}: SHA-256 {actual}'
+                f' does not match expected {expected}')
 
     def load(self, offset, source):
-        ''' Load the data from `source` (a URL or path) into this RomImage,
-            at offset `offset`. If `offset` is -1, clear the RomImage (set
-            its length to 0).
+        ''' Load the data from `source` (a URL or path, optionally followed
+            by an expected hash as described in `RomImage`) into this
+            RomImage, at offset `offset`. If `offset` is -1, clear the
+            RomImage (set its length to 0).
+
+            URLs are fetched from the cache if it has a file with the
+            expected hash or, if none was given, the hash recorded for the
+            URL in the cache index. Cached files that fail verification
+            are removed and downloaded again.
         '''
         if offset == -1:
             self.clear()
             return
 
-        if not self.SCHEME.match(str(source)):      # is path to a file?
-            self.readfile(offset, source)
+        source, expected = self.split_hash(str(source))
+        if not self.SCHEME.match(source):           # is path to a file?
+            self.readfile(offset, source, expected)
             return
 
         if self.cachedir:
-            cf = self.cache_file(source)
-            if cf.exists():
-                self.readfile(offset, cf)
-                return
+            digest = expected or self.cache_lookup(source)
+            if digest is not None:
+                cf = self.cache_path(digest)
+                try:
+                    self.readfile(offset, cf, digest)
+                    return
+                except FileNotFoundError:
+                    pass
+                except (ValueError, EOFError):
+                    try:                cf.unlink()     # corrupted
+                    except OSError:     pass
 
         with urlopen(source) as response:
             romdata = response.read()
-            self.set_image(offset, romdata)
+        digest = sha256(romdata).hexdigest()
+        self._checkdigest(source, expected, digest)
         if self.cachedir:
-            with open(cf, 'wb') as f: f.write(romdata)
+            self._atomic_write(self.cache_path(digest), romdata)
+            self._atomic_write(self.index_path(source),
+                f'{digest} {source}\n'.encode('UTF-8'))
+        self.set_image(offset, romdata)
 
     def matchname(self, name):
         ''' Return `True` if `name` matches this RomImage's name. The the
@@ -18,9 +18,18 @@
     is the same terminology as ELF, where "sections" refer to
     link-time distinctions (such as symbols) and "segments" refer to
     run-time image setup.
+
+    A `FrozenSymTab` is an immutable symbol table stored as compact
+    parallel arrays of names, values and sections. Merging into a
+    `SymTab` does not copy symbols; the merged tables are kept as a
+    chain of *layers* that are searched on lookup and flattened into
+    a single `dict` only when the whole table is needed.
 '''
 
+from    array  import array
+from    bisect  import bisect_left
 from    collections   import namedtuple as ntup
+from    collections.abc  import Mapping, ItemsView, ValuesView
 
 class SymTab():
     ''' The symbol table of an assembled module, mapping symbol names
@@ -56,14 +65,63 @@ class SymTab():
             symlist.append(SymTab.Symbol(k, v, None))
         return SymTab(symlist)
 
+    MAXLAYERS = 16
+    ''' The maximum number of merged tables kept as layers; after this
+        the layers are flattened to keep lookups fast.
+    '''
+
     def __init__(self, symbols=None):
         if symbols is None:
             symbols = ()
-        self.symbols = { s.name: s for s in symbols }
+        self._symbols = { s.name: s for s in symbols }
+        self._layers = []
+
+    @property
+    def symbols(self):
+        ''' A `dict` mapping names to `Symbol` objects. Reading this
+            flattens any merged layers into the `dict`.
+        '''
+        if self._layers:
+            self._flatten()
+        return self._symbols
+
+    @symbols.setter
+    def symbols(self, symbols):
+        self._symbols = symbols
+        self._layers = []
+
+    def _flatten(self):
+        ss = self._symbols
+        for layer, style in self._layers:
+            items = layer.items()
+            if style == 'prefnew':
+                ss.update(items)
+            else:
+                new = dict(items); new.update(ss); ss = new
+        self._symbols = ss
+        self._layers = []
+
+    def _lookup(self, name):
+        ' Return the `Symbol` named `name`, or `None`, without flattening. '
+        sym = self._symbols.get(name)
+        for layer, style in self._layers:
+            if sym is not None and style == 'prefcur':
+                continue
+            sym = layer.get(name, sym)
+        return sym
+
+    def freeze(self):
+        ' Return a `FrozenSymTab` with the symbols in this table. '
+        return FrozenSymTab(self.symbols.values())
 
     def sym(self, name):
         ' Given a symbol name, return its Symbol object. '
-        return self.symbols[name]
+        if not self._layers:
+            return self._symbols[name]
+        sym = self._lookup(name)
+        if sym is None:
+            raise KeyError(name)
+        return sym
 
     def __len__(self):
         return len(self.symbols)
@@ -76,10 +134,11 @@ class SymTab():
         ''' Allow reading of symbol values as attributes, so long as
             they do not collide with existing attributes.
         '''
-        if name in self.symbols:
-            return self[name]
-        else:
-            raise AttributeError("No such attribute: " + name)
+        if '_symbols' in self.__dict__:     # not during copy/unpickle
+            sym = self._lookup(name)
+            if sym is not None:
+                return sym.value
+        raise AttributeError("No such attribute: " + name)
 
     def __iter__(self):
         ''' Iteration iterates over just the ``(name,value)`` of all symbols.
@@ -108,25 +167,151 @@ class SymTab():
 
             This returns `symtab`.
 
+            The symbols are not copied into this table; instead `symtab`
+            is added as a layer that is searched on lookup, and the
+            layers are flattened only when the entire table is needed
+            (e.g., for `len()` or iteration). A `FrozenSymTab` is added
+            as-is, making the merge O(1); other tables are snapshotted
+            with a `dict` copy, as they may later change. A
+            ``conflict`` merge must also check each new name, and
+            changes nothing if it raises an error.
+
             XXX ``style='conflict'`` merges should not raise a conflict
             if a new `Symbol` with the same name as an existing `Symbol`
             also has the same value and other fields.
         '''
-        ss = self.symbols
-        newvals = symtab.symbols.values()
+        if style == 'ignorenew':
+            return symtab
+        if style not in ('conflict', 'prefcur', 'prefnew'):
+            raise ValueError('Bad `style` parameter: ' + style)
+        if isinstance(symtab, FrozenSymTab):
+            layer = symtab.symbols
+        else:
+            layer = dict(symtab.symbols)
         if style == 'conflict':
-            for sym in newvals:
-                if sym.name in ss:
+            for sym in layer.values():
+                if self._lookup(sym.name) is not None:
                     raise ValueError('duplicate symbol: ' + repr(sym))
-                else:
-                    ss[sym.name] = sym
-        elif style == 'ignorenew':
-            pass
-        elif style == 'prefcur':
-            for sym in newvals:
-                if sym.name not in ss: ss[sym.name] = sym
-        elif style == 'prefnew':
-            for sym in newvals: ss[sym.name] = sym
-        else:
-            raise ValueError('Bad `style` parameter: ' + style)
+            style = 'prefnew'
+        if self._layers and self._layers[-1][0] is layer \
+                and self._layers[-1][1] == style:
+            return symtab               # merging again changes nothing
+        self._layers.append((layer, style))
+        if len(self._layers) > self.MAXLAYERS:
+            self._flatten()
         return symtab
+
+class FrozenSymTab(SymTab):
+    ''' An immutable `SymTab` stored as parallel arrays, sorted by name:
+        a `tuple` of names, an `array` of values (or a `tuple` if they
+        are not all 64-bit integers) and a `tuple` of sections (or
+        `None` if no symbol has a section). `Symbol` objects are created
+        only when requested. This uses a fraction of the memory of a
+        `dict` of `Symbol` objects, and can be shared by any number of
+        `SymTab`s into which it is merged.
+
+        `symbols` is a read-only `Mapping` view of the arrays.
+    '''
+
+    def __init__(self, symbols=None):
+        if symbols is None:
+            symbols = ()
+        bynames = { s.name: s for s in symbols }
+        syms = [ bynames[name] for name in sorted(bynames) ]
+        self.names = tuple( s.name for s in syms )
+        values = [ s.value for s in syms ]
+        try:
+            self.values = array('q', values)
+        except (TypeError, OverflowError):
+            self.values = tuple(values)
+        sections = tuple( s.section for s in syms )
+        if any( sec is not None for sec in sections ):
+            self.sections = sections
+        else:
+            self.sections = None
+        self._layers = ()
+        self._view = _FrozenSymbols(self)
+
+    @property
+    def symbols(self):
+        return self._view
+
+    def _index(self, name):
+        names = self.names
+        i = bisect_left(names, name)
+        if i < len(names) and names[i] == name:
+            return i
+        return None
+
+    def _symbol(self, i):
+        section = None if self.sections is None else self.sections[i]
+        return self.Symbol(self.names[i], self.values[i], section)
+
+    def _symbols_iter(self):
+        sections = self.sections
+        if sections is None:
+            sections = (None,) * len(self.names)
+        return map(self.Symbol._make, zip(self.names, self.values, sections))
+
+    def _lookup(self, name):
+        i = self._index(name)
+        return None if i is None else self._symbol(i)
+
+    def freeze(self):
+        return self
+
+    def sym(self, name):
+        i = self._index(name)
+        if i is None:
+            raise KeyError(name)
+        return self._symbol(i)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getattr__(self, name):
+        if 'names' in self.__dict__:
+            i = self._index(name)
+            if i is not None:
+                return self.values[i]
+        raise AttributeError("No such attribute: " + name)
+
+    def __iter__(self):
+        return zip(self.names, self.values)
+
+    def valued(self, value):
+        return set( self._symbol(i)
+            for i, v in enumerate(self.values) if v == value )
+
+    def merge(self, symtab, style='conflict'):
+        raise TypeError('FrozenSymTab is immutable')
+
+class _FrozenSymbols(Mapping):
+    ' Read-only name to `Symbol` mapping view of a `FrozenSymTab`. '
+
+    def __init__(self, symtab):
+        self._st = symtab
+
+    def __getitem__(self, name):
+        return self._st.sym(name)
+
+    def __iter__(self):
+        return iter(self._st.names)
+
+    def __len__(self):
+        return len(self._st.names)
+
+    def items(self):
+        return _FrozenItems(self)
+
+    def values(self):
+        return _FrozenValues(self)
+
+class _FrozenItems(ItemsView):
+    def __iter__(self):
+        st = self._mapping._st
+        return zip(st.names, st._symbols_iter())
+
+class _FrozenValues(ValuesView):
+    def __iter__(self):
+        return self._mapping._st._symbols_iter()
@@ -16,10 +16,11 @@
 '''
 
 from    binary.memimage import MemImage
-from    binary.symtab   import SymTab
+from    binary.symtab   import SymTab, FrozenSymTab
 
 from    collections   import namedtuple as ntup
 from    struct   import unpack_from
+import  re
 
 
 ####################################################################
@@ -215,55 +216,67 @@ class ParseError(RuntimeError):
     pass
 
 def parse_symtab(stream):
-    ''' Parse the contents of an AS .map file, returning a `SymTab`.
+    ''' Parse the contents of an AS .map file, returning a `FrozenSymTab`.
 
         The map file is always ASCII-encoded (chars with the high bit set
         are not allowed in symbol names); we expect that the caller opened
         the file in text mode with that encoding specified. Newline format
-        is less criticial; the caller must ensure that it's opened such
-        that `readline()` works but we ignore all whitespace (\r, \n) at
-        line ends.
+        is less criticial; we split lines on any of \r, \n or \r\n.
+
+        The entire stream is read at once and parsed in a single pass.
     '''
+    lines = stream.read().splitlines()
     symbols = []
-    while True:
-        line = stream.readline()
-        if line == '': break    # EOF
+    i, end = 0, len(lines)
+    while i < end:
+        line = lines[i]; i += 1
 
         if line.strip() == '':
             pass # skip blank lines
         elif line.startswith('Segment '):
             #   Source code line number to machine code address mapping
             #   information. We (currently) don't use this.
-            ps_skip_block(stream)
+            i = ps_skip_block(lines, i)
         elif line.startswith('Symbols in Segment '):
             #   List of all symbols in a section. Symbol names include
             #   scope numbers for symbols in a local scope, but we do not
             #   yet know the name of that scope so we deal with that later.
             l = len('Symbols in Segment ')
             section_name = line[l:].strip()
-            symbols += ps_parse_section(section_name, stream)
+            syms, i = ps_parse_section(section_name, lines, i)
+            symbols += syms
         elif line.startswith('Info for Section '):
             #   Number to name mapping for local variable scopes.
             #   We currently don't handle this, but we need to because a
             #   given scope can have a different number from run to run.
-            ps_skip_block(stream)
+            i = ps_skip_block(lines, i)
         else:
             raise ParseError(line.rstrip())
     #   Here is where we should be renaming locally scoped symbols to
     #   have the scope name, rather than number, involved in it in
     #   some way. Potentially we might also use a Symbol subclass that
     #   allows us to note how things are scoped.
-    return SymTab(symbols)
+    return FrozenSymTab(symbols)
 
-def ps_skip_block(stream):
-    ' Read up to and including the next empty line. '
-    while True:
-        if '' == stream.readline().strip():
-            return None
+def ps_blockend(lines, i):
+    ''' Return the index of the first blank line in `lines` at or after
+        `i`, or ``len(lines)`` if there is none.
+    '''
+    end = len(lines)
+    while i < end and lines[i].strip():
+        i += 1
+    return i
+
+def ps_skip_block(lines, i):
+    ''' Skip `lines` from index `i` up to and including the next empty
+        line, returning the index of the line after it.
+    '''
+    return ps_blockend(lines, i) + 1
 
-def ps_parse_section(secname, stream):
-    ''' Read the symbols in a section, discarding the ending blank line.
-        Returns a list of `Symbol` objects.
+def ps_parse_section(secname, lines, i):
+    ''' Parse the symbols in a section starting at index `i` of `lines`,
+        up to the next blank line (or the end of `lines`). Returns a list
+        of `Symbol` objects and the index of the line after the blank line.
 
         This assumes that all ``Int`` values are in hexadecimal. This
         is not specified in the documentation but experimentally seems
@@ -280,18 +293,16 @@ def ps_parse_section(secname, stream):
         .. _documented: http://john.ccac.rwth-aachen.de:8000/as/
 
     '''
+    end = ps_blockend(lines, i)
+    Symbol = SymTab.Symbol
     syms = []
-    while True:
-        line = stream.readline().strip()
-        if '' == line:                      # blank line or EOF
-            return syms
-
+    for line in lines[i:end]:
         fields = line.split()
         if len(fields) not in (5, 6):
             #   See docstring above.
             raise ParseError('Bad map file fields (see code):'
                 ' {} fields in line {}'
-                .format(len(fields), repr(line)))
+                .format(len(fields), repr(line.strip())))
 
         name, type, value = fields[0], fields[1], fields[2]
         # size = fields[3]
@@ -302,20 +313,20 @@ def ps_parse_section(secname, stream):
             elif type == 'Float':       value = float(value)
             elif type == 'String':      value = aslunescape(value)
             else:
-                raise ParseError(f"Unknown type '{type}': {line}")
+                raise ParseError(f"Unknown type '{type}': {line.strip()}")
         except ValueError as ex:
-            raise ParseError(f"Can't parse '{value}' as {type}: {line}")
-        sym = SymTab.Symbol(name, value, secname)
-        syms.append(sym)
+            raise ParseError(
+                f"Can't parse '{value}' as {type}: {line.strip()}")
+        syms.append(Symbol(name, value, secname))
+    return syms, end + 1
+
+_ASLESCAPE = re.compile(r'\\(\d\d\d)')
 
 def aslunescape(s):
     ''' Unescape a string with AS `\nnn` decimal escapes.
         This does very little error checking because we don't expect
         to see badly formed strings.
     '''
-    if len(s) == 0:
+    if '\\' not in s:
         return s
-    elif s[0] != '\\':
-        return s[0] + aslunescape(s[1:])
-    else:
-        return chr(int(s[1:4])) + aslunescape(s[4:])
+    return _ASLESCAPE.sub(lambda m: chr(int(m[1])), s)
@@ -4,8 +4,9 @@
 '''
 
 from    collections import namedtuple as ntup
+from    os  import stat
 from    struct import unpack_from
-import  re
+import  mmap, re
 
 from    binary.memimage   import MemImage
 from    binary.symtab   import SymTab
@@ -39,10 +40,37 @@ def parse_cocobin(bytestream):
         else:
             raise ValueError('Bad cocobin record ' \
                 'type={:02X} len={:04X} addr={:04X} at pos {}' \
-                .format(type, len, addr, pos, bytestream.tell()))
+                .format(type, len, addr, bytestream.tell()))
 
 ####################################################################
 
+def _filesig(path):
+    ''' Return a signature for the file at `path` that changes when the
+        file is modified. Raises `FileNotFoundError` if it does not exist.
+    '''
+    st = stat(path)
+    return (path, st.st_size, st.st_mtime_ns)
+
+def _findline(buf, s):
+    ''' Return the offset in `buf` (a `str`, `bytes` or `mmap`) of the
+        start of the first line that is `s` with optional surrounding
+        whitespace, or `None` if there is no such line.
+
+        This uses `find()`, which is much faster than examining each line
+        or matching a multiline regular expression.
+    '''
+    nl = '\n' if isinstance(buf, str) else b'\n'
+    pos = 0
+    while True:
+        pos = buf.find(s, pos)
+        if pos < 0:
+            return None
+        start = buf.rfind(nl, 0, pos) + 1
+        end = buf.find(nl, pos)
+        if end < 0: end = len(buf)
+        if buf[start:end].strip() == s:
+            return start
+        pos += len(s)
 
 class AxSymTab(SymTab):
     ''' The symbol table of an ASxxxx module, including local symbols.
@@ -103,6 +131,11 @@ class AxSymTab(SymTab):
             generated by the linker, which is the only source of the
             relocation data for the areas in which the symbols reside.
 
+            The result is cached, keyed by the paths, sizes and
+            modification times of the files read, so re-reading an
+            unchanged program (e.g., once per test) does not re-parse
+            it. Each call returns a new `AxSymTab` object.
+
             XXX This currently assumes that the radix is hexadecimal.
             It should at least check the header line to ensure that it
             says 'Hexadecimal [16-bits]'.
@@ -112,23 +145,70 @@ class AxSymTab(SymTab):
             noext = path[0:-4]
         else:
             noext = path
-        symtab = None
+        mappath = noext + '.map'
+        #   This raises FileNotFoundError when there is no .map file; see
+        #   below.
+        mapsig = _filesig(mappath)
         for withext in (path, noext+'.sym', noext+'.rst', noext+'.lst'):
             try:
-                with open(withext, 'r') as stream:
-                    symtab = AxSymTab.readsymtabstream(stream)
+                key = (_filesig(withext), mapsig)
             except FileNotFoundError:
-                pass
-        if symtab is None:
+                continue
+            cached = AxSymTab._readcache.get(key)
+            if cached is not None:
+                return cached.copy()
+            symtab = AxSymTab.readsymtabfile(withext)
+            if symtab is not None:
+                break
+        else:
             raise FileNotFoundError(
                 'Could not find .sym .rst or .lst for path ' + path)
-        with open(noext+'.map', 'r') as stream:
+        with open(mappath, 'r') as stream:
             symtab.relocate(stream)
             #   This raises FileNotFoundError when we can't read the .map file.
             #   Another option would be to print a warning and continue with
             #   an unrelocated symbol table, but it's more reliable and minimal
             #   extra effort to make the developer always generate a .map file.
-        return symtab
+        if len(AxSymTab._readcache) >= AxSymTab.READCACHE_SIZE:
+            del AxSymTab._readcache[next(iter(AxSymTab._readcache))]
+        AxSymTab._readcache[key] = symtab
+        return symtab.copy()
+
+    READCACHE_SIZE = 32
+    ' Maximum number of symbol tables cached by `readsymtabpath()`. '
+    _readcache = {}
+
+    def copy(self):
+        ''' Return a copy of this symbol table. (`Symbol` and `Area`
+            objects are immutable and so are shared with the copy.)
+        '''
+        st = AxSymTab(self.symbols.values(), self.areas)
+        st.relocated = self.relocated
+        return st
+
+    @staticmethod
+    def readsymtabfile(path):
+        ''' Read the symbol and area tables from the ASxxxx .lst, .rst
+            or .sym file at `path`, as with `readsymtabstream()`.
+
+            Listings may be large, so rather than reading the file line
+            by line, this memory-maps it and searches for the start of the
+            symbol table (which is at the end of the file), decoding and
+            splitting into lines only the symbol and area tables.
+        '''
+        with open(path, 'rb') as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                #   Empty files and non-regular files can't be mapped.
+                data = f.read()
+            else:
+                with mm:
+                    start = _findline(mm, b'Symbol Table')
+                    data = b'' if start is None else mm[start:]
+        lines = AxSymTab._symtab_lines(
+            data.decode('ascii', errors='replace').splitlines())
+        return AxSymTab._fromlines(*lines)
 
     @staticmethod
     def readsymtabstream(stream):
@@ -141,7 +221,10 @@ class AxSymTab(SymTab):
             To patch relocatable values to their proper locations
             based on a .map file, use `relocate()`.
         '''
-        symlines, arealines = AxSymTab.symtab_lines(stream)
+        return AxSymTab._fromlines(*AxSymTab.symtab_lines(stream))
+
+    @staticmethod
+    def _fromlines(symlines, arealines):
         if len(symlines) == 0:
             return None
 
@@ -156,7 +239,7 @@ class AxSymTab(SymTab):
     HEADERLINE = re.compile(r'.?ASxxxx Assembler')
 
     @staticmethod
-    def symtab_lines(bytestream):
+    def symtab_lines(stream):
         ''' From the stream return a pair of arrays, one with the
             symbol table entry lines and one with the area table entry
             lines. All header lines and lines before the symbol table
@@ -171,37 +254,39 @@ class AxSymTab(SymTab):
             XXX This should also read the 'Hexadecimal [16-bits]' or
             other radix information from the header and return it.
         '''
-        f = bytestream
+        text = stream.read()
+        start = _findline(text, 'Symbol Table')
+        if start is None:
+            return [], []
+        return AxSymTab._symtab_lines(text[start:].splitlines())
+
+    @staticmethod
+    def _symtab_lines(lines):
+        ''' As `symtab_lines()`, given a list of lines without line
+            terminators starting with the ``Symbol Table`` line.
+        '''
         symlines = []; arealines = []
-        while True:
-            line = f.readline()
-            if line == '': return symlines, arealines   # EOF
-            if line.strip() == 'Symbol Table': break    # reached Symbol Table
-        while True:
-            line = f.readline()
-            if line == '': break                        # EOF
-            if line == '\n': continue                   # blank line
+        header = AxSymTab.HEADERLINE.match
+        lines = iter(lines[1:])
+        for line in lines:
+            if line == '': continue                     # blank line
             if line.strip() == 'Area Table': break      # end of symbol table
-            if AxSymTab.HEADERLINE.match(line):
-                f.readline()                            # skip 2nd header line
+            if header(line):
+                next(lines, None)                       # skip 2nd header line
+            elif '| ' not in line:
+                symlines.append(line.rstrip())
             else:
-                if '| ' not in line:
-                    symlines.append(line.rstrip())
-                else:
-                    #   Narrow format; split it
-                    left, right = line.split('| ')
-                    symlines.append(left.rstrip())
-                    symlines.append(right.rstrip())
-        while True:
-            line = f.readline()
-            if line == '': break                        # EOF
-            if line == '\n': continue                   # blank line
+                #   Narrow format; split it
+                left, right = line.split('| ')
+                symlines.append(left.rstrip())
+                symlines.append(right.rstrip())
+        for line in lines:
+            if line == '': continue                     # blank line
             if line[0] == '[': continue                 # CSEG/DSEG
-            if AxSymTab.HEADERLINE.match(line):
-                f.readline()                            # skip 2nd header line
+            if header(line):
+                next(lines, None)                       # skip 2nd header line
             else:
                 arealines.append(line.rstrip())
-
         return symlines, arealines
 
     @staticmethod
@@ -247,14 +332,18 @@ class AxSymTab(SymTab):
         '''
         if self.relocated:
             raise TypeError("Already relocated")
+        areanums = { a.name: a.number for a in self.areas }
+        byarea = {}
+        for sym in self.symbols.values():
+            byarea.setdefault(sym.section, []).append(sym)
         areas = map(AxSymTab.parse_maparealine,
             AxSymTab.mapfile_arealines(stream))
         for name, addr in areas:
             if addr == 0: continue      # No relocation to be done
-            areanum = self.areanamed(name).number
-            for name, sym in self.symbols.items():
-                if areanum == sym.section:
-                    self.symbols[name] = sym._replace(value=sym.value+addr)
+            if name not in areanums:
+                raise KeyError("Area named '{}' not found".format(name))
+            for sym in byarea.get(areanums[name], ()):
+                self.symbols[sym.name] = sym._replace(value=sym.value+addr)
         #   Even if we did no actual relocations, set this so that clients
         #   know relocation was done and no symbols needed to be updated.
         self.relocated = True
@@ -264,17 +353,12 @@ class AxSymTab(SymTab):
     @staticmethod
     def mapfile_arealines(stream):
         ''' Return a list of area lines from a map file. '''
-        areaheader = AxSymTab.MAPFILE_AREAHEADER
-        lines = []
-        while True:
-            line = stream.readline()
-            if line == '': return lines         # EOF
-            if areaheader.match(line):
-                stream.readline()               # skip delimiter line
-                lines.append(stream.readline())
-                #   There seems to be only ever one area line after
-                #   an area line header.
-        return lines
+        areaheader = AxSymTab.MAPFILE_AREAHEADER.match
+        lines = stream.read().splitlines(keepends=True)
+        #   There seems to be only ever one area line after an area line
+        #   header, following a delimiter line.
+        return [ lines[i+2] for i, line in enumerate(lines)
+            if areaheader(line) and i+2 < len(lines) ]
 
     @staticmethod
     def parse_maparealine(line):
@@ -1,4 +1,5 @@
-''' Generate `Intel HEX`_ format recorders from a `MemImage`.
+''' Generate `Intel HEX`_ format records from a `MemImage`, and parse
+    Intel HEX files into a `MemImage`.
 
     .. _Intel HEX: https://en.wikipedia.org/wiki/Intel_HEX
 '''
@@ -8,48 +9,161 @@ from    binary.memimage  import MemImage
 EOFREC = b':00000001FF'
 ' The Intel HEX end of file record. '
 
-def intelhex(mem:MemImage) -> [str]:
-    ''' Return a `[str]` of `Intel HEX`_ records of the data in `mem`.
+def intelhex(mem:MemImage) -> [bytes]:
+    ''' Return a `[bytes]` of `Intel HEX`_ records of the data in `mem`.
         The records will each contain 16 data bytes except for the
         last in any `MemImage.MemRecord` section which may contain less.
 
         No $01 (End of File) record will be generated; this allows you
         to concatenate other Intel HEX records to output of this.
 
-        No extensions (e.g., to support entry points) are currently
-        supported.
+        This is `iterhex()` with the default parameters; see that for
+        the handling of addresses above $FFFF.
 
-        This generates only type $00 records; addresses outside the
-        $0000-$FFFF will cause an exception to be thrown.
+        .. _Intel HEX: https://en.wikipedia.org/wiki/Intel_HEX
+    '''
+    return list(iterhex(mem))
+
+def iterhex(mem:MemImage, reclen=16, extended='linear'):
+    ''' Generate `Intel HEX`_ records of the data in `mem`, as `bytes`
+        without line terminators. Records are produced lazily, one
+        `MemImage.MemRecord` at a time, so output may be written as it
+        is generated.
+
+        Each data record holds up to `reclen` (1-255) data bytes; the
+        last record from any `MemImage.MemRecord`, or one ending at a
+        64K boundary, may hold fewer. Larger values produce fewer records
+        and thus less output, but not all loaders accept them.
+
+        Data at addresses above $FFFF are preceded by an extended address
+        record giving the upper bits of the address for following
+        records. With `extended` set to ``linear`` (the default) these
+        are type $04 records, allowing addresses up to $FFFFFFFF; with
+        ``segment`` they are type $02 records, allowing up to $FFFFF. A
+        `ValueError` is raised for data outside the allowed range.
+
+        As with `intelhex()`, no End of File record is generated.
 
         .. _Intel HEX: https://en.wikipedia.org/wiki/Intel_HEX
     '''
-    hexrecs = []
+    if not 1 <= reclen <= 0xFF:
+        raise ValueError(f'reclen must be 1-255: {reclen}')
+    if extended == 'linear':
+        rectype, limit, shift = 0x04, 0x100000000, 16
+    elif extended == 'segment':
+        rectype, limit, shift = 0x02, 0x100000, 4
+    else:
+        raise ValueError(f"extended must be 'linear' or 'segment': {extended!r}")
+
+    upper = 0
     for mrec in mem:
-        hexrecs.extend(_intelhexrecs(mrec))
-    return hexrecs
+        if mrec.addr + len(mrec.data) > limit:
+            raise ValueError(f'address ${mrec.addr:X} length'
+                f' ${len(mrec.data):X} out of range for {extended} addresses')
+        data = memoryview(bytes(mrec.data))
+        for addr, chunk in _chunks(mrec.addr, data, reclen):
+            if addr >> 16 != upper:
+                upper = addr >> 16
+                yield _record(0, rectype, (upper << 16 >> shift).to_bytes(2, 'big'))
+            yield _record(addr & 0xFFFF, 0x00, chunk)
+
+def _chunks(addr, data, reclen):
+    ''' Split `data` starting at `addr` into ``(addr, data)`` chunks of
+        at most `reclen` bytes that do not cross a 64K boundary.
+    '''
+    pos, end = 0, len(data)
+    while pos < end:
+        a = addr + pos
+        n = min(reclen, end - pos, 0x10000 - (a & 0xFFFF))
+        yield a, data[pos:pos+n]
+        pos += n
+
+def _record(addr, rectype, data) -> bytes:
+    ''' Return a complete Intel HEX record, less line terminator, with
+        the given 16-bit `addr`, `rectype` and `data`.
+    '''
+    head = bytes((len(data), addr >> 8, addr & 0xFF, rectype))
+    cksum = -(sum(head) + sum(data)) & 0xFF
+    return b':' + (head + data + bytes((cksum,))).hex().upper().encode('ASCII')
 
-def _intelhexrecs(mrec:MemImage.MemRecord) -> [str]:
+def _intelhexrecs(mrec:MemImage.MemRecord) -> [bytes]:
     ''' Produce a list of Intel HEX records from a `MemImage.MemRecord`.
         All records, except for perhaps the last, will be 16 bytes
         in length.
     '''
-    hexrecs = []
-    for i in range(0, len(mrec.data), 16):
-        rectype = 0x00
-        addr = mrec.addr + i
-        data = mrec.data[i:i+16]
-        record = [
-            len(data),
-            (addr & 0xFF00) >> 8, addr & 0x00FF,
-            rectype,
-            *data,
-            ]
-        record.append(_checksum(record))
-        hexrec = ':' + ''.join(f'{byte:02X}' for byte in record)
-        hexrecs.append(bytes(hexrec, encoding='ASCII'))
-    return hexrecs
+    data = memoryview(bytes(mrec.data))
+    return [ _record(addr & 0xFFFF, 0x00, chunk)
+        for addr, chunk in _chunks(mrec.addr, data, 16) ]
 
 def _checksum(ints:[int]):
-    sum8 = sum(ints) % 0x100
-    return (0x100 - sum8) % 0x100
+    return -sum(ints) & 0xFF
+
+####################################################################
+#   Parsing
+
+def parse_intelhex_fromfile(path):
+    ' Given the path to an Intel HEX file, run `parse_intelhex` on it. '
+    with open(path, 'rb') as stream:
+        return parse_intelhex(stream)
+
+def parse_intelhex(bytestream) -> MemImage:
+    ''' Parse a binary stream of `Intel HEX`_ records, returning a
+        `MemImage`. Adjacent data records are merged into a single
+        `MemImage.MemRecord`.
+
+        Extended segment ($02) and extended linear ($04) address records
+        are applied to the addresses of following data records. A start
+        segment ($03) or start linear ($05) address record sets the
+        image's entry point; for the former this is the 20-bit address
+        CS×16+IP. Parsing stops at the end of file ($01) record, if any.
+
+        A `ValueError` is raised for any malformed record or checksum
+        error.
+
+        .. _Intel HEX: https://en.wikipedia.org/wiki/Intel_HEX
+    '''
+    mi = MemImage()
+    mi.addchunks(_parse_intelhex_chunks(bytestream, mi))
+    return mi
+
+def _parse_intelhex_chunks(bytestream, mi):
+    ''' Generate ``(addr, data)`` for each data record in `bytestream`,
+        setting `mi.entrypoint` from any start address record.
+    '''
+    base = 0
+    for lineno, line in enumerate(bytestream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        def err(msg):
+            return ValueError(f'Intel HEX line {lineno}: {msg}: {line!r}')
+        if line[0] != 0x3A:     # ':'
+            raise err('no start code')
+        try:
+            rec = bytes.fromhex(line[1:].decode('ASCII'))
+        except ValueError:
+            raise err('bad hex digits') from None
+        if len(rec) < 5 or len(rec) != rec[0] + 5:
+            raise err('bad record length')
+        if sum(rec) & 0xFF:
+            raise err('bad checksum')
+        addr = rec[1] << 8 | rec[2]
+        rectype = rec[3]
+        data = rec[4:-1]
+        if rectype == 0x00:
+            if data:
+                yield base + addr, data
+        elif rectype == 0x01:
+            return
+        elif rectype == 0x02:
+            base = int.from_bytes(data, 'big') << 4
+        elif rectype == 0x04:
+            base = int.from_bytes(data, 'big') << 16
+        elif rectype == 0x03:
+            cs = int.from_bytes(data[0:2], 'big')
+            ip = int.from_bytes(data[2:4], 'big')
+            mi.entrypoint = cs * 16 + ip
+        elif rectype == 0x05:
+            mi.entrypoint = int.from_bytes(data, 'big')
+        else:
+            raise err(f'unknown record type ${rectype:02X}')
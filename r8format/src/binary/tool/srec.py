@@ -0,0 +1,68 @@
+''' binary.tool.srec - Parse Motorola `S-record`_ files.
+
+    S-records are the usual format for ROM images and monitor downloads
+    on Motorola and many other systems. All of the S19 (16-bit address),
+    S28 (24-bit) and S37 (32-bit) variants are read.
+
+    .. _S-record: https://en.wikipedia.org/wiki/SREC_(file_format)
+'''
+
+from    binary.memimage  import MemImage
+
+####################################################################
+
+#   Number of address bytes for each record type. S4 is reserved.
+ADDRLEN = { 0: 2, 1: 2, 2: 3, 3: 4, 5: 2, 6: 3, 7: 4, 8: 3, 9: 2 }
+
+def parse_srec_fromfile(path):
+    ' Given the path to an S-record file, run `parse_srec` on it. '
+    with open(path, 'rb') as stream:
+        return parse_srec(stream)
+
+def parse_srec(bytestream) -> MemImage:
+    ''' Parse a binary stream of S-records, returning a `MemImage`.
+        Adjacent data records are merged into a single
+        `MemImage.MemRecord`.
+
+        Data comes from S1, S2 and S3 records, and the entry point is set
+        from an S7, S8 or S9 termination record. The S0 header and S5/S6
+        record count records are checked but otherwise ignored.
+
+        A `ValueError` is raised for any malformed record or checksum
+        error.
+    '''
+    mi = MemImage()
+    mi.addchunks(_parse_srec_chunks(bytestream, mi))
+    return mi
+
+def _parse_srec_chunks(bytestream, mi):
+    ''' Generate ``(addr, data)`` for each data record in `bytestream`,
+        setting `mi.entrypoint` from any termination record.
+    '''
+    for lineno, line in enumerate(bytestream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        def err(msg):
+            return ValueError(f'S-record line {lineno}: {msg}: {line!r}')
+        if line[0] != 0x53:     # 'S'
+            raise err('no start code')
+        rectype = line[1] - 0x30
+        if rectype not in ADDRLEN:
+            raise err('bad record type')
+        try:
+            rec = bytes.fromhex(line[2:].decode('ASCII'))
+        except ValueError:
+            raise err('bad hex digits') from None
+        alen = ADDRLEN[rectype]
+        if len(rec) < alen + 2 or len(rec) != rec[0] + 1:
+            raise err('bad record length')
+        if sum(rec) & 0xFF != 0xFF:
+            raise err('bad checksum')
+        addr = int.from_bytes(rec[1:1+alen], 'big')
+        if 1 <= rectype <= 3:
+            data = rec[1+alen:-1]
+            if data:
+                yield addr, data
+        elif rectype >= 7:
+            mi.entrypoint = addr
@@ -1,3 +1,24 @@
+''' Analysis of the pulses in tape recordings of unknown format.
+
+    `window_pulses()` reads the pulses from any part of a WAV recording
+    as a stream, and `PulseWidths` accumulates their widths as a
+    histogram (exact, but taking space only for each distinct width) and
+    a compact array. From these, `find_peaks()` finds the common pulse
+    widths and `infer_encoding()` the mark and space frequencies, pulses
+    per bit and suitable `PulseDecoder` tolerances. `baud_stats()` and
+    `run_lengths()` give the statistics for ``analyze-cmt -r`` and ``-l``.
+
+    These are vectorized with NumPy when it is available.
+'''
+
+from    array  import array
+from    collections  import Counter, namedtuple
+from    itertools  import groupby
+import  math
+
+from    cmtconv.audio  import SampleStats, pulses_from_chunks, \
+    filter_clicks, click_tol, wav_chunks, numpy
+
 def baud_rates(baud):
     res = []
     b = baud
@@ -10,3 +31,312 @@ def baud_rates(baud):
         res.append(int(b))
         b = b * 2
     return res
+
+####################################################################
+#   Reading pulses
+
+def window_pulses(w, grad_factor=0.5, start=0, end=None):
+    ''' Generate click-filtered `Pulses` from edge detection on sample
+        frames `start` to `end` (default: the end of the recording) of
+        seekable `wave.Wave_read` `w`, using sample statistics from that
+        part of the recording only. The pulse times are relative to
+        frame `start`. `start` and `end` are limited to the length of the
+        recording.
+    '''
+    sample_dur = 1.0 / w.getframerate()
+    start = min(start, w.getnframes())
+    if end is not None:
+        end = min(end, w.getnframes())
+    limit = None if end is None else max(0, end - start)
+    st = SampleStats()
+    w.setpos(start)
+    for chunk in wav_chunks(w, limit=limit):
+        st.add(chunk)
+    if st.n < 2:
+        return
+    (mean, stdev) = st.stats()
+    w.setpos(start)
+    tol = click_tol(sample_dur)
+    for pulses in pulses_from_chunks(wav_chunks(w, limit=limit), sample_dur,
+            mean, stdev, grad_factor):
+        yield filter_clicks(pulses, sample_dur, tol)
+
+####################################################################
+#   Pulse widths
+
+class PulseWidths:
+    ''' The widths, in samples each `sample_dur` seconds long, of the
+        pulses in the `Pulses` passed to `add()`: `counts` is a `Counter`
+        of the number of pulses of each width, and `widths` the widths in
+        order, limited to `MAX_WIDTH`, taking two bytes per pulse.
+    '''
+
+    MAX_WIDTH = 0xFFFF
+
+    def __init__(self, sample_dur):
+        self.sample_dur = sample_dur
+        self.counts = Counter()
+        self.widths = array('H')
+
+    @classmethod
+    def of(cls, chunks, sample_dur):
+        ' Return a `PulseWidths` of the `Pulses` in iterable `chunks`. '
+        pw = cls(sample_dur)
+        for pulses in chunks:
+            pw.add(pulses)
+        return pw
+
+    def __len__(self):
+        return len(self.widths)
+
+    def add(self, pulses):
+        ' Add the widths of `Pulses` `pulses`. '
+        if len(pulses) == 0:
+            return
+        if numpy is not None:
+            w = pulses.view(pulses.widths)
+            values, counts = numpy.unique(w, return_counts=True)
+            self.counts.update(dict(zip(values.tolist(), counts.tolist())))
+            self.widths.frombytes(numpy.minimum(w, self.MAX_WIDTH)
+                .astype(self.widths.typecode).tobytes())
+        else:
+            self.counts.update(pulses.widths)
+            self.widths.extend( min(w, self.MAX_WIDTH)
+                for w in pulses.widths )
+
+Peak = namedtuple('Peak', 'width count lower upper')
+Peak.__doc__ = \
+    ''' A peak in a histogram of pulse widths, in samples: `width` is the
+        mean width of the `count` pulses around the peak, and `lower` and
+        `upper` the range of widths in which all but `PEAK_OUTLIERS` of
+        them lie.
+    '''
+
+PEAK_OUTLIERS = 0.005
+MAX_PEAK_WIDTH = 4096
+
+SMOOTHING = 1 / 44100
+''' The width in seconds over which `find_peaks()` smooths each side of
+    each pulse width in the histogram (see `smoothing()`).
+'''
+
+def smoothing(sample_dur):
+    ''' Return the number of widths on each side of each width over which
+        `find_peaks()` should smooth a histogram of pulse widths at sample
+        duration `sample_dur`. This is one at 44.1 kHz and none at lower
+        sample rates, where the pulses are only a few samples wide and
+        adjacent widths may belong to different peaks.
+    '''
+    return int(SMOOTHING / sample_dur + 1e-6)
+
+def find_peaks(counts, min_fraction=0.02, max_width=MAX_PEAK_WIDTH,
+        smooth=1):
+    ''' Return the `Peak`s, in order of width, in the histogram `counts`,
+        a mapping of pulse width to number of pulses, that have at least
+        `min_fraction` of the pulses no wider than `max_width`.
+
+        The histogram is smoothed over `smooth` widths either side of each
+        width (see `smoothing()`), so that a width falling between two
+        whole numbers of samples gives a single peak. Each peak extends
+        down to the minima on either side.
+    '''
+    n = max(( w for w in counts if w <= max_width ), default=0) + 2
+    hist = [0] * (n + 1)
+    for w, c in counts.items():
+        if w <= max_width:
+            hist[w] = c
+    total = sum(hist)
+    if total == 0:
+        return []
+    s = [ sum(hist[max(i-smooth, 0):i+smooth+1]) for i in range(n + 1) ]
+    peaks = []
+    i = 1
+    while i < n:
+        if s[i] > s[i-1] and s[i] >= s[i+1]:
+            top = i
+            while i < n and s[i+1] == s[top]:   # plateau
+                i += 1
+            lo, hi = top, i
+            while lo > 0 and 0 < s[lo-1] <= s[lo]:
+                lo -= 1
+            while hi < n and 0 < s[hi+1] <= s[hi]:
+                hi += 1
+            if peaks and lo <= peaks[-1][1]:
+                lo = peaks[-1][1] + 1
+            peaks.append((lo, hi))
+        i += 1
+    result = []
+    for lo, hi in peaks:
+        region = hist[lo:hi+1]
+        count = sum(region)
+        if count < min_fraction * total:
+            continue
+        mean = sum( (lo + k) * c for k, c in enumerate(region) ) / count
+        out = PEAK_OUTLIERS * count / 2
+        acc, lower, upper = 0, lo, hi
+        for k, c in enumerate(region):
+            acc += c
+            if acc > out:
+                lower = lo + k
+                break
+        acc = 0
+        for k, c in reversed(list(enumerate(region))):
+            acc += c
+            if acc > out:
+                upper = lo + k
+                break
+        result.append(Peak(mean, count, lower, upper))
+    return result
+
+def run_lengths(widths, lower, upper):
+    ''' Return a `Counter` of the lengths of the runs of consecutive
+        widths in `widths` that are within `lower` to `upper` inclusive.
+    '''
+    if numpy is not None:
+        w = numpy.frombuffer(widths, dtype=widths.typecode) \
+            if isinstance(widths, array) else numpy.asarray(widths)
+        inside = numpy.concatenate(([0],
+            ((w >= lower) & (w <= upper)).astype(numpy.int8), [0]))
+        edges = numpy.flatnonzero(numpy.diff(inside))
+        lengths = edges[1::2] - edges[0::2]
+        values, counts = numpy.unique(lengths, return_counts=True)
+        return Counter(dict(zip(values.tolist(), counts.tolist())))
+    return Counter( len(list(g))
+        for k, g in groupby(widths, lambda w: lower <= w <= upper) if k )
+
+####################################################################
+#   Baud rates
+
+def bucket_limits(bauds, tol):
+    ''' Return ``(baud, lower, upper)`` for each of `bauds`, giving the
+        range of pulse widths in seconds accepted for that baud rate with
+        tolerance `tol`, as `cmtconv.audio.PulseDecoder` calculates it.
+    '''
+    return [ (b, (1.0 + math.log(1.0 - tol)) * 0.5/b,
+        (1.0 + math.log(1.0 + tol)) * 0.5/b) for b in bauds ]
+
+def baud_stats(counts, sample_dur, bauds, tol):
+    ''' Classify the pulse widths in histogram `counts` (see `PulseWidths`)
+        by the baud rates `bauds` they fit with tolerance `tol`, trying
+        the highest rates first. Return a `dict` of ``(count, mean,
+        stdev)`` (in seconds, `None` if there are too few pulses) for each
+        baud rate and for the pulses ``low`` and ``high`` below and above
+        all of them and ``unknown`` between them.
+    '''
+    durs = bucket_limits(sorted(bauds, reverse=True), tol)
+    buckets = dict( (b, Counter()) for b in bauds )
+    for k in ('low', 'high', 'unknown'):
+        buckets[k] = Counter()
+    for w, c in counts.items():
+        dur = w * sample_dur
+        if dur < durs[0][1]:
+            key = 'low'
+        elif dur > durs[-1][2]:
+            key = 'high'
+        else:
+            key = next(( b for (b, l, h) in durs if l <= dur <= h ),
+                'unknown')
+        buckets[key][w] += c
+
+    def stats(hist):
+        n = sum(hist.values())
+        if n == 0:
+            return (0, None, None)
+        mean = sum( w * c for w, c in hist.items() ) / n
+        if n == 1:
+            return (n, mean * sample_dur, None)
+        var = sum( (w - mean)**2 * c for w, c in hist.items() ) / (n - 1)
+        return (n, mean * sample_dur, math.sqrt(var) * sample_dur)
+    return { k: stats(hist) for k, hist in buckets.items() }
+
+def nominal_bauds(widths, sample_dur, bases=(1200, 1100), tol=0.08):
+    ''' Return the standard baud rates of pulses of mean widths `widths`,
+        in samples each `sample_dur` seconds long: power of two multiples
+        of whichever of `bases` fits all of them best. A baud rate fits a
+        width if its nominal pulse width is within `tol` of it, plus half
+        a sample for the rounding of pulse widths to whole samples (at
+        low sample rates, much the larger error). If no base fits, the
+        frequencies of the widths are returned, rounded.
+    '''
+    def error(w, b):
+        nominal = 0.5 / (b * sample_dur)
+        return abs(nominal - w) / (0.5 + tol * nominal)
+    best = None
+    for base in bases:
+        bauds = [ min(baud_rates(base), key=lambda b: error(w, b))
+            for w in widths ]
+        e = max( error(w, b) for w, b in zip(widths, bauds) )
+        if e <= 1 and (best is None or e < best[0]):
+            best = (e, bauds)
+    if best is None:
+        return [ round(0.5 / (w * sample_dur)) for w in widths ]
+    return best[1]
+
+Encoding = namedtuple('Encoding', 'mark_baud mark_pulses space_baud'
+    ' space_pulses mark_tol space_tol mark space')
+Encoding.__doc__ = \
+    ''' Parameters for a `cmtconv.audio.PulseDecoder` inferred from pulse
+        widths by `infer_encoding()`, along with the `Peak`s for the mark
+        and space pulses.
+    '''
+
+def _tolerances(peak, nominal, limit):
+    ''' Return the ``(lower, upper)`` `PulseDecoder` tolerances for
+        widths `nominal` samples wide that accept all the widths of
+        `peak` with a margin of 10% (at least one sample) each side, but
+        none beyond `limit`, the ``(lower, upper)`` widths between this
+        and the neighbouring peaks.
+    '''
+    margin = max(1, 0.1 * nominal)
+    lower = max(peak.lower - margin, limit[0])
+    upper = min(peak.upper + margin, limit[1])
+    lo = 1 - math.exp(lower / nominal - 1) if lower > 0 else 0.9
+    hi = math.exp(upper / nominal - 1) - 1
+    #   Rounded up, so that the decoder accepts all of `lower` to `upper`.
+    def up(x):  return math.ceil(x * 100 + 1e-6) / 100
+    return (min(up(max(lo, 0.05)), 0.9), up(max(hi, 0.05)))
+
+COMMON_RUNS = 0.1
+''' Runs of pulses of one width are taken by `infer_encoding()` to be
+    whole bits if there are at least this fraction as many of them as of
+    the most common length of run.
+'''
+
+def infer_encoding(pw):
+    ''' Infer the encoding of the pulses in `PulseWidths` `pw`, returning
+        an `Encoding`. Raises `ValueError` if there are not at least two
+        peaks in the histogram of pulse widths.
+
+        The two largest peaks are taken to be the mark and space pulses,
+        the shorter (higher frequency) being the mark. The frequencies are
+        given as baud rates (`PulseDecoder`'s convention, the reciprocal
+        of the length of two pulses), rounded to standard rates if close
+        enough (see `nominal_bauds()`). The number of pulses per bit for
+        each is the shortest common length of the runs of them (see
+        `COMMON_RUNS`): every run is a whole number of bits, and some are
+        of a single bit. (The most common length need not be, e.g. on
+        JR-200 tapes, where data and headers have different bit rates.)
+    '''
+    peaks = find_peaks(pw.counts, smooth=smoothing(pw.sample_dur))
+    if len(peaks) < 2:
+        raise ValueError('found {} pulse width peak(s); need two'
+            .format(len(peaks)))
+    mark, space = sorted(sorted(peaks, key=lambda p: p.count)[-2:])
+    middle = (mark.upper + space.lower) / 2
+    sd = pw.sample_dur
+    mark_baud, space_baud = nominal_bauds((mark.width, space.width), sd)
+
+    def pulses_per_bit(peak):
+        runs = run_lengths(pw.widths, peak.lower, peak.upper)
+        if not runs:
+            return 1
+        common = COMMON_RUNS * max(runs.values())
+        return min( n for n, c in runs.items() if c >= common )
+
+    mark_pulses, space_pulses = pulses_per_bit(mark), pulses_per_bit(space)
+    mark_tol = _tolerances(mark, 0.5 / mark_baud / sd,
+        (mark.width / 2, math.floor(middle)))
+    space_tol = _tolerances(space, 0.5 / space_baud / sd,
+        (math.ceil(middle), space.width * 4))
+    return Encoding(mark_baud, mark_pulses, space_baud, space_pulses,
+        mark_tol, space_tol, mark, space)
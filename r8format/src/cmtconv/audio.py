@@ -2,14 +2,23 @@
 '''
 
 from    enum  import Enum
-from    itertools  import chain
+from    array  import array
+from    itertools  import chain, compress, islice
 from    collections  import namedtuple
 from    enum  import IntEnum
-import  math
+from    fractions  import Fraction
+import  math, sys
 
 from    binary.memimage  import MemImage
 from    cmtconv.logging  import *
 
+try:
+    import  numpy
+except ModuleNotFoundError:
+    #   NumPy is optional; without it we use the (much slower) pure
+    #   Python implementations of the sample-level functions below.
+    numpy = None
+
 class ReadError(Exception):
     pass
 
@@ -26,54 +35,230 @@ class ReadError(Exception):
 # - bits -> bytes
 # - bytes -> file header, blocks
 
-def merge_mids(pulses, sample_dur):
-    res = []
-    i = 0
-    # FIXME: Would be better to do this in terms of integer indices
-    for (t, l, dur) in pulses:
-        # Merge short periods of mid level with previous pulse
-        if l == 0 and dur < 8 * sample_dur:
-            pass
-        else:
-            res.append( (t, l, dur) )
-    return res
+####################################################################
+#   Pulses
+
+def _array(typecode, values):
+    ' Return an `array` of `values`, which may be a NumPy array. '
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        a = array(typecode)
+        a.frombytes(values.astype(typecode).tobytes())
+        return a
+    return array(typecode, values)
+
+class Pulses:
+    ''' A sequence of pulses stored as parallel arrays of integers, in
+        units of samples each `sample_dur` seconds long:
+        - `ends`: the sample offset of the end of each pulse.
+        - `levels`: the level (-1, 0 or 1) of each pulse.
+        - `widths`: the length of each pulse in samples.
+
+        This takes 9 bytes per pulse, rather than the 200 or so of a
+        tuple of Python numbers, and pulses can be filtered with a mask
+        of the whole sequence (`select()`) rather than one at a time.
+
+        For compatibility with code using sequences of ``(time, level,
+        duration)`` tuples, indexing (and iteration) returns a tuple of
+        the end time and duration of the pulse in seconds; slicing
+        returns a `Pulses`. `width()` returns just the width in samples.
+    '''
+
+    def __init__(self, sample_dur, ends=(), levels=(), widths=()):
+        self.sample_dur = sample_dur
+        self.ends   = _array('I', ends)
+        self.levels = _array('b', levels)
+        self.widths = _array('I', widths)
+
+    @classmethod
+    def of(cls, pulses, sample_dur):
+        ''' Return `pulses` if it is a `Pulses`, otherwise a new `Pulses`
+            of the ``(time, level, duration)`` tuples in `pulses`, with
+            the times rounded to whole samples.
+        '''
+        if isinstance(pulses, cls):
+            return pulses
+        ps = cls(sample_dur)
+        for (t, l, dur) in pulses:
+            ps.append(round(t / sample_dur), l, round(dur / sample_dur))
+        return ps
+
+    def __len__(self):
+        return len(self.widths)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return Pulses(self.sample_dur,
+                self.ends[i], self.levels[i], self.widths[i])
+        sd = self.sample_dur
+        return (sd * self.ends[i], self.levels[i], sd * self.widths[i])
+
+    def __iter__(self):
+        sd = self.sample_dur
+        for end, level, width in zip(self.ends, self.levels, self.widths):
+            yield (sd * end, level, sd * width)
+
+    def __eq__(self, other):
+        if not isinstance(other, Pulses):
+            return NotImplemented
+        return (self.sample_dur, self.ends, self.levels, self.widths) \
+            == (other.sample_dur, other.ends, other.levels, other.widths)
+
+    def __repr__(self):
+        return 'Pulses({}, {})'.format(self.sample_dur, list(self))
+
+    def width(self, i):
+        ' The width of pulse `i` in samples. '
+        return self.widths[i]
+
+    def append(self, end, level, width):
+        self.ends.append(end); self.levels.append(level)
+        self.widths.append(width)
+
+    def extend(self, other):
+        ' Append the pulses from `Pulses` `other`. '
+        self.ends.extend(other.ends); self.levels.extend(other.levels)
+        self.widths.extend(other.widths)
+
+    def __delitem__(self, i):
+        del self.ends[i], self.levels[i], self.widths[i]
 
+    def select(self, mask):
+        ''' Return a new `Pulses` of the pulses for which the corresponding
+            item of sequence `mask` is true. `mask` may be a NumPy boolean
+            array (see `view()`).
+        '''
+        if numpy is not None:
+            mask = numpy.asarray(mask, dtype=bool)
+            return Pulses(self.sample_dur, *( self.view(a)[mask]
+                for a in (self.ends, self.levels, self.widths) ))
+        return Pulses(self.sample_dur, *( compress(a, mask)
+            for a in (self.ends, self.levels, self.widths) ))
+
+    @staticmethod
+    def view(a):
+        ' Return a NumPy array view of `array` `a`. '
+        return numpy.frombuffer(a, dtype=a.typecode) if len(a) \
+            else numpy.zeros(0, dtype=a.typecode)
+
+def merge_mids(pulses, sample_dur):
+    ' Merge short periods of mid level with previous pulse '
+    # FIXME: not merged, just removed
+    pulses = Pulses.of(pulses, sample_dur)
+    if numpy is not None:
+        mask = (Pulses.view(pulses.levels) != 0) \
+            | (Pulses.view(pulses.widths) >= 8)
+    else:
+        mask = [ l != 0 or w >= 8
+            for l, w in zip(pulses.levels, pulses.widths) ]
+    return pulses.select(mask)
 
 def filter_clicks(pulses, sample_dur, tol = 4):
-    res = []
-    i = 0
-    # FIXME: Would be better to do this in terms of integer indices
-    for (t, l, dur) in pulses:
-        if dur < tol * sample_dur:
-            # FIXME: should maybe modify previous/next pulse
-            pass
-        else:
-            res.append( (t, l, dur) )
-    return res
+    ' Return `Pulses` with those shorter than `tol` samples removed. '
+    # FIXME: should maybe modify previous/next pulse
+    pulses = Pulses.of(pulses, sample_dur)
+    if numpy is not None:
+        mask = Pulses.view(pulses.widths) >= tol
+    else:
+        mask = [ w >= tol for w in pulses.widths ]
+    return pulses.select(mask)
 
+CLICK_WIDTH = 4 / 44100
+' Width in seconds of the longest pulse that `click_tol()` treats as a click. '
+
+def click_tol(sample_dur, width=CLICK_WIDTH):
+    ''' Return the `tol` for `filter_clicks()` that removes pulses shorter
+        than `width` seconds at sample duration `sample_dur`. (At lower
+        sample rates the shortest pulses of some platforms are only two
+        samples long, so a fixed number of samples will not do.)
+    '''
+    return max(1, round(width / sample_dur))
+
+def iter_filter_clicks(chunks, sample_dur, tol = 4):
+    ' Generate each `Pulses` chunk from `chunks` with `filter_clicks()`. '
+    for chunk in chunks:
+        yield filter_clicks(chunk, sample_dur, tol)
+
+
+def _asarray(samples):
+    ''' Return `samples` as a NumPy array; `bytes` are unsigned 8-bit samples
+        and a `memoryview` has the type of its format.
+    '''
+    if isinstance(samples, memoryview):
+        return numpy.frombuffer(samples, dtype=samples.format)
+    if isinstance(samples, (bytes, bytearray)):
+        return numpy.frombuffer(samples, dtype=numpy.uint8)
+    return numpy.asarray(samples)
 
 #
-# statistics.mean and statistics.stdev{p} are accureate but slow
-# so we do a simple two-pass population stdev calc and combine with mean
+# statistics.mean and statistics.stdev{p} are accurate but slow, so we
+# calculate the population stdev from the sum and the sum of squares.
+# For integer samples (the usual case) these are exact, so the result is
+# the same whether or not NumPy is used, and whether the samples are
+# processed all at once or in chunks (see `SampleStats`). The stdev may
+# differ in the last place from that of the two-pass formula
+# ``sqrt(sum((x - mean)**2) / n)``; `EdgeDetector` compares integer
+# samples exactly with the thresholds derived from it.
 #
+def _sums(samples):
+    ' Return the sum and the sum of squares of `samples`. '
+    if numpy is not None:
+        a = _asarray(samples)
+        if a.dtype.kind in 'ui':
+            a = a.astype(numpy.int64)
+            return int(a.sum()), int(numpy.dot(a, a))
+        return float(a.sum()), float(numpy.dot(a, a))
+    return sum(samples), sum( x * x for x in samples )
+
+def _meanstdev(n, s1, s2):
+    var = (n * s2 - s1 * s1) / (n * n)
+    return (s1 / n, math.sqrt(max(var, 0)))
+
 def stats(samples):
     n=len(samples)
     if n == 0:
         return (None, None)
     elif n == 1:
         return (samples[0], None)
-    else:
-        mean = sum(samples)/n
-        ss = sum( (x - mean) ** 2 for x in samples )
-        return (mean, math.sqrt(ss / n))
+    return _meanstdev(n, *_sums(samples))
+
+class SampleStats:
+    ''' Running statistics of samples added a chunk at a time with `add()`.
+        `stats()` gives the same result as `stats()` on all the samples
+        added so far.
+    '''
+    def __init__(self):
+        self.n = 0; self.s1 = 0; self.s2 = 0
+        self.min = None; self.max = None
+
+    def add(self, samples):
+        if len(samples) == 0:
+            return
+        s1, s2 = _sums(samples)
+        self.n += len(samples); self.s1 += s1; self.s2 += s2
+        if numpy is not None:
+            a = _asarray(samples)
+            lo, hi = a.min().item(), a.max().item()
+        else:
+            lo, hi = min(samples), max(samples)
+        if self.min is None or lo < self.min:   self.min = lo
+        if self.max is None or hi > self.max:   self.max = hi
+
+    def stats(self):
+        if self.n < 2:
+            return (None, None) if self.n == 0 else (self.min, None)
+        return _meanstdev(self.n, self.s1, self.s2)
 
 
 # samples   : [ float ]
 # ->
 # pulses    : ( (float, int, float) )
 #
+# An edge is a run of consecutive sample-to-sample differences all of at
+# least `grad_factor` standard deviations and of the same sign; each edge
+# ends the current pulse at the midpoint of the edge. The pulse's level
+# is taken from the sample at the pulse's midpoint.
+#
 def samples_to_pulses_via_edge_detection(samples, sample_dur, grad_factor=0.5):
-    res=[]
     n = len(samples)
     if n > 1:
         v2("edge detection, starting stats calc...")
@@ -84,62 +269,441 @@ def samples_to_pulses_via_edge_detection(samples, sample_dur, grad_factor=0.5):
         v2("edge detection: mean = {:5.3f}, stdev = {:5.3f}"
            .format(sample_mean, sample_stdev))
 
+        ed = EdgeDetector(sample_dur, sample_mean, sample_stdev, grad_factor)
+        res = ed.feed(samples)
+        res.extend(ed.finish())
+        v2("edge detection: done, found {} edges".format(len(res)))
+        v2( "first pulses: {}" .format(list(res[:10])))
+        v2( "last pulses: {}" .format(list(res[-10:])))
+        return res
+    else:
+        return Pulses(sample_dur)
+
+class EdgeDetector:
+    ''' Incremental edge detection as for
+        `samples_to_pulses_via_edge_detection()`.
+
+        Successive chunks of samples are passed to `feed()`, which returns
+        `Pulses` ended by the edges found so far, and after the last
+        chunk `finish()` returns the remaining pulses. The
+        pulses are exactly the same as those from detecting the edges in
+        all the samples at once, however the samples are chunked.
+
+        Since the sample mean and standard deviation that set the level
+        and gradient thresholds are needed before the first edge can be
+        found, they are passed in; see `SampleStats`.
+
+        Only the samples since the end of the last pulse are kept between
+        chunks (the level of a pulse is taken from its midpoint, which
+        is not known until the pulse ends), so memory use is proportional
+        to the longest pulse, not to the length of the input. An edge that
+        reaches the end of a chunk is not processed until the next chunk
+        shows where it ends.
+
+        NumPy is used if available, except when `grad` is 0 (no variation
+        at all in the samples) where every difference is an "edge."
+
+        Integer samples (the usual case) are compared with integer
+        thresholds equivalent to the exact values of ``grad_factor *
+        stdev`` and ``mean ± stdev/2``, so rounding in computing the
+        thresholds cannot move a sample or difference across one.
+    '''
+
+    def __init__(self, sample_dur, mean, stdev, grad_factor=0.5):
+        self.sample_dur = sample_dur
         # Note, working absolute values are as follows:
         # 10 for FM-7, JR-200, PC-8001
         # 32 for MB-6885
-        grad=grad_factor * sample_stdev
-
-        i=1
-        prev=0
-        lvl=0
-        v2("edge detection: required gradient={:5.3f} ...".format(grad))
-        while i<n:
-            d = samples[i] - samples[i-1]
+        self.grad = grad_factor * stdev
+        self.low  = mean - 0.5 * stdev
+        self.high = mean + 0.5 * stdev
+        v2("edge detection: required gradient={:5.3f} ...".format(self.grad))
+        #   For integer d and x, abs(d) < g iff abs(d) < ceil(g),
+        #   x < l iff x < ceil(l) and x > h iff x > floor(h).
+        g = Fraction(grad_factor) * Fraction(stdev)
+        m, h = Fraction(mean), Fraction(stdev) / 2
+        self.int_thresholds = (math.ceil(g), math.ceil(m - h),
+            math.floor(m + h))
+        self.numpy = numpy is not None and self.grad > 0
+        self.integer = None     # samples are integers; set by `_append()`
+        self.buf = None         # samples from index `prev` onward
+        self.base = 0           # sample index of buf[0]
+        self.prev = 0           # sample index of end of last pulse
+        self.next = 1           # sample index from which to look for edges
+        self.edges = 0          # number of pulses returned so far
+
+    def feed(self, samples):
+        ''' Add `samples` (a chunk of the input) and return `Pulses` of
+            the pulses ended by the edges found.
+        '''
+        self._append(samples)
+        n = len(self.buf)
+        if self.base + n < 2:
+            return Pulses(self.sample_dur)
+        i0, e = self._runs(self.next - self.base)
+        #   An edge ending at or beyond the last sample we have may
+        #   continue into the next chunk, and an edge ending at the last
+        #   sample of the input stops detection, so neither can be
+        #   processed until we see more.
+        k = len(e)
+        while k and e[k-1] >= n - 1:
+            k -= 1
+        self.next = self.base + (i0[k] if k < len(e) else n)
+        return self._pulses(i0[:k], e[:k])
+
+    def finish(self):
+        ' Return the remaining pulses, after the last `feed()`. '
+        if self.buf is None or self.base + len(self.buf) < 2:
+            return Pulses(self.sample_dur)
+        n = len(self.buf)
+        total = self.base + n
+        i0, e = self._runs(self.next - self.base)
+        #   The last possible edge end is n-1, and we stop after the first
+        #   edge that reaches it.
+        end = total
+        stop = next(( k for k, x in enumerate(e) if x >= n - 1 ), None)
+        if stop is not None:
+            i0, e = i0[:stop+1], list(e[:stop]) + [n - 1]
+            end = total - 1
+        res = self._pulses(i0, e)
+        # deal with final pulse
+        mid = (end + self.prev) // 2
+        res.append(total, self._level(self.buf[mid - self.base]),
+            total - self.prev)
+        self.buf = self.buf[len(self.buf):]
+        self.base = self.prev = self.next = total
+        self.edges += 1
+        return res
+
+    def _level(self, x):
+        if x > self.high:   return 1
+        elif x < self.low:  return -1
+        else:               return 0
+
+    def _append(self, samples):
+        if self.integer is None and len(samples):
+            if self.numpy:
+                self.integer = _asarray(samples).dtype.kind in 'ui'
+            else:
+                self.integer = isinstance(samples[0], int)
+            if self.integer:
+                (self.grad, self.low, self.high) = self.int_thresholds
+        if self.numpy:
+            a = _asarray(samples)
+            if a.dtype.kind in 'ui':
+                #   Differences of narrow types would overflow.
+                a = a.astype(numpy.int16 if a.dtype.itemsize == 1
+                    else numpy.int64)
+            self.buf = a if self.buf is None \
+                else numpy.concatenate((self.buf, a))
+        else:
+            self.buf = list(samples) if self.buf is None \
+                else self.buf + list(samples)
+
+    def _runs(self, start):
+        ''' Return the start and end (exclusive) indices in `buf` of the
+            edges in the samples from `start` onward. An edge end of
+            ``len(buf)`` means that the edge continues to the last sample.
+        '''
+        if self.numpy:
+            return self._runs_numpy(start)
+        else:
+            return self._runs_python(start)
+
+    def _runs_python(self, start):
+        buf, grad = self.buf, self.grad
+        n = len(buf)
+        starts, ends = [], []
+        i = start
+        while i < n:
+            d = buf[i] - buf[i-1]
             if abs(d) < grad:
                 i += 1
-            else:
-                i0=i
-                # roll forward
-                d0=d
-                # i += 1
-                # d = samples[i] - samples[i-1]
-                while abs(d) >= grad and math.copysign(d,d0) == d and i<n-1:
-                    i += 1
-                    d = samples[i] - samples[i-1]
-                # mark mid point
-                idx = int((i+i0)/2)
-                t0=sample_dur*prev
-                t1=sample_dur*idx
-                # Use mid-point of pulse to get level
-                mid = int((prev+idx)/2)
-                if samples[mid] > sample_mean + 0.5 * sample_stdev:
-                    lvl=1
-                elif samples[mid] < sample_mean - 0.5 * sample_stdev:
-                    lvl=-1
-                else:
-                    lvl=0
-                res.append((t1,lvl,t1-t0))
-                prev=idx
-                if i == n-1: break
-        # deal with final pulse
-        mid = int((i+prev)/2)
-        if samples[mid] > sample_mean + 0.5 * sample_stdev:
-            lvl=1
-        elif samples[mid] < sample_mean - 0.5 * sample_stdev:
-            lvl=-1
+                continue
+            i0 = i
+            # roll forward
+            d0 = d
+            i += 1
+            while i < n:
+                d = buf[i] - buf[i-1]
+                if abs(d) < grad or math.copysign(d, d0) != d:
+                    break
+                i += 1
+            starts.append(i0); ends.append(i)
+        return starts, ends
+
+    def _runs_numpy(self, start):
+        ''' Rather than walking the samples, this classifies every
+            difference between adjacent samples as a rising edge (1),
+            falling edge (-1) or neither (0) and segments that into runs,
+            each of which is an edge.
+        '''
+        d = numpy.diff(self.buf[start-1:])     # d[k] = a[k+1] - a[k]
+        q = numpy.sign(d).astype(numpy.int8)
+        q[numpy.abs(d) < self.grad] = 0
+        del d
+        edge = q != 0
+        change = numpy.empty(len(q) + 1, dtype=bool)
+        change[0] = change[-1] = True
+        numpy.not_equal(q[1:], q[:-1], out=change[1:-1])
+        i0 = numpy.flatnonzero(edge & change[:-1]) + start
+        e = numpy.flatnonzero(edge & change[1:]) + start + 1
+        return i0, e
+
+    def _pulses(self, i0, e):
+        ''' Return `Pulses` ended by the edges with start indices `i0` and
+            end indices `e` in `buf`, and drop the samples before the end
+            of the last one.
+        '''
+        if len(e) == 0:
+            return Pulses(self.sample_dur)
+        base = self.base
+        if self.numpy:
+            i0 = numpy.asarray(i0); e = numpy.asarray(e)
+            idx = (i0 + e) // 2                 # mark mid point
+            prev = numpy.empty(len(idx), dtype=idx.dtype)
+            prev[0] = self.prev - base
+            prev[1:] = idx[:-1]
+            m = self.buf[(prev + idx) // 2]     # mid-point gives level
+            levels = (m > self.high).astype(numpy.int8) \
+                - (m < self.low).astype(numpy.int8)
+            res = Pulses(self.sample_dur, idx + base, levels, idx - prev)
+            last = int(idx[-1])
         else:
-            lvl=0
-        t0=sample_dur*prev
-        t1=sample_dur*n
-        res.append((t1,lvl,t1-t0))
-        v2("edge detection: done, found {} edges".format(len(res)))
-        v2( "first pulses: {}" .format(list(res[:10])))
-        v2( "last pulses: {}" .format(list(res[-10:])))
-        return tuple(res)
+            res = Pulses(self.sample_dur)
+            prev = self.prev - base
+            for start, end in zip(i0, e):
+                idx = (start + end) // 2        # mark mid point
+                # Use mid-point of pulse to get level
+                mid = (prev + idx) // 2
+                res.append(idx + base, self._level(self.buf[mid]), idx - prev)
+                prev = idx
+            last = prev
+        self.prev = base + last
+        self.buf = self.buf[last:]
+        self.base = self.prev
+        self.edges += len(res)
+        return res
+
+def pulses_from_chunks(chunks, sample_dur, mean, stdev, grad_factor=0.5):
+    ''' Generate `Pulses` from edge detection on each successive chunk of
+        samples from iterable `chunks`; see `EdgeDetector`.
+    '''
+    ed = EdgeDetector(sample_dur, mean, stdev, grad_factor)
+    for chunk in chunks:
+        yield ed.feed(chunk)
+    yield ed.finish()
+    v2("edge detection: done, found {} edges".format(ed.edges))
+
+
+####################################################################
+#   Streaming: waveform → pulses a chunk at a time
+
+CHUNK_FRAMES = 1 << 16
+' Number of frames read from a WAV file at a time. '
+
+STATS_SECONDS = 10
+''' When the input cannot be rewound, the length of the initial section
+    of it used to calculate the sample statistics for edge detection.
+'''
+
+def wav_chunks(w, nframes=CHUNK_FRAMES, limit=None):
+    ''' Generate the samples from `wave.Wave_read` `w`, `nframes` frames
+        at a time, until no more are available (or `limit` frames have
+        been read, if given), as single-channel samples from
+        `wav_samples()`. (The frame count in the header is not used,
+        since it is often wrong in data from a pipe.)
+    '''
+    sampwidth, nchannels = w.getsampwidth(), w.getnchannels()
+    while limit is None or limit > 0:
+        data = w.readframes(nframes if limit is None else min(nframes, limit))
+        if not data:
+            return
+        if limit is not None:
+            limit -= len(data) // (sampwidth * nchannels)
+        yield wav_samples(data, sampwidth, nchannels)
+
+def wav_samples(data, sampwidth, nchannels=1):
+    ''' Return the samples of WAV frame data `data`, with `sampwidth`
+        bytes per sample (1 to 4) and `nchannels` channels, as a single
+        sequence of integer samples.
+
+        Unsigned 8-bit mono data are returned as-is. Wider samples are
+        signed; 24- and 32-bit samples are truncated to their most
+        significant 16 bits, which is ample for edge detection and keeps
+        the sums in `SampleStats` exact. Multiple channels are mixed down
+        by adding them together, which does not lose any precision.
+
+        Since edge detection uses thresholds relative to the mean and
+        standard deviation of the samples, their offset and scale do not
+        matter.
+    '''
+    if not 1 <= sampwidth <= 4:
+        raise ValueError('Bad WAV sample width: {}'.format(sampwidth))
+    if sampwidth == 1 and nchannels == 1:
+        return data
+    if numpy is not None:
+        a = numpy.frombuffer(data, dtype=numpy.uint8)
+        if sampwidth > 1:
+            a = a.reshape(-1, sampwidth)[:, -2:].copy().view('<i2')
+        a = a.reshape(-1, nchannels)
+        return a[:, 0] if nchannels == 1 \
+            else a.sum(axis=1, dtype=numpy.int32)
+    if sampwidth == 1:
+        a = data
     else:
-        return tuple()
+        #   Little-endian top two bytes of each sample
+        top = bytearray(len(data) // sampwidth * 2)
+        top[0::2] = data[sampwidth-2::sampwidth]
+        top[1::2] = data[sampwidth-1::sampwidth]
+        a = array('h', top)
+        if sys.byteorder == 'big':
+            a.byteswap()
+    if nchannels == 1:
+        return a
+    return list(map(sum, zip(*( a[c::nchannels] for c in range(nchannels) ))))
 
+def wav_pulses(w, grad_factor=0.5, rewind=True):
+    ''' Generate `Pulses` found by edge detection in the samples from
+        `wave.Wave_read` `w`, reading `CHUNK_FRAMES` at a time.
 
+        If `rewind` is true the input is read twice, first to calculate
+        the sample statistics and then, after rewinding it, to find the
+        edges; the pulses are exactly the same as those from
+        `samples_to_pulses_via_edge_detection()` on all the samples.
+
+        Otherwise (e.g., when reading a pipe) the statistics are
+        calculated from just the first `STATS_SECONDS` of the input, and
+        pulses are generated as soon as that has been read.
+    '''
+    sample_dur = 1.0 / w.getframerate()
+    st = SampleStats()
+    chunks = wav_chunks(w)
+    if rewind:
+        for chunk in chunks:
+            st.add(chunk)
+        w.rewind()
+        chunks = wav_chunks(w)
+    else:
+        head = []
+        for chunk in chunks:
+            head.append(chunk); st.add(chunk)
+            if st.n * sample_dur >= STATS_SECONDS:
+                break
+        chunks = chain(head, chunks)
+    if st.n < 2:
+        return
+    v2('Samples: %d%s' % (st.n, '' if rewind else ' (used for stats)'))
+    v2('Samples min: %d' % st.min)
+    v2('Samples max: %d' % st.max)
+    (mean, stdev) = st.stats()
+    v2("edge detection: mean = {:5.3f}, stdev = {:5.3f}".format(mean, stdev))
+    yield from pulses_from_chunks(chunks, sample_dur, mean, stdev, grad_factor)
+
+class PulseStream:
+    ''' A read-only sequence view of the pulses in the `Pulses` generated
+        by iterable `chunks`, which are read only as they are needed. This
+        lets the `PulseDecoder` and platform `FileReader` code, which
+        index the pulses, start decoding before all the input has been
+        read.
+
+        Since the total number of pulses is not known until the input is
+        exhausted, ``len()`` is the number of pulses read so far, having
+        first read at least `lookahead` pulses past the highest index
+        used. Thus the usual ``while i < len(pulses)`` loops work as for
+        any other sequence.
+
+        Pulses more than `keep` before the highest index used are
+        discarded to keep memory use constant; an `IndexError` is raised
+        for any attempt to access them.
+
+        As with `Pulses`, indexing returns a ``(time, level, duration)``
+        tuple and `width()` the width in samples.
+    '''
+
+    LOOKAHEAD = 1 << 10
+    KEEP = 1 << 16
+
+    def __init__(self, chunks, sample_dur, lookahead=LOOKAHEAD, keep=KEEP):
+        self.source = iter(chunks)
+        self.sample_dur = sample_dur
+        self.lookahead = lookahead
+        self.keep = keep
+        self.buf = Pulses(sample_dur)
+        self.base = 0           # index of buf[0]
+        self.highest = -1       # highest index used
+        self.exhausted = False
+
+    def _fill(self, end=None):
+        ''' Read pulses until we have those before index `end` (or all of
+            them if `end` is `None`), if possible.
+        '''
+        while not self.exhausted \
+                and (end is None or self.base + len(self.buf.widths) < end):
+            chunk = next(self.source, None)
+            if chunk is None:
+                self.exhausted = True
+            else:
+                self.buf.extend(chunk)
+
+    def _use(self, i):
+        ' Note that index `i` has been used, discarding old pulses. '
+        self.highest = i
+        if i - self.base >= 2 * self.keep:
+            drop = i - self.base - self.keep
+            del self.buf[:drop]
+            self.base += drop
+
+    def __len__(self):
+        n = self.base + len(self.buf.widths)
+        if n <= self.highest + self.lookahead and not self.exhausted:
+            #   Read ahead twice as far to avoid filling on every call.
+            self._fill(self.highest + 1 + 2 * self.lookahead)
+            n = self.base + len(self.buf.widths)
+        return n
+
+    def _index(self, i):
+        ' Return the index in `buf` of pulse `i`, reading it if necessary. '
+        j = i - self.base
+        if 0 <= j < len(self.buf.widths):
+            if i > self.highest:
+                self.highest = i
+                if j >= 2 * self.keep:
+                    self._use(i)
+                    j = i - self.base
+            return j
+        if i < 0:
+            raise IndexError('PulseStream: negative index {}'.format(i))
+        if i < self.base:
+            raise IndexError('PulseStream: pulse {} discarded'.format(i))
+        self._fill(i + 1)
+        if i >= self.base + len(self.buf.widths):
+            raise IndexError('PulseStream: index {} out of range'.format(i))
+        self._use(i)
+        return i - self.base
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._slice(i)
+        return self.buf[self._index(i)]
+
+    def width(self, i):
+        ' The width of pulse `i` in samples. '
+        j = i - self.base
+        if 0 <= j <= self.highest - self.base:  # fast path for PulseDecoder
+            return self.buf.widths[j]
+        return self.buf.widths[self._index(i)]
+
+    def _slice(self, s):
+        start, stop = s.start or 0, s.stop
+        if s.step not in (None, 1) or start < 0 \
+                or (stop is not None and stop < 0):
+            raise IndexError('PulseStream: unsupported slice {}'.format(s))
+        if start < self.base:
+            raise IndexError('PulseStream: pulse {} discarded'.format(start))
+        self._fill(stop)
+        stop = None if stop is None else max(0, stop - self.base)
+        return self.buf[start-self.base:stop]
 
 # samples   : [ float ]
 # ->
@@ -237,6 +801,15 @@ PULSE_MARK  = Pulse.PULSE_MARK
 # 3) Sub-class this and override expect_stop_bits as necessary
 #
 #
+Limits = namedtuple('Limits', 'mark_lower mark_upper space_lower space_upper'
+    ' mark_min mark_max space_min space_max')
+Limits.__doc__ = \
+    ''' Lower and upper limits on the widths of mark and space pulses:
+        the `_lower` and `_upper` limits for classifying a pulse and the
+        wider `_min` and `_max` limits for pulses expected to be marks or
+        spaces.
+    '''
+
 class PulseDecoder:
     __docs__ = \
         ''' A class to decode pulses into mark and space
@@ -256,26 +829,74 @@ class PulseDecoder:
         self.lsb_first      = lsb_first
         self.start_bits     = start_bits
         self.stop_bits      = stop_bits
+        self.set_tolerances(mark_tol, space_tol)
 
-        mark_width = 0.5 / mark_baud
+        # mask sequence
+        if lsb_first:
+            self.mask_sequence = ( 1, 2, 4, 8, 16, 32, 64, 128 )
+        else:
+            self.mask_sequence = ( 128, 64, 32, 16, 8, 4, 2, 1 )
+
+    def set_tolerances(self, mark_tol, space_tol):
+        ''' Set the ``(lower, upper)`` relative tolerances `mark_tol` and
+            `space_tol` for the widths of mark and space pulses.
+        '''
+        self.mark_tol       = mark_tol
+        self.space_tol      = space_tol
+
+        mark_width = 0.5 / self.mark_baud
         self.mark_lower = (1.0 + math.log(1.0 - mark_tol[0])) * mark_width
         self.mark_upper = (1.0 + math.log(1.0 + mark_tol[1])) * mark_width
         v3("mark tolerance lower: {}".format(self.mark_lower))
         v3("mark tolerance upper: {}".format(self.mark_upper))
 
-        space_width = 0.5 / space_baud
+        space_width = 0.5 / self.space_baud
         self.space_lower = (1.0 + math.log(1.0 - space_tol[0])) * space_width
         self.space_upper = (1.0 + math.log(1.0 + space_tol[1])) * space_width
         v3("space tolerance lower: {}".format(self.space_lower))
         v3("space tolerance upper: {}".format(self.space_upper))
 
-        # mask sequence
-        if lsb_first:
-            self.mask_sequence = ( 1, 2, 4, 8, 16, 32, 64, 128 )
-        else:
-            self.mask_sequence = ( 128, 64, 32, 16, 8, 4, 2, 1 )
+        # expect_marks() and expect_spaces() accept a wider range
+        self.limits = Limits(self.mark_lower, self.mark_upper,
+            self.space_lower, self.space_upper,
+            self.mark_lower * .75, self.mark_upper * 1.5,
+            self.space_lower * .75, self.space_upper * 1.35)
+        self.sample_limits = {}
 
+    # pulses        : Pulses, PulseStream or ( ( float, int, float ), )
+    # ->
+    # ( width, limits ) : ( int -> number, Limits )
+    #
+    def _widths(self, pulses):
+        ''' Return a function giving the width of the pulse in `pulses` at
+            an index, and the `Limits` on pulse widths in the same units.
+
+            For `Pulses` and `PulseStream` these are whole samples, so
+            checking a pulse width is an integer comparison; the limits
+            are calculated once for each sample duration. For other
+            sequences of ``(time, level, duration)`` tuples they are
+            seconds.
+        '''
+        sample_dur = getattr(pulses, 'sample_dur', None)
+        if sample_dur is None:
+            return (lambda i: pulses[i][2]), self.limits
+        lim = self.sample_limits.get(sample_dur)
+        if lim is None:
+            #   Odd fields are upper limits.
+            lim = self.sample_limits[sample_dur] = Limits(*(
+                math.floor(x / sample_dur) if k % 2
+                    else math.ceil(x / sample_dur)
+                for k, x in enumerate(self.limits) ))
+        return pulses.width, lim
 
+    def _classify(self, width, lim):
+        ' Return `PULSE_MARK`, `PULSE_SPACE` or `None` for `width`. '
+        if width >= lim.mark_lower and width <= lim.mark_upper:
+            return PULSE_MARK
+        elif width >= lim.space_lower and width <= lim.space_upper:
+            return PULSE_SPACE
+        else:
+            return None
 
     # pulse     : ( float, int, float )
     # ->
@@ -296,11 +917,12 @@ class PulseDecoder:
     # ->
     # i_next        : int
     def next_space(self, pulses, i_next, needed):
+        width, lim = self._widths(pulses)
         consecutive = 0
         i = i_next
         while i < len(pulses):
-            dur = pulses[i][2]
-            if dur >= self.space_lower and dur <= self.space_upper:
+            dur = width(i)
+            if dur >= lim.space_lower and dur <= lim.space_upper:
                 consecutive += 1
                 if consecutive >= needed:
                     return i - (consecutive - 1)
@@ -317,8 +939,9 @@ class PulseDecoder:
     # ->
     # i_next        : ( int, int )
     def next_mark(self, pulses, i_next):
+        width, lim = self._widths(pulses)
         i = i_next
-        while self.classify_pulse(pulses[i]) != PULSE_MARK:
+        while self._classify(width(i), lim) != PULSE_MARK:
             i += 1
         return (i, i - i_next)
 
@@ -328,14 +951,16 @@ class PulseDecoder:
     #
     # Biased towrards marks - we accept a wider range of pulse widths
     def expect_marks(self, pulses, i_next, n):
+        width, lim = self._widths(pulses)
         for i in range(0, n):
             idx = i_next + i
             if idx >= len(pulses):
                 raise ReadError('Out of pulses at %d, on pulse %d of expected'
                     ' %d mark pulses'
                     % (idx, i, n))
-            dur = pulses[idx][2]
-            if dur < self.mark_lower * .75 or dur > self.mark_upper * 1.5:
+            dur = width(idx)
+            if dur < lim.mark_min or dur > lim.mark_max:
+                dur = pulses[idx][2]
                 raise ReadError('Expected %d mark pulses at %d (%f)'
                     ', failed on pulse %d with pulse width %f'
                     ', pulses = %s'
@@ -347,14 +972,16 @@ class PulseDecoder:
     #
     # Biased towrards spaces - we accept a wider range of pulse widths
     def expect_spaces(self, pulses, i_next, n):
+        width, lim = self._widths(pulses)
         for i in range(n):
             idx = i_next + i
             if idx >= len(pulses):
                 raise ReadError('Out of pulses at %d, on pulse %d of expected'
                     ' %d space pulses'
                     % (idx, i, n))
-            dur = pulses[idx][2]
-            if dur < self.space_lower * .75 or dur > self.space_upper * 1.35:
+            dur = width(idx)
+            if dur < lim.space_min or dur > lim.space_max:
+                dur = pulses[idx][2]
                 raise ReadError('Expected %d space pulses at %d (%f)'
                     ', failed on pulse %d with pulse width %f'
                     ', pulses = %s'
@@ -372,8 +999,8 @@ class PulseDecoder:
     # ( i_next, bit )   : ( int, int )
     def read_bit(self, pulses, idx):
         i_next = idx
-        e = pulses[i_next]
-        p = self.classify_pulse(e)
+        width, lim = self._widths(pulses)
+        p = self._classify(width(i_next), lim)
         #v4( 'classify: {}, {}, {}, {}'.format(str(p), i_next, e[0], e[2]))
         #v4('read_bit, first: %s' % p)  # XXX very slow
         if p == PULSE_MARK:
@@ -516,6 +1143,9 @@ class Encoder(object):
             p.extend(self.ms_pattern[b])
         self.stop_pattern = tuple(p)
 
+        # framed byte value -> pulse widths, filled in as needed
+        self.byte_patterns = [None] * 256
+
 
     # bit
     # bit       : int           -- 1/0 => mark/space
@@ -531,19 +1161,51 @@ class Encoder(object):
     # b         : int       -- byte
     # result    : [ float ] -- pulse widths
     def encode_byte(self, b):
-        res = []
-        res.extend(self.start_pattern)
-        for m in self.mask_sequence:
-            res.extend(self.ms_pattern[0 if b & m == 0 else 1])
-        res.extend(self.stop_pattern)
-        return res
+        return list(self._byte_pattern(b))
+
+    # b         : int       -- byte
+    # result    : ( int, )  -- bits, including start and stop bits
+    def framed_bits(self, b):
+        return self.start_bits \
+            + tuple( 0 if b & m == 0 else 1 for m in self.mask_sequence ) \
+            + self.stop_bits
+
+    def _byte_pattern(self, b):
+        p = self.byte_patterns[b]
+        if p is None:
+            p = self.byte_patterns[b] = tuple(chain.from_iterable(
+                self.ms_pattern[bit] for bit in self.framed_bits(b) ))
+        return p
 
     # bytes
     def encode_bytes(self, bytes):
-        res = []
-        for b in bytes:
-            res.extend(self.encode_byte(b))
-        return res
+        return list(chain.from_iterable(map(self._byte_pattern, bytes)))
+
+    # bytes
+    # result    : EncodedBytes
+    def encoded(self, bytes):
+        ''' Return an `EncodedBytes` for `bytes`, to be included in the
+            pulses of a `sound()`. This is rendered from templates by
+            `SampleEncoder` rather than pulse by pulse.
+        '''
+        return EncodedBytes(self, bytes)
+
+class EncodedBytes:
+    ''' Bytes `data` encoded as pulses by `Encoder` `encoder`, as an item
+        in the pulse list of a `sound()`. Iterating over this gives the
+        pulse widths, as from `Encoder.encode_bytes()`.
+    '''
+    __slots__ = ('encoder', 'data')
+
+    def __init__(self, encoder, data):
+        self.encoder = encoder
+        self.data = bytes(data)
+
+    def __iter__(self):
+        return iter(self.encoder.encode_bytes(self.data))
+
+    def __repr__(self):
+        return 'EncodedBytes({!r})'.format(self.data)
 
 
 # FIXME: fn to get FileEncoder and ByteEncoder for each platform
@@ -601,7 +1263,8 @@ def pulses_to_samples2(chunks, sample_dur, low, mid, high):
             res.extend([mid] * int(0.5 + dur/sample_dur))
             lvl = 0
         elif chunk[0] == AudioMarker.SOUND:
-            pulses = chunk[1]
+            pulses = chain.from_iterable(
+                p if isinstance(p, EncodedBytes) else (p,) for p in chunk[1])
             for d in pulses:
                 if type(d) is tuple:
                     # tuple is width, level
@@ -625,3 +1288,148 @@ def pulses_to_samples2(chunks, sample_dur, low, mid, high):
         else:
             raise Exception('Unknown audio marker')
     return res
+
+
+class SampleEncoder:
+    ''' Convert pulses to samples, as `pulses_to_samples2()` does, but
+        building the samples from `bytes` templates.
+
+        The `low`, `mid` and `high` sample values are for WAV frames of
+        `sampwidth` bytes per sample (unsigned for 1, otherwise signed)
+        with the same value in each of `nchannels` channels.
+
+        `render()` converts each ``sound()`` or ``silence()`` chunk to
+        samples. Each distinct pulse width and level is converted to
+        samples once, and for each `Encoder` used in an `EncodedBytes`,
+        the samples of every framed byte value are calculated once (for
+        each starting level), so most of the output is made by joining
+        precomputed `bytes`.
+    '''
+
+    def __init__(self, sample_dur, low, mid, high, sampwidth=1, nchannels=1):
+        self.sample_dur = sample_dur
+        def frame(x):
+            return x.to_bytes(sampwidth, 'little', signed=sampwidth > 1) \
+                * nchannels
+        self.mid = frame(mid)
+        self.levels = { -1: frame(low), 0: self.mid, 1: frame(high) }
+        self.lvl = 0                # level of last pulse; 0 after silence
+        self.pulses = {}            # (width, level) -> samples
+        self.templates = {}         # Encoder -> see _templates()
+
+    def pulse(self, width, level):
+        ' Return the samples for a pulse of `width` seconds at `level`. '
+        samples = self.pulses.get((width, level))
+        if samples is None:
+            samples = self.pulses[(width, level)] = \
+                self.levels[level] * int(0.5 + width/self.sample_dur)
+        return samples
+
+    def _templates(self, encoder):
+        ''' Return the templates for `encoder` as ``(samples, last)``,
+            each indexed by starting level (1 or -1) and byte value, where
+            `samples` is the `bytes` for that framed byte value and `last`
+            the level of its last pulse.
+        '''
+        t = self.templates.get(encoder)
+        if t is not None:
+            return t
+        bits = {}                   # (bit, start level) -> samples, last
+        for bit in (0, 1):
+            for start in (1, -1):
+                level, parts = start, []
+                for width in encoder.ms_pattern[bit]:
+                    parts.append(self.pulse(width, level))
+                    level = -level
+                bits[bit, start] = (b''.join(parts), -level)
+        samples, last = {}, {}
+        for start in (1, -1):
+            samples[start], last[start] = [], []
+            for b in range(256):
+                level, parts = start, []
+                for bit in encoder.framed_bits(b):
+                    s, end = bits[bit, level]
+                    parts.append(s)
+                    level = -end
+                samples[start].append(b''.join(parts))
+                last[start].append(-level)
+        t = self.templates[encoder] = (samples, last)
+        return t
+
+    def render(self, chunk):
+        ''' Return the samples for a ``sound()`` or ``silence()`` chunk, as
+            a `bytes`. The level of the first pulse of a sound depends on
+            the previous chunks rendered.
+        '''
+        if chunk[0] == AudioMarker.SILENCE:
+            self.lvl = 0
+            return self.mid * int(0.5 + chunk[1]/self.sample_dur)
+        elif chunk[0] != AudioMarker.SOUND:
+            raise Exception('Unknown audio marker')
+        parts = []
+        lvl = self.lvl
+        for d in chunk[1]:
+            if isinstance(d, EncodedBytes):
+                if not d.data: continue
+                samples, last = self._templates(d.encoder)
+                level = 1 if lvl == 0 else -lvl
+                for b in d.data:
+                    parts.append(samples[level][b])
+                    level = -last[level][b]
+                lvl = -level
+            elif type(d) is tuple:
+                # tuple is width, level
+                lvl = d[1]
+                parts.append(self.pulse(d[0], lvl))
+            else:
+                lvl = 1 if lvl == 0 else -lvl
+                parts.append(self.pulse(d, lvl))
+        parts.append(self.mid)
+        self.lvl = lvl
+        return b''.join(parts)
+
+
+####################################################################
+#   Output sample rate
+
+OUTPUT_RATES = (11025, 22050, 44100)
+' Standard WAV sample rates from which `output_rate()` chooses. '
+
+RATE_TOL = 0.04
+''' The largest relative error in a pulse width, from rounding it to a
+    whole number of samples, that `output_rate()` allows. Larger errors
+    may still decode with `PulseDecoder`, but change the timing of the
+    recording as heard by the original hardware: at 11,025 Hz a 2400 Hz
+    JR-200 mark pulse is 13% short, so its bits play at about 690 baud
+    rather than 600.
+'''
+
+def pulse_widths(chunks):
+    ''' Return the set of pulse widths (in seconds) in the ``sound()``
+        chunks of `chunks`.
+    '''
+    widths = set()
+    for chunk in chunks:
+        if chunk[0] != AudioMarker.SOUND:
+            continue
+        for d in chunk[1]:
+            if isinstance(d, EncodedBytes):
+                if d.data:
+                    widths.update(*d.encoder.ms_pattern)
+            elif type(d) is tuple:
+                widths.add(d[0])
+            else:
+                widths.add(d)
+    return widths
+
+def output_rate(widths, rates=OUTPUT_RATES, tol=RATE_TOL):
+    ''' Return the lowest of `rates` at which each pulse width in
+        `widths` is within `tol` of a whole number of samples, or the
+        highest of `rates` if none is.
+    '''
+    rates = sorted(rates)
+    for rate in rates:
+        if all( abs(int(0.5 + w*rate) - w*rate) <= tol * w*rate
+                for w in widths ):
+            return rate
+    return rates[-1]
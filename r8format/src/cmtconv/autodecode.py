@@ -0,0 +1,283 @@
+''' Decode a tape recording with several sets of decoding parameters.
+
+    Marginal recordings often decode only with non-default settings for
+    the edge detection gradient (`edge_gradient_factor`), the tolerances
+    of pulse widths (`PulseDecoder` `mark_tol` and `space_tol`) or the
+    click filter (`click_width`, in seconds). `decode_best()` tries each
+    set of parameters in a grid (see `param_grid()`) in parallel and
+    chooses the best result: one that read the whole file if possible,
+    otherwise the one that read the most blocks and got furthest into the
+    recording.
+
+    The samples are read from the WAV file just once into a temporary
+    file (`SharedSamples`) that each worker process maps into memory
+    read-only, so the attempts share a single copy of them.
+'''
+
+from    array  import array
+from    collections  import namedtuple
+from    functools  import partial
+from    itertools  import product
+import  mmap, os, tempfile, wave
+
+from    binary.parallel  import pmap
+from    cmtconv.audio  import SampleStats, PulseDecoder, PulseStream, \
+    ReadError, CHUNK_FRAMES, CLICK_WIDTH, wav_chunks, pulses_from_chunks, \
+    iter_filter_clicks, click_tol, numpy
+from    cmtconv.bytestream  import get_block_module
+from    cmtconv.logging  import *
+import  cmtconv.logging as lg
+
+####################################################################
+#   Samples shared between processes
+
+class SharedSamples:
+    ''' The samples of a recording, stored in a temporary file so that
+        they can be shared between processes with `view()`, along with
+        their sample duration and statistics.
+
+        Instances are pickled to pass them to worker processes; only the
+        path and metadata are pickled. Use as a context manager, or call
+        `close()`, to remove the file.
+    '''
+
+    def __init__(self, path, typecode, n, sample_dur, mean, stdev):
+        self.path = path
+        self.typecode = typecode
+        self.n = n
+        self.sample_dur = sample_dur
+        self.mean = mean
+        self.stdev = stdev
+        self._view = None
+
+    @classmethod
+    def from_wav(cls, stream, dir=None):
+        ''' Read all the samples from WAV file `stream`, which may be in
+            any format accepted by `cmtconv.audio.wav_samples()`, into a
+            new temporary file in `dir`.
+        '''
+        w = wave.open(stream, 'rb')
+        sample_dur = 1.0 / w.getframerate()
+        typecode = 'B' \
+            if w.getsampwidth() == 1 and w.getnchannels() == 1 else 'i'
+        st = SampleStats()
+        fd, path = tempfile.mkstemp(prefix='cmtconv-', suffix='.samples',
+            dir=dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in wav_chunks(w):
+                    st.add(chunk)
+                    f.write(_tobytes(chunk, typecode))
+        except BaseException:
+            os.remove(path)
+            raise
+        return cls(path, typecode, st.n, sample_dur, *st.stats())
+
+    def view(self):
+        ''' Return a read-only `memoryview` of the samples, mapping the
+            file into memory the first time this is called in a process.
+        '''
+        if self._view is None:
+            if self.n == 0:
+                self._view = memoryview(array(self.typecode))
+            else:
+                with open(self.path, 'rb') as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._view = memoryview(mm).cast(self.typecode)
+        return self._view
+
+    def chunks(self, n=CHUNK_FRAMES):
+        ' Generate the samples as `memoryview` slices of `n` samples. '
+        v = self.view()
+        for i in range(0, len(v), n):
+            yield v[i:i+n]
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_view'] = None
+        return state
+
+    def close(self):
+        self._view = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _tobytes(chunk, typecode):
+    ''' Return the samples in `chunk`, from `wav_chunks()`, as `bytes` of
+        native `typecode` values.
+    '''
+    if typecode == 'B':
+        return bytes(chunk)
+    if numpy is not None and isinstance(chunk, numpy.ndarray):
+        return chunk.astype(numpy.dtype(typecode)).tobytes()
+    return array(typecode, chunk).tobytes()
+
+####################################################################
+#   Decoding attempts
+
+PARAMS = ('edge_gradient_factor', 'mark_tol', 'space_tol', 'click_width')
+''' Decoding parameters; a value of `None` for `mark_tol` or `space_tol`
+    leaves the platform's default tolerance.
+'''
+
+def param_grid(platform, gradient_scales=(1, 0.75, 1.25),
+        tol_scales=(1, 1.5), click_scales=(1, 0.5, 2)):
+    ''' Return a list of parameter `dict`s for `platform`, with each
+        combination of the platform's defaults scaled by the given
+        factors. The first set of parameters is the platform's defaults.
+
+        The tolerances are those of the platform's first `PulseDecoder`;
+        the lower tolerances are limited to 0.9, since at 1 a pulse of
+        any width would be accepted.
+    '''
+    bm = get_block_module(platform)
+    gf = bm.parameters().get('edge_gradient_factor', 0.5)
+    pd = decoders(bm.FileReader())[0]
+    def tol(t, scale):
+        if scale == 1:
+            return None
+        return (min(t[0] * scale, 0.9), t[1] * scale)
+    return [ dict(edge_gradient_factor=gf * g,
+            mark_tol=tol(pd.mark_tol, t), space_tol=tol(pd.space_tol, t),
+            click_width=CLICK_WIDTH * c)
+        for g, t, c in product(gradient_scales, tol_scales, click_scales) ]
+
+def decoders(reader):
+    ' Return the `PulseDecoder`s used by platform `FileReader` `reader`. '
+    return [ v for v in vars(reader).values() if isinstance(v, PulseDecoder) ]
+
+Attempt = namedtuple('Attempt', 'params ok blocks error end')
+Attempt.__doc__ = \
+    ''' The result of `attempt()` with `params`: `ok` is true if the file
+        was read successfully, `blocks` are those read (possibly only
+        some of them if the platform's `FileReader` keeps the good blocks
+        when reading fails), `error` is the error message if not `ok`, and
+        `end` is the time in seconds in the recording that reading
+        reached.
+    '''
+
+def score(a):
+    ''' Sort key for `Attempt` `a`; the best attempt has the highest.
+        Successful attempts all score the same, so the first of them in
+        the grid is chosen.
+    '''
+    return (a.ok, len(a.blocks), 0 if a.ok else a.end)
+
+def attempt(samples, platform, params):
+    ''' Read a file for `platform` from `SharedSamples` `samples`, using
+        the decoding parameters in the `dict` `params` (see `PARAMS`),
+        and return an `Attempt`.
+    '''
+    bm = get_block_module(platform)
+    sample_dur = samples.sample_dur
+    fr = reader(bm, params)
+    pulses = pulse_stream(bm, samples.chunks(), sample_dur,
+        samples.mean, samples.stdev, params)
+    try:
+        (_, blocks) = fr.read_file(pulses, 0)
+        ok, error = True, None
+    except Exception as ex:
+        #   Decoding a bad tape can fail in many ways.
+        blocks = getattr(fr, 'blocks', ())
+        ok, error = False, '{}: {}'.format(type(ex).__name__, ex)
+    try:
+        end = pulses[pulses.highest][0] if pulses.highest >= 0 else 0
+    except IndexError:
+        end = samples.n * sample_dur
+    return Attempt(params, ok, tuple(blocks), error, end)
+
+def reader(bm, params):
+    ''' Return a `FileReader` from platform module `bm` using the pulse
+        width tolerances in `params`, and skipping bad blocks if it can.
+    '''
+    fr = bm.FileReader()
+    if hasattr(fr, 'skip_bad_blocks'):
+        fr.skip_bad_blocks = True
+    for pd in decoders(fr):
+        pd.set_tolerances(params.get('mark_tol') or pd.mark_tol,
+            params.get('space_tol') or pd.space_tol)
+    return fr
+
+def pulse_stream(bm, chunks, sample_dur, mean, stdev, params):
+    ''' Return a `PulseStream` of the pulses found in sample `chunks`
+        with the statistics `mean` and `stdev`, using the edge detection
+        and click filter parameters in `params` (or the defaults for
+        platform module `bm`). With fewer than two samples there are no
+        statistics (`stdev` is `None`) and no pulses.
+    '''
+    gf = params.get('edge_gradient_factor')
+    if gf is None:
+        gf = bm.parameters().get('edge_gradient_factor', 0.5)
+    tol = click_tol(sample_dur, params.get('click_width') or CLICK_WIDTH)
+    if stdev is None:
+        pulses = iter(())
+    else:
+        pulses = pulses_from_chunks(chunks, sample_dur, mean, stdev, gf)
+    return PulseStream(iter_filter_clicks(pulses, sample_dur, tol),
+        sample_dur)
+
+def init_worker(platform, verbosity):
+    ''' Set up a worker process for `binary.parallel.pmap()`: set the
+        logging verbosity and import the module for `platform` (unless
+        it is ``auto``) once, rather than for each task.
+    '''
+    lg.set_verbosity(verbosity)
+    if platform != 'auto':
+        get_block_module(platform)
+
+def attempts(samples, platform, grid, jobs=None):
+    ''' Return a list of the `Attempt`s for each set of parameters in
+        `grid`, run in parallel by `pmap()` with `jobs` processes.
+    '''
+    f = partial(attempt, samples, platform)
+    return list(pmap(f, grid, jobs, init_worker,
+        (platform, lg.get_verbosity())))
+
+def decode_best(platform, stream, grid=None, jobs=None, merge=False):
+    ''' Decode the WAV file `stream` for `platform` with each set of
+        parameters in `grid` (default `param_grid()`) and return the
+        blocks and parameters of the best `Attempt`, as chosen by
+        `score()`. Raises `ReadError` with the error from that attempt
+        if none read the whole file.
+
+        If `merge` is true and no attempt read the whole file but the
+        platform module has a ``merge_blocks()`` function, that is used
+        to try to make a complete file from the blocks read by all the
+        attempts; the parameters returned are then `None`.
+    '''
+    if grid is None:
+        grid = param_grid(platform)
+    with SharedSamples.from_wav(stream) as samples:
+        results = attempts(samples, platform, grid, jobs)
+    for a in results:
+        v1('{}: {}', format_params(a.params),
+            'ok' if a.ok else '{} blocks, {:.3f}s: {}'.format(
+                len(a.blocks), a.end, a.error))
+    best = max(results, key=score)
+    if best.ok:
+        return best.blocks, best.params
+    bm = get_block_module(platform)
+    if merge and hasattr(bm, 'merge_blocks'):
+        try:
+            return bm.merge_blocks( a.blocks for a in results ), None
+        except ValueError as ex:
+            v1('merge failed: {}', ex)
+    raise ReadError(best.error)
+
+def format_params(params):
+    ' Return a short human-readable form of decoding parameters `params`. '
+    return ' '.join( '{}={}'.format(k, _fmt(params.get(k))) for k in PARAMS
+        if params.get(k) is not None )
+
+def _fmt(x):
+    if isinstance(x, float):    return '{:.3g}'.format(x)
+    if isinstance(x, tuple):    return ','.join(map(_fmt, x))
+    return str(x)
@@ -18,10 +18,14 @@ import  wave
 
 from    cmtconv.audio  import samples_to_pulses, pulses_to_samples, \
     filter_clicks, samples_to_pulses_via_edge_detection, \
-    pulses_to_samples2
+    pulses_to_samples2, iter_filter_clicks, wav_pulses, PulseStream, \
+    SampleEncoder, output_rate, pulse_widths, click_tol
 from    cmtconv.logging  import *
 from    binary.tool  import asl
 
+PLATFORMS = ('FM-7', 'JR-200', 'MB-6885', 'PC-8001', 'TK-85')
+' The platforms with block modules in `cmtconv.platform`. '
+
 def get_block_module(platform):
     ''' Find, load and return the module containing the block classes for
         `platform`. Upper-case letters in `platform` will be translated to
@@ -89,34 +93,38 @@ def blocks_from_asl(platform, stream, filename=None):
 
 
 def blocks_from_audio(platform, stream):
-    '''Convert from audio to a sequence of blocks'''
+    ''' Convert from audio to a sequence of blocks.
+
+        The audio is decoded as it is read, a chunk at a time, through a
+        pipeline of generators (samples → pulses → filtered pulses) into
+        a `PulseStream` read by the platform's `FileReader`, so memory use
+        does not grow with the length of the input. If `stream` is not
+        seekable (e.g., a pipe) decoding starts before all of it has been
+        read; see `wav_pulses()`.
+
+        The WAV file may have any sample rate, 8- to 32-bit samples and
+        any number of channels, which are mixed down; see `wav_samples()`.
+    '''
     bm = get_block_module(platform)
     w = wave.open(stream, 'rb')
-    if w.getnchannels() != 1 or w.getsampwidth() != 1:
-        raise ValueError('Only mono 8-bit wav files are supported')
     rate = w.getframerate()
-    n_samples = w.getnframes()
-    samples = w.readframes(n_samples)
     sample_dur = 1.0 / rate
-    v2('Rate: %d' % rate)
-    v2('Duration: %f' % (sample_dur * n_samples))
+    v2('Rate: %d, sample width: %d, channels: %d'
+        % (rate, w.getsampwidth(), w.getnchannels()))
     v3('Sample duration: %f microseconds' % (1000000 * sample_dur))
-    v3('Samples: %d' % n_samples)
-    v2('Samples min: %d' % min(samples))
-    v2('Samples max: %d' % max(samples))
-    # pulses = samples_to_pulses(samples, sample_dur)
     params = bm.parameters()
     gf = params.get("edge_gradient_factor", 0.5)
-    pulses = samples_to_pulses_via_edge_detection(samples, sample_dur, gf)
-    pulses = filter_clicks(pulses, sample_dur)
-    v2('Number of pulses: %d ' % len(pulses))
-    pulse_widths = [dur for (_,_,dur) in pulses]
-    v2('Min pulse: %f' % min(pulse_widths))
-    v2('Max pulse: %f' % max(pulse_widths))
+    pulses = wav_pulses(w, gf, rewind=_seekable(stream))
+    pulses = iter_filter_clicks(pulses, sample_dur, click_tol(sample_dur))
+    pulses = PulseStream(pulses, sample_dur)
     fr = bm.FileReader()
     (_,blocks) = fr.read_file(pulses, 0)
     return blocks
 
+def _seekable(stream):
+    try:                return stream.seekable()
+    except Exception:   return False
+
 ####################################################################
 #   blocks → bytestream
 
@@ -148,24 +156,44 @@ def get_file_bytestream(blocks):
     return bytes(chain(*( b.filedata for b in blocks )))
 
 
-def blocks_to_audio(platform, blocks, stream):
-    '''Write out the blocks as audio'''
+def blocks_to_audio(platform, blocks, stream,
+        rate=None, sampwidth=1, nchannels=1):
+    ''' Write out the blocks as audio.
+
+        The WAV file has `nchannels` channels of `sampwidth`-byte samples
+        at `rate` samples per second. If `rate` is `None` the lowest of
+        the standard rates that keeps the platform's pulse widths
+        accurate is used; see `output_rate()`.
+
+        The samples for each chunk (typically a block) of the audio are
+        built from templates by a `SampleEncoder` and written as they are
+        produced. If `stream` is not seekable the WAV header must give
+        the length of the data before it, so the whole file is rendered
+        before writing.
+    '''
     bm = get_block_module(platform)
     # Convert File to pulses
-    pulses = bm.FileEncoder().encode_file(blocks)
+    chunks = bm.FileEncoder().encode_file(blocks)
 
     # Convert pulses to samples
-    rate        = 44100
+    if rate is None:
+        rate    = output_rate(pulse_widths(chunks))
+    v2('Rate: %d' % rate)
     sample_dur  = 1.0 / rate
-    amp         = 127
-    mid         = 128
-    #samples     = pulses_to_samples(pulses, sample_dur, mid, mid-amp, mid+amp)
-    samples     = pulses_to_samples2(pulses, sample_dur, mid-amp, mid, mid+amp)
+    amp         = (1 << (8 * sampwidth - 1)) - 1
+    mid         = 128 if sampwidth == 1 else 0
+    se          = SampleEncoder(sample_dur, mid-amp, mid, mid+amp,
+                    sampwidth, nchannels)
+    samples     = map(se.render, chunks)
 
     # Write out WAV file
     w = wave.open(stream,'wb')
-    w.setnchannels(1)
-    w.setsampwidth(1)
+    w.setnchannels(nchannels)
+    w.setsampwidth(sampwidth)
     w.setframerate(rate)
-    w.writeframes(bytes(samples))
-
+    if not _seekable(stream):
+        samples = list(samples)
+        w.setnframes(sum(map(len, samples)))
+    for data in samples:
+        w.writeframesraw(data)
+    w.close()
@@ -3,18 +3,24 @@
     This has various options that attempt different interprations and analyses
     of CMT data at the various levels up to bytes: pulse widths/baud rates,
     mark/space, the bitstream, and then byte framing.
+
+    The mark and space baud rates, pulses per bit and tolerances not given
+    on the command line are inferred from the histogram of pulse widths
+    (see `cmtconv.analyze.infer_encoding()`); ``--infer`` reports this.
+    ``--window`` analyses just part of the recording.
 '''
 
-from    argparse import ArgumentParser
+from    argparse import ArgumentParser, ArgumentTypeError
 from    functools import partial
+from    io  import BytesIO
 from    itertools import chain
 import  math
-import  statistics
 import  sys
 import  wave
 
 from    cmtconv.analyze import *
 import  cmtconv.audio as au, cmtconv.logging as lg
+import  cmtconv.bytestream as bs
 
 parseint = partial(int, base=0)     # Parse an int recognizing 0xNN etc.
 
@@ -25,20 +31,31 @@ def parse_args():
         ''')
     a = p.add_argument
     a('-r', '--report-bauds', action='store_true' ) # count cycles per well-known baud rates
-    a(      '--baud', type=float, default=1200)
+    a(      '--baud', type=float, help=\
+        'base baud rate for -r and -l (default: the space baud rate)')
     a('-g', '--gradient-factor',type=float, default=0.5)
-    a('-t', '--tolerance',type=float, default=0.25)
+    a('-t', '--tolerance',type=float, help=\
+        'tolerance of pulse widths (default: inferred, or 0.25)')
+    a(      '--mark-tol', type=parse_tol, help=\
+        "LOWER,UPPER tolerance of mark pulse widths (overrides -t)")
+    a(      '--space-tol', type=parse_tol, help=\
+        "LOWER,UPPER tolerance of space pulse widths (overrides -t)")
+    a('-i', '--infer', action='store_true', help=\
+        'report the pulse width peaks and the encoding inferred from them')
+    a(      '--window', type=parse_window, help=\
+        "analyse only START:END seconds of the recording (either may be"
+        " omitted)")
     a('-d', '--dump-pulses', action='store_true')
     a('-l', '--pulse-length-stats', action='store_true')
     a('-b', '--bitstream', type=str, help=\
         "BITSTREAM='line' for one symbol per line; "
         "'char' for just the 0/1 symbols on one line")
     a('-B', '--bytes', action='store_true')
-    a('-m', '--mark-baud', type=int, default=2400)
-    a('--mark-pulses', type=int, default=2, help=\
+    a('-m', '--mark-baud', type=int)
+    a('--mark-pulses', type=int, help=\
         'number of mark-baud pulses for a single mark bit')
-    a('-s', '--space-baud', type=int, default=1200)
-    a('--space-pulses', type=int, default=2, help=\
+    a('-s', '--space-baud', type=int)
+    a('--space-pulses', type=int, help=\
         'number of space-baud pulses for a single space bit')
     a('--start', default='m')
     a('--stop', default='ss')
@@ -61,21 +78,68 @@ def parse_args():
     if args.output == '-':              args.output = sys.stdout.buffer
     elif args.output is not None:       args.output = open(args.output, 'bw')
 
-    def to_mark_space(s):
-        res = tuple()
-        for c in s:
-            if c == 'm': res += (1,)
-            elif c == 's': res += (0,)
-            else: raise ValueError('Start/stop bit must be \'m\' or \'s\'')
-        return res
+    return args
+
+def parse_tol(s):
+    ' Parse ``LOWER,UPPER`` tolerances. '
+    (lower, upper) = s.split(',')
+    return (float(lower), float(upper))
+
+def parse_window(s):
+    ''' Parse ``START:END`` seconds, returning ``(start, end)`` with `None`
+        for an omitted time.
+    '''
+    try:
+        (start, end) = s.split(':')
+        window = (float(start) if start else None,
+            float(end) if end else None)
+    except ValueError:
+        raise ArgumentTypeError('window must be START:END seconds')
+    if any( t is not None and t < 0 for t in window ):
+        raise ArgumentTypeError('window times must not be negative')
+    if None not in window and window[0] > window[1]:
+        raise ArgumentTypeError('window START must not be after END')
+    return window
+
+def to_mark_space(s):
+    res = tuple()
+    for c in s:
+        if c == 'm': res += (1,)
+        elif c == 's': res += (0,)
+        else: raise ValueError('Start/stop bit must be \'m\' or \'s\'')
+    return res
+
+#   Used for the parameters that are neither given nor inferred.
+DEFAULTS = dict(mark_baud=2400, mark_pulses=2, space_baud=1200,
+    space_pulses=2)
+TOLERANCE = 0.25
+
+def set_encoding(args, enc):
+    ''' Fill in the encoding parameters in `args` not given on the command
+        line from `cmtconv.analyze.Encoding` `enc` (if not `None`) or
+        `DEFAULTS`, and create the `PulseDecoder` and `Encoder` for them.
+    '''
+    for k, v in DEFAULTS.items():
+        if getattr(args, k) is None:
+            setattr(args, k, v if enc is None else getattr(enc, k))
+    if args.baud is None:
+        args.baud = args.space_baud
+    if args.tolerance is not None:
+        mark_tol = space_tol = (args.tolerance, args.tolerance)
+    elif enc is not None:
+        mark_tol, space_tol = enc.mark_tol, enc.space_tol
+    else:
+        mark_tol = space_tol = (TOLERANCE, TOLERANCE)
+    if args.tolerance is None:
+        args.tolerance = TOLERANCE
+    if args.mark_tol is not None:   mark_tol = args.mark_tol
+    if args.space_tol is not None:  space_tol = args.space_tol
 
-    # FIXME: tolerance
-    tol =  args.tolerance
     args.pulse_decoder = au.PulseDecoder(args.mark_baud, args.mark_pulses,
         args.space_baud, args.space_pulses,
         args.invert_bits, args.reverse_bits,
         to_mark_space(args.start), to_mark_space(args.stop),
-        (tol, tol), (tol, tol))
+        mark_tol, space_tol)
 
     args.pulse_encoder = au.Encoder(
         args.mark_baud, args.mark_pulses,
@@ -84,47 +148,32 @@ def parse_args():
         to_mark_space(args.start), to_mark_space(args.stop),
         )
 
-    return args
-
-def report_bauds(args, pulses):
+def report_inference(pw, enc, error):
+    ' Print the peaks of `PulseWidths` `pw` and the `Encoding` inferred. '
+    us = 1e6 * pw.sample_dur
+    print('{} pulses'.format(len(pw)))
+    print('{:>10} {:>8} {:>8} {:>19}'.format(
+        'Width us', 'Baud', 'Count', 'Range us'))
+    for p in find_peaks(pw.counts, smooth=smoothing(pw.sample_dur)):
+        print('{:>10.3f} {:>8.0f} {:>8} {:>9.3f}-{:<9.3f}'.format(
+            p.width * us, 0.5 / (p.width * pw.sample_dur), p.count,
+            p.lower * us, p.upper * us))
+    if enc is None:
+        print('No encoding inferred: {}'.format(error))
+        return
+    print('Mark:  {} baud, {} pulses per bit, tolerance {},{}'.format(
+        enc.mark_baud, enc.mark_pulses, *enc.mark_tol))
+    print('Space: {} baud, {} pulses per bit, tolerance {},{}'.format(
+        enc.space_baud, enc.space_pulses, *enc.space_tol))
+    print('Options: -m {} --mark-pulses {} -s {} --space-pulses {}'
+        ' --mark-tol {},{} --space-tol {},{}'.format(
+        enc.mark_baud, enc.mark_pulses, enc.space_baud, enc.space_pulses,
+        *(enc.mark_tol + enc.space_tol)))
+
+def report_bauds(args, pw):
     bauds = list(reversed(sorted(
         baud_rates(args.baud) + baud_rates(args.baud * 1.5))))
-    tol = args.tolerance
-    durs = [ (  b,
-                (1.0 + math.log(1.0 - tol)) * 0.5/b,
-                (1.0 + math.log(1.0 + tol)) * 0.5/b
-            ) for b in bauds ]
-    buckets = dict( (b, []) for b in bauds )
-    buckets['low'] = []
-    buckets['high'] = []
-    buckets['unknown'] = []
-
-    # classify each pulse width and add to relevant bucket
-    for (_,_, dur) in pulses:
-        if dur < durs[0][1]:
-            buckets['low'].append(dur)
-        elif dur > durs[-1][2]:
-            buckets['high'].append(dur)
-        else:
-            found = False
-            for (b,l,h) in durs:
-                if dur >= l and dur <= h:
-                    buckets[b].append(dur)
-                    found = True
-                    break
-            if not found:
-                buckets['unknown'].append(dur)
-    # calc stats
-    def calc_stats(ws):
-        c = len(ws)
-        if c > 1:
-            return (c, statistics.mean(ws), statistics.stdev(ws))
-        elif c > 0:
-            return (c, statistics.mean(ws), None)
-        else:
-            return (c, None, None)
-
-    stats = { k : calc_stats(ws) for k, ws in buckets.items() }
+    stats = baud_stats(pw.counts, pw.sample_dur, bauds, args.tolerance)
 
     def width(baud):
         try:
@@ -170,32 +219,14 @@ def dump_pulses(args, pulses):
         idx += 1
 
 
-def dump_pulse_length_stats(args, pulses):
+def dump_pulse_length_stats(args, pw):
     # Create histogram for run lengths
-    buckets = dict( (i, 0) for i in range(0,33) )
-    buckets['>'] = 0
-
     b = args.baud
-    tol = args.tolerance
-    low = (1.0 + math.log(1.0 - tol)) * 0.5/b
-    high = (1.0 + math.log(1.0 + tol)) * 0.5/b
-    idx = 0
-    n = len(pulses)
-    while idx < n:
-        dur = pulses[idx][2]
-        if dur >= low and dur <= high:
-            c = 0
-            while idx < n and dur >= low and dur <= high:
-                c += 1
-                idx += 1
-                if idx < n:
-                    dur = pulses[idx][2]
-            if c > 32:
-                buckets['>'] += 1
-            else:
-                buckets[c] += 1
-        else:
-            idx += 1
+    [(_, low, high)] = bucket_limits([b], args.tolerance)
+    sd = pw.sample_dur
+    runs = run_lengths(pw.widths, math.ceil(low / sd), math.floor(high / sd))
+    buckets = dict( (i, runs[i]) for i in range(0,33) )
+    buckets['>'] = sum( c for l, c in runs.items() if l > 32 )
 
     # Report
     print('Run lengths for baud {}'.format(b))
@@ -333,32 +364,57 @@ def save_wav(args, pulses, sample_dur):
     w.setframerate(44100)
     w.writeframes(bytes(samples))
 
+def read_pulses(args, w):
+    ''' Generate the click-filtered `Pulses` of `wave.Wave_read` `w`, or
+        just of ``args.window``.
+    '''
+    if args.window is None and not bs._seekable(args.input):
+        sample_dur = 1.0 / w.getframerate()
+        return au.iter_filter_clicks(
+            au.wav_pulses(w, args.gradient_factor, rewind=False),
+            sample_dur, au.click_tol(sample_dur))
+    (start, end) = args.window or (None, None)
+    rate = w.getframerate()
+    return window_pulses(w, args.gradient_factor,
+        0 if start is None else round(start * rate),
+        None if end is None else round(end * rate))
+
 def main():
     args = parse_args()
     print(args)
+    #   Only these need the pulses themselves rather than their widths.
+    keep = args.dump_pulses or args.bitstream or args.bytes \
+        or args.to_pulses or args.save_wav
     if args.from_pulses:
-        pulses = load_pulses(args)
         sample_dur = 1.0 / 44100.0
+        pulses = au.Pulses.of(load_pulses(args), sample_dur)
+        pw = PulseWidths.of([pulses], sample_dur)
     else:
+        if args.window is not None and not bs._seekable(args.input):
+            args.input = BytesIO(args.input.read())
         w = wave.open(args.input, 'rb')
-        if w.getnchannels() != 1 or w.getsampwidth() != 1:
-            raise ValueError('Only mono 8-bit wav files are supported')
-        rate = w.getframerate()
-        n_samples = w.getnframes()
-        samples = w.readframes(n_samples)
-        sample_dur = 1.0 / rate
-        #pulses = au.samples_to_pulses(samples, sample_dur)
-        pulses = au.samples_to_pulses_via_edge_detection(
-            samples, sample_dur, args.gradient_factor)
-        pulses = au.filter_clicks(pulses, sample_dur)
+        sample_dur = 1.0 / w.getframerate()
+        pw = PulseWidths(sample_dur)
+        pulses = au.Pulses(sample_dur) if keep else None
+        for chunk in read_pulses(args, w):
+            pw.add(chunk)
+            if keep:
+                pulses.extend(chunk)
         if args.to_pulses:
             save_pulses(args, pulses, sample_dur)
+    try:
+        enc, error = infer_encoding(pw), None
+    except ValueError as ex:
+        enc, error = None, ex
+    set_encoding(args, enc)
+    if args.infer:
+        report_inference(pw, enc, error)
     if args.report_bauds:
-        report_bauds(args, pulses)
+        report_bauds(args, pw)
     if args.dump_pulses:
         dump_pulses(args, pulses)
     if args.pulse_length_stats:
-        dump_pulse_length_stats(args, pulses)
+        dump_pulse_length_stats(args, pw)
     if args.bitstream:
         dump_bitstream(args, pulses)
     if args.bytes:
@@ -1,13 +1,44 @@
+''' Convert computer audio tape saves between various formats.
+
+    In batch mode (``-b``) many inputs, given as files, directories or
+    glob patterns, are converted (or just read, to validate them) in
+    parallel. Output paths are generated from a template, outputs newer
+    than their input are not regenerated, and the result for each input
+    may be written to a JSONL summary file.
+
+    With ``-A``, WAV input is decoded with a range of decoding parameters
+    and the best result is used; see `cmtconv.autodecode`.
+
+    ``--index`` lists every file and block on a WAV recording, saving the
+    index in a sidecar file, and ``-n`` reads a single file from it by
+    decoding only its part of the recording; see `cmtconv.tapeindex`.
+
+    With ``-p auto`` the platform of WAV input is detected from the start
+    of the recording; see `cmtconv.detect`.
+'''
+
 from    site  import addsitedir
 from    argparse import ArgumentParser
 from    functools import partial
+from    glob  import glob, has_magic
+from    hashlib  import sha256
+from    io  import BytesIO
+import  json
 import  sys, os
 
+from    binary.parallel  import pmap
+from    cmtconv.audio  import ReadError
+import  cmtconv.autodecode as ad
+import  cmtconv.detect as dt
+import  cmtconv.tapeindex as ti
+import  cmtconv.bytestream as bs
 import  cmtconv.formats as fm, cmtconv.logging as lg
 
 
 parseint = partial(int, base=0)     # Parse an int recognizing 0xNN etc.
 
+WAV_OPTIONS_ERROR = '-r, --sample-width and --channels need WAV output'
+
 def parse_args():
     p = ArgumentParser(description='''
             Convert computer audio tape saves between various formats.''',
@@ -18,7 +49,7 @@ def parse_args():
     a = p.add_argument
 
     a('-p', '--platform', metavar='P', default='JR-200',
-        help="default 'JR-200'")
+        help="default 'JR-200'; 'auto' to detect it from WAV input")
     a('-i', '--input-format', metavar='FMT')
     a('-o', '--output-format', metavar='FMT')
     a('-f', '--filename', metavar='FN', help='filename to store in tape data')
@@ -26,10 +57,47 @@ def parse_args():
         help='load address to store in tape data')
     a('-t', '--filetype', metavar='TYPE', default=None,
         help='file type: BASIC or BINARY')
+    a('-r', '--rate', metavar='HZ', type=int,
+        help='WAV output sample rate (default: lowest suited to platform)')
+    a('--sample-width', metavar='N', type=int, dest='sampwidth',
+        choices=(1, 2, 3, 4), help='WAV output bytes per sample (default 1)')
+    a('--channels', metavar='N', type=int, dest='nchannels',
+        help='WAV output channels (default 1)')
     a('-v', '--verbose', action='count', default=0)
+    a('-A', '--auto', action='store_true',
+        help='decode WAV input with a range of decoding parameters in'
+            ' parallel and use the best result')
+    a('--merge', action='store_true',
+        help='with -A, if no parameters decode the whole file, try to'
+            ' merge the good blocks from all attempts')
+
+    a('--index', action='store_true',
+        help='list the files and blocks on WAV input, using or writing'
+            ' its sidecar index file (INPUT' + ti.SUFFIX + ')')
+    a('-n', '--file', metavar='N', type=int, dest='fileno',
+        help='read only file N (from 0) of a WAV input with several files,'
+            ' using its sidecar index')
+
+    a('-b', '--batch', action='store_true',
+        help='batch mode: all FILEs are inputs (files, directories or glob'
+            ' patterns); outputs are named by --output-template')
+    a('-O', '--output-template', metavar='TMPL',
+        help='batch mode: output path template with fields {dir}, {stem},'
+            ' {name}, {ext} (of the input) and {format} (of the output);'
+            ' default {dir}/{stem}.{format} if -o is given, otherwise'
+            ' inputs are only read')
+    a('-s', '--summary', metavar='FILE',
+        help="batch mode: write a JSON line per input to FILE ('-' for"
+            " stdout)")
+    a('-j', '--jobs', metavar='N', type=int,
+        help='batch mode or -A: number of parallel processes (default: CPU'
+            ' count)')
+    a('--force', action='store_true',
+        help='batch mode: regenerate output files even if up to date')
 
-    a('input', help="input file ('-' for stdin)")
-    a('output', nargs='?', help="output file ('-' for stdout)")
+    a('files', nargs='+', metavar='FILE',
+        help="input file ('-' for stdin) and optional output file ('-' for"
+            " stdout); with -b, inputs")
 
     args = p.parse_args()
     lg.set_verbosity(args.verbose)
@@ -40,9 +108,27 @@ def parse_args():
     for argname in ('filename', 'loadaddr', 'filetype'):
         val = getattr(args, argname)
         if val is not None: args.reader_optargs[argname] = val
+    args.writer_optargs = {}
+    for argname in ('rate', 'sampwidth', 'nchannels'):
+        val = getattr(args, argname)
+        if val is not None: args.writer_optargs[argname] = val
+
+    if args.batch:
+        return args
+    if len(args.files) > 2:
+        p.error('at most one input and one output file (or use -b)')
+    args.input, args.output = (args.files + [None])[:2]
 
     args.input_format  = fm.guess_format(args.input_format, args.input)
     args.output_format = fm.guess_format(args.output_format, args.output)
+    if args.writer_optargs and args.output_format != 'wav':
+        p.error(WAV_OPTIONS_ERROR)
+    if args.index or args.fileno is not None:
+        if args.input == '-' or args.input_format != 'wav':
+            p.error('--index and -n need a WAV input file')
+    if args.platform == 'auto' and args.input_format != 'wav':
+        p.error('-p auto needs WAV input')
+    args.inpath = args.input
 
     #   You'd think we could use FileType, but in Python 3.5 even if
     #   you give it mode 'b', it still uses stdin/stdout as text.
@@ -69,10 +155,231 @@ def get_rwfunc(format, io):
 
 def main():
     args = parse_args()
-    reader = get_rwfunc(args.input_format, 'input')
-    blocks = reader(args.platform, args.input, **args.reader_optargs)
+    if args.batch:
+        exit(main_batch(args))
+    if args.platform == 'auto':
+        if not bs._seekable(args.input):
+            args.input = BytesIO(args.input.read())
+        try:
+            args.platform = dt.detect_platform(args.input)
+        except ReadError as ex:
+            print(f'cmtconv: {ex}', file=sys.stderr)
+            exit(1)
+        args.input.seek(0)
+        print(f'cmtconv: detected platform {args.platform}', file=sys.stderr)
+    if args.index:
+        index = ti.load_or_index(args.inpath, args.platform)
+        print_index(index)
+        return
+    if args.fileno is not None:
+        index = ti.load_or_index(args.inpath, args.platform)
+        blocks = ti.read_file(args.input, index, args.fileno)
+    elif args.auto and args.input_format == 'wav':
+        blocks, params = ad.decode_best(args.platform, args.input,
+            jobs=args.jobs, merge=args.merge)
+        print('cmtconv: decoded with {}'.format('merged blocks'
+            if params is None else ad.format_params(params)), file=sys.stderr)
+    else:
+        reader = get_rwfunc(args.input_format, 'input')
+        blocks = reader(args.platform, args.input, **args.reader_optargs)
 
     if args.output is not None:
         writer = get_rwfunc(args.output_format, 'output')
-        writer(args.platform, blocks, args.output)
+        writer(args.platform, blocks, args.output, **args.writer_optargs)
         #   XXX relies on exit() to close files
+
+def print_index(index, file=sys.stdout):
+    ' Print a line for each entry of `cmtconv.tapeindex.TapeIndex` `index`. '
+    for e in index.entries:
+        print('{:3d} {:9.3f} {:9.3f}  {:16} {:>4} {!r:18} {}'.format(e.file,
+            e.start / index.rate, e.end / index.rate, e.kind or '-',
+            '-' if e.blockno is None else e.blockno, e.filename, e.status),
+            file=file)
+
+def main_batch(args):
+    template = args.output_template
+    outformat = args.output_format
+    if template is None and outformat is not None:
+        template = os.path.join('{dir}', '{stem}.{format}')
+    if template is not None and outformat is None:
+        outformat = fm.guess_format(None, template)
+        if outformat is None:
+            print('cmtconv: cannot guess output format from template'
+                f' {template!r}; use -o', file=sys.stderr)
+            return 2
+    if args.writer_optargs and outformat not in (None, 'wav'):
+        print('cmtconv: ' + WAV_OPTIONS_ERROR, file=sys.stderr)
+        return 2
+
+    inputs = batch_inputs(args.files, args.input_format or 'wav')
+    summary = None
+    if args.summary == '-':             summary = sys.stdout
+    elif args.summary is not None:      summary = open(args.summary, 'w')
+
+    exitcode = 0
+    for r in batch(inputs, args.platform, args.input_format, outformat,
+            template, force=args.force, jobs=args.jobs, auto=args.auto,
+            merge=args.merge, reader_optargs=args.reader_optargs,
+            writer_optargs=args.writer_optargs):
+        if summary is not None:
+            print(json.dumps(r), file=summary, flush=True)
+        if r['status'] == 'error':
+            print(f"cmtconv: {r['input']}: {r['error']}", file=sys.stderr)
+            exitcode = 1
+        elif args.verbose:
+            print(f"{r['status']}: {r['output'] or r['input']}",
+                file=sys.stderr)
+    if summary not in (None, sys.stdout):
+        summary.close()
+    return exitcode
+
+####################################################################
+#   Batch mode
+
+def batch_inputs(specs, dirformat='wav'):
+    ''' Return the list of input files given by `specs`, each of which
+        may be a file, a glob pattern, or a directory. Directories are
+        searched recursively for files of format `dirformat`, as guessed
+        from their extension. The files are in the order given (sorted
+        within each glob or directory), without duplicates.
+    '''
+    def format(file):
+        ext = os.path.splitext(file)[1][1:]
+        return fm.FORMAT_ALIASES.get(ext, ext)
+
+    paths = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            paths += sorted( os.path.join(dir, f)
+                for dir, _, files in os.walk(spec)
+                for f in files if format(f) == dirformat )
+        elif has_magic(spec):
+            paths += sorted(glob(spec, recursive=True))
+        else:
+            paths.append(spec)
+    return list(dict.fromkeys(paths))
+
+def outpath(input, template, format):
+    ''' Return the output path for `input` given by `template`, a
+        `str.format()` template with fields ``{dir}``, ``{stem}``,
+        ``{name}`` and ``{ext}`` (without the leading dot) from the input
+        path and ``{format}`` for the output format.
+    '''
+    dir, name = os.path.split(input)
+    stem, ext = os.path.splitext(name)
+    return template.format(dir=dir or '.', stem=stem, name=name,
+        ext=ext[1:], format=format)
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def convert_file(input, platform, informat=None, outformat=None,
+        template=None, force=False, auto=False, merge=False,
+        reader_optargs={}, writer_optargs={}):
+    ''' Read tape file `input` for `platform` in format `informat`
+        (guessed from the extension if `None`) and, if `template` is
+        given, write it in `outformat` to the path given by `outpath()`.
+        An output newer than its input is not regenerated unless `force`
+        is set. Outputs are written to a temporary file and renamed, so
+        a failed conversion never leaves an up-to-date output.
+
+        If `platform` is ``auto``, the platform of WAV input is found
+        with `cmtconv.detect.detect_platform()`.
+
+        If `auto` is set, WAV input is decoded with
+        `cmtconv.autodecode.decode_best()` (passing `merge`), serially
+        in this process.
+
+        Returns a `dict` summarising the result, with keys:
+        - ``input``, ``output``: the paths (``output`` is `None` if the
+          input was only read).
+        - ``status``: ``read``, ``written``, ``uptodate`` or ``error``.
+        - ``error``: the error message, if any.
+        - ``blocks``, ``size``, ``sha256``: the number of blocks read, and
+          the length and SHA-256 hash of the file data in them.
+        - ``checksums``: ``ok`` if the blocks were read from a tape image
+          (``wav`` or ``cas``) and so had their checksums verified,
+          ``bad`` if reading failed with a checksum error, otherwise
+          `None`.
+        - ``params``: with `auto`, the decoding parameters used, or
+          ``merged`` if the blocks were merged from several attempts.
+        - ``platform``: the platform detected, if `platform` is ``auto``.
+
+        Errors are returned rather than raised, so that one bad tape does
+        not stop a batch.
+    '''
+    informat = fm.guess_format(informat, input)
+    output = None if template is None else outpath(input, template, outformat)
+    r = { 'input': input, 'output': output, 'status': None,
+        'blocks': None, 'size': None, 'sha256': None, 'checksums': None }
+    if output is not None and not force:
+        outmtime = _mtime(output)
+        if outmtime is not None and outmtime > (_mtime(input) or 0):
+            r['status'] = 'uptodate'
+            return r
+    try:
+        rwfuncs = fm.FORMATS.get(informat)
+        if rwfuncs is None or rwfuncs[0] is None:
+            raise ValueError(f'unknown input format: {informat}')
+        with open(input, 'rb') as f:
+            if platform == 'auto' and informat == 'wav':
+                platform = r['platform'] = dt.detect_platform(f)
+                f.seek(0)
+            if auto and informat == 'wav':
+                blocks, params = ad.decode_best(platform, f, jobs=1,
+                    merge=merge)
+                r['params'] = 'merged' if params is None else params
+            else:
+                blocks = rwfuncs[0](platform, f, **reader_optargs)
+        data = BytesIO()
+        bs.write_file_bytestream(platform, blocks, data)
+        r.update(blocks=len(blocks), size=len(data.getvalue()),
+            sha256=sha256(data.getvalue()).hexdigest())
+        if informat in ('wav', 'cas'):
+            r['checksums'] = 'ok'
+        if output is None:
+            r['status'] = 'read'
+            return r
+        rwfuncs = fm.FORMATS.get(outformat)
+        if rwfuncs is None or rwfuncs[1] is None:
+            raise ValueError(f'unknown output format: {outformat}')
+        if os.path.exists(output) and os.path.samefile(output, input):
+            raise ValueError('output would overwrite input')
+        if os.path.dirname(output):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+        tmp = output + '.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                rwfuncs[1](platform, blocks, f, **writer_optargs)
+            os.replace(tmp, output)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        r['status'] = 'written'
+    except Exception as ex:
+        #   Decoding a bad tape can fail in many ways (`ReadError`,
+        #   `IndexError` at end of input, `wave.Error`, etc.).
+        r['status'] = 'error'
+        r['error'] = f'{type(ex).__name__}: {ex}'
+        if type(ex).__name__ == 'ChecksumError':
+            r['checksums'] = 'bad'
+    return r
+
+def batch(inputs, platform, informat=None, outformat=None, template=None,
+        force=False, jobs=None, auto=False, merge=False,
+        reader_optargs={}, writer_optargs={}):
+    ''' Generate the results of `convert_file()` on each of `inputs`, in
+        the same order.
+
+        The conversions are run in parallel by `pmap()` with `jobs`
+        processes.
+    '''
+    f = partial(convert_file, platform=platform, informat=informat,
+        outformat=outformat, template=template, force=force, auto=auto,
+        merge=merge, reader_optargs=reader_optargs,
+        writer_optargs=writer_optargs)
+    yield from pmap(f, inputs, jobs, ad.init_worker,
+        (platform, lg.get_verbosity()))
@@ -0,0 +1,157 @@
+''' Detect the platform of a tape recording.
+
+    `detect()` decodes only the start of a WAV recording (`PREFIX_SECONDS`)
+    into pulses, once for each edge detection gradient the platforms use,
+    and runs each platform's recognizer, ``FileReader.read_header()``
+    (leader, first block, magic numbers and checksum), against those
+    shared pulses. A platform whose header block is read successfully is
+    a match. If nothing matches, a longer start of the recording (up to
+    `MAX_PREFIX_SECONDS`) is decoded and tried again.
+
+    Each `Candidate` also gives the fraction of the pulses that have the
+    width of one of the platform's mark or space pulses, which ranks the
+    matches and, for a recording that no platform recognises, gives the
+    closest candidates.
+'''
+
+from    collections  import namedtuple
+import  wave
+
+from    cmtconv.audio  import SampleStats, PulseStream, ReadError, \
+    wav_samples, numpy
+from    cmtconv.autodecode  import decoders, pulse_stream
+from    cmtconv.bytestream  import PLATFORMS, get_block_module
+from    cmtconv.logging  import *
+
+PREFIX_SECONDS = 8
+''' Length of the start of a recording first decoded to find the platform.
+    This is enough for the leader and header of all the platforms as
+    written by `blocks_to_audio()`; the MB-6885's, the longest, ends
+    after about 6.3 seconds.
+'''
+
+MAX_PREFIX_SECONDS = 32
+''' The longest start of a recording decoded, four times `PREFIX_SECONDS`,
+    for recordings with a longer silence or leader before the header.
+'''
+
+TRIES = 8
+''' The number of times a platform's recognizer is run, each starting
+    after the point where the previous attempt failed, before giving up.
+'''
+
+Candidate = namedtuple('Candidate', 'platform ok header fit error')
+Candidate.__doc__ = \
+    ''' The result of recognizing `platform`: `ok` is true if its header
+        block, `header`, was read, otherwise `error` is the last error.
+        `fit` is the fraction of the pulses whose widths fit the
+        platform's mark and space pulses.
+    '''
+
+def read_prefixes(stream, seconds=PREFIX_SECONDS,
+        maxseconds=MAX_PREFIX_SECONDS):
+    ''' Generate the sample duration and the samples of the first `seconds`
+        of WAV file `stream` (see `cmtconv.audio.wav_samples()`), and then
+        of four times as much each time the next is requested, up to
+        `maxseconds` or the end of the file. Only the frames returned are
+        read from `stream`.
+    '''
+    w = wave.open(stream, 'rb')
+    sample_dur = 1.0 / w.getframerate()
+    data = b''
+    while True:
+        data += w.readframes(round(seconds / sample_dur) - w.tell())
+        yield sample_dur, wav_samples(data, w.getsampwidth(), w.getnchannels())
+        if seconds >= maxseconds or w.tell() >= w.getnframes():
+            return
+        seconds = min(seconds * 4, maxseconds)
+
+def fit(pulses, pds):
+    ''' Return the fraction of `Pulses` `pulses` classified as a mark or
+        space by any of the `PulseDecoder`s `pds`.
+    '''
+    if len(pulses) == 0:
+        return 0.0
+    ok = None
+    for pd in pds:
+        _, lim = pd._widths(pulses)
+        ranges = ((lim.mark_lower, lim.mark_upper),
+            (lim.space_lower, lim.space_upper))
+        if numpy is not None:
+            w = pulses.view(pulses.widths)
+            for lo, hi in ranges:
+                m = (w >= lo) & (w <= hi)
+                ok = m if ok is None else ok | m
+        else:
+            m = [ any( lo <= w <= hi for lo, hi in ranges )
+                for w in pulses.widths ]
+            ok = m if ok is None else list(map(max, ok, m))
+    return int(sum(ok)) / len(pulses)
+
+def recognize(platform, pulses, tries=TRIES):
+    ''' Run the header recognizer of `platform` on `Pulses` `pulses`, up
+        to `tries` times, and return a `Candidate`.
+    '''
+    fr = get_block_module(platform).FileReader()
+    f = fit(pulses, decoders(fr))
+    ps = PulseStream([pulses], pulses.sample_dur)
+    i, error = 0, 'no pulses'
+    for _ in range(tries):
+        if i >= len(ps):
+            break
+        try:
+            (_, header) = fr.read_header(ps, i)
+            return Candidate(platform, True, header, f, None)
+        except Exception as ex:
+            #   Reading the wrong platform can fail in many ways.
+            error = '{}: {}'.format(type(ex).__name__, ex)
+        i = max(i + 1, ps.highest + 1)
+    return Candidate(platform, False, None, f, error)
+
+def detect(stream, platforms=PLATFORMS, seconds=PREFIX_SECONDS,
+        maxseconds=MAX_PREFIX_SECONDS):
+    ''' Return a list of `Candidate`s for each of `platforms` from the
+        first `seconds` of WAV file `stream`, best first: those that
+        matched, and then by the fit of the pulse widths. If none matched,
+        longer starts of the recording, up to `maxseconds`, are tried
+        (see `read_prefixes()`).
+    '''
+    for sample_dur, samples in read_prefixes(stream, seconds, maxseconds):
+        results = candidates(samples, sample_dur, platforms)
+        if any( c.ok for c in results ):
+            break
+    return results
+
+def candidates(samples, sample_dur, platforms=PLATFORMS):
+    ''' Return a list of `Candidate`s for each of `platforms` from
+        `samples`, best first, as `detect()` does.
+    '''
+    st = SampleStats()
+    st.add(samples)
+    (mean, stdev) = st.stats()
+    shared = {}
+    results = []
+    for platform in platforms:
+        bm = get_block_module(platform)
+        gf = bm.parameters().get('edge_gradient_factor', 0.5)
+        if gf not in shared:
+            #   Read all the pulses into a `Pulses`.
+            shared[gf] = pulse_stream(bm, [samples], sample_dur, mean,
+                stdev, {})[0:]
+        c = recognize(platform, shared[gf])
+        v1('{}: fit {:.2f}, {}', platform, c.fit,
+            type(c.header).__name__ if c.ok else c.error)
+        results.append(c)
+    return sorted(results, key=lambda c: (c.ok, c.fit), reverse=True)
+
+def detect_platform(stream, platforms=PLATFORMS, seconds=PREFIX_SECONDS,
+        maxseconds=MAX_PREFIX_SECONDS):
+    ''' Return the name of the platform of the WAV recording `stream`, as
+        found by `detect()`. Raises `ReadError` giving the closest
+        candidates if no platform is recognized.
+    '''
+    results = detect(stream, platforms, seconds, maxseconds)
+    if results and results[0].ok:
+        return results[0].platform
+    raise ReadError('unknown platform; closest: ' + ', '.join(
+        '{} (fit {:.0%})'.format(c.platform, c.fit) for c in results[:3] ))
@@ -16,7 +16,7 @@ FORMATS = {
              bs.write_block_bytestream, # (platform, blocks, stream)
         ),
     'wav': ( bs.blocks_from_audio,      # (platform, stream)
-             bs.blocks_to_audio,        # (platform, blocks, stream)
+             bs.blocks_to_audio,        # (platform, blocks, stream, rate, …)
         ),
     #   Macroassembler AS (ASL) object file format.
     'asl': ( bs.blocks_from_asl,        # (platform, stream, filename)
@@ -73,6 +73,11 @@ def set_verbosity(n):
     l = get_cmtconv_logger()
     l.setLevel(ZERO_VERBOSITY_LOG_LEVEL - n)
 
+def get_verbosity():
+    ' Return the global verbosity level, from 0 to 4. '
+    l = get_cmtconv_logger()
+    return min(4, max(0, ZERO_VERBOSITY_LOG_LEVEL - l.level))
+
 ####################################################################
 
 #   Verbosity is the inverse of logging level: higher verbosity levels
@@ -320,6 +320,16 @@ class FileReader(object):
             block.setdata(bs, checksum)
         return (i_next, block)
 
+    def read_header(self, pulses, i_next):
+        ''' Read the first block of a file, which must be a header block,
+            returning ``(i_next, block)``.
+        '''
+        (i_next, block) = self.read_block(pulses, i_next)
+        if not isinstance(block, HeaderBlock):
+            raise ValueError('Expected header block, got: {}'
+                .format(type(block).__name__))
+        return (i_next, block)
+
     # returns ( int, ( block, ) )
     def read_blocks(self, pulses, i_next):
         #i_next = self.read_leader(pulses, i_next)
@@ -410,22 +420,22 @@ class FileEncoder(object):
         self.encoder = Encoder(1100, 2, 2200, 2, False, True, (0,), (1,1))
 
         # long lead in for header and first data block
-        self.long_lead_in = self.encoder.encode_bytes( (0xff,) * 255 )
+        self.long_lead_in = self.encoder.encoded( (0xff,) * 255 )
 
         # Lead-in
-        self.lead_in = self.encoder.encode_bytes( (0xff,) * 10 )
+        self.lead_in = self.encoder.encoded( (0xff,) * 10 )
 
         # Lead-out
-        self.lead_out = self.encoder.encode_bytes( (0xff,) * 4 )
+        self.lead_out = self.encoder.encoded( (0xff,) * 4 )
 
     def encode_block(self, blk, long_leader = False):
         res = []
         if long_leader:
-            res.extend(self.long_lead_in)
+            res.append(self.long_lead_in)
         else:
-            res.extend(self.lead_in)
-        res.extend(self.encoder.encode_bytes(blk.to_bytes()))
-        res.extend(self.lead_out)
+            res.append(self.lead_in)
+        res.append(self.encoder.encoded(blk.to_bytes()))
+        res.append(self.lead_out)
         return (sound(res), silence(.01))
 
     def encode_blocks(self, blocks):
@@ -24,7 +24,7 @@
 from    enum  import IntEnum
 from    cmtconv.logging  import *
 from    cmtconv.bytestream  import native_filename
-from    cmtconv.audio  import PulseDecoder, Encoder, silence, sound
+from    cmtconv.audio  import PulseDecoder, Encoder, ReadError, silence, sound
 
 ####################################################################
 #   Tape Blocks
@@ -386,6 +386,11 @@ def blocks_from_bin(stream, loadaddr=0x0000, filename=None):
 ####################################################################
 # FileReader
 
+def start_time(pulses, i):
+    ' The time in seconds of the start of pulse `i`. '
+    (t, _, dur) = pulses[i]
+    return t - dur
+
 class FileReader(object):
     def __init__(self):
         start_bits = (1,)
@@ -394,11 +399,25 @@ class FileReader(object):
             True, True, start_bits, stop_bits)
         self.baud2400_decoder = PulseDecoder(2400, 2, 1200, 1,
             True, True, start_bits, stop_bits)
+        #   Blocks read so far by `read_file()`, kept if it fails, and
+        #   the start (of the leader) and end times in seconds of each in
+        #   the recording.
+        self.blocks = []
+        self.spans = []
+        #   Start time and exception for each bad block skipped.
+        self.errors = []
+        #   Index of the first pulse of the last leader found.
+        self.i_leader = None
+        #   If set, `read_blocks()` skips to the next block after a bad
+        #   one, raising the error only after reading the EOF block, so
+        #   that `blocks` has all the good blocks. (See `merge_blocks()`.)
+        self.skip_bad_blocks = False
 
     # Read a number of space pulse up to the mark for the start-bit of the
     # first byte
     def read_leader(self, pulses, i_next):
         i_next = self.baud600_decoder.next_space(pulses, i_next, 100)
+        self.i_leader = i_next
         #i_next = next_space(pulses, i_next, 100)
         v3('Leader pulses detected at %d - %fs (%s)' %
               (i_next, pulses[i_next][0], str(pulses[i_next][1])))
@@ -423,6 +442,9 @@ class FileReader(object):
         v3('i_next: %d( %f )' % (i_next, pulses[i_next][0]))
         return (i_next, hdr)
 
+    #   The first block of a file, used by `cmtconv.detect`.
+    read_header = read_file_header
+
     def read_block(self, bit_decoder, pulses, i_next):
         i_next = self.read_leader(pulses, i_next)
         (i_next, header) = bit_decoder.read_bytes(pulses, i_next, Block.headerlen)
@@ -455,24 +477,49 @@ class FileReader(object):
     # returns ( int, ( block, ) )
     def read_blocks(self, bit_decoder, pulses, i_next):
         blocks = []
+        errors = []
         while True:
-            (i_next, blk) = self.read_block(bit_decoder, pulses, i_next)
+            try:
+                (i_next, blk) = self.read_block(bit_decoder, pulses, i_next)
+            except (ReadError, ValueError) as ex:
+                if not self.skip_bad_blocks:
+                    raise
+                v1('skipping bad block at {}: {}', i_next, ex)
+                errors.append(ex)
+                self.errors.append((start_time(pulses, self.i_leader), ex))
+                #   Past this block's leader; the next read_leader()
+                #   will find the following block.
+                i_next = self.read_leader(pulses, i_next)
+                continue
             blocks.append(blk)
+            self.blocks.append(blk)
+            self.spans.append(
+                (start_time(pulses, self.i_leader), pulses[i_next-1][0]))
             v3('read_blocks:', blk)
             if blk.is_eof:
                 break
+        if errors:
+            raise errors[0]
         return (i_next, tuple(blocks))
 
     # read a file header and all blocks
     # returns ( int, ( block, ) )
     def read_file(self, pulses, i_next):
+        self.blocks, self.spans, self.errors = [], [], []
         (i_next, file_hdr) = self.read_file_header(pulses, i_next)
+        self.blocks.append(file_hdr)
+        self.spans.append(
+            (start_time(pulses, self.i_leader), pulses[i_next-1][0]))
+        (i_next, blocks) = self.read_blocks(
+            self.bit_decoder(file_hdr), pulses, i_next)
+        return (i_next, (file_hdr,) + blocks)
+
+    def bit_decoder(self, file_hdr):
+        ' The `PulseDecoder` for the data blocks of the file `file_hdr`. '
         if file_hdr.baudrate == file_hdr.B_2400:
-            bit_decoder = self.baud2400_decoder
+            return self.baud2400_decoder
         else:
-            bit_decoder = self.baud600_decoder
-        (i_next, blocks) = self.read_blocks(bit_decoder, pulses, i_next)
-        return (i_next, (file_hdr,) + blocks)
+            return self.baud600_decoder
 
     # FIXME: read_files - return ( File, )
 
@@ -498,16 +545,16 @@ class FileEncoder(object):
         #leader_pulses = self.leader(2400) # Measured from actual recording
         leader_pulses = self.leader(1600) # Shorter leader works OK
         v3(' '.join(hex(x) for x in file_hdr.to_bytes()))
-        header_pulses = self.baud600_encoder.encode_bytes(file_hdr.to_bytes())
-        return (silence(1.0), sound(leader_pulses + header_pulses))
+        header_pulses = self.baud600_encoder.encoded(file_hdr.to_bytes())
+        return (silence(1.0), sound(leader_pulses + [header_pulses]))
 
     def block(self, encoder, blk):
         # silence, leader, header, data
         leader_pulses = self.leader(200) # measured from actual recording
         data = blk.to_bytes()
         v3('len={}: {}', len(data), ' '.join(hex(x) for x in data))
-        data_pulses = encoder.encode_bytes(data)
-        return (sound(leader_pulses + data_pulses),)
+        data_pulses = encoder.encoded(data)
+        return (sound(leader_pulses + [data_pulses]),)
 
     def blocks(self, encoder, blocks):
         pulses = ()
@@ -524,3 +571,28 @@ class FileEncoder(object):
 
 def parameters():
     return dict()
+
+def merge_blocks(attempts):
+    ''' Merge the blocks read from the same file by several `attempts`,
+        each a sequence of blocks that may be incomplete (e.g., from
+        `FileReader.blocks` after a read error), into a complete file.
+
+        The first file header, EOF block and data block of each number
+        found are used. Raises a `ValueError` if these do not make up a
+        complete file.
+    '''
+    header, eof, data = None, None, {}
+    for blocks in attempts:
+        for b in blocks:
+            if isinstance(b, FileHeader):   header = header or b
+            elif b.is_eof:                  eof = eof or b
+            else:                           data.setdefault(b.blockno, b)
+    if header is None:
+        raise ValueError('no file header block')
+    if eof is None:
+        raise ValueError('no EOF block')
+    missing = set(range(1, max(data, default=0) + 1)) - set(data)
+    if missing:
+        raise ValueError('missing blocks: {}'.format(
+            ', '.join(map(str, sorted(missing)))))
+    return (header,) + tuple( data[n] for n in sorted(data) ) + (eof,)
@@ -333,6 +333,10 @@ class FileReader(object):
         # verify end of block
         return (i_next, block)
 
+    def read_header(self, pulses, i_next):
+        ' Read the first block of a file, returning ``(i_next, block)``. '
+        return self.read_block(pulses, i_next)
+
     # returns ( int, ( block, ) )
     def read_blocks(self, pulses, i_next):
         blocks = []
@@ -399,13 +403,13 @@ class FileEncoder(object):
         self.encoder = Encoder(2400, 16, 1200, 8, False, True, (0,), (1,1,))
 
     def leader(self):
-        return self.encoder.encode_bytes( (0xff,) * 63 )
+        return [self.encoder.encoded( (0xff,) * 63 )]
         #return self.encoder.encode_bytes( (0xff,) * 64 )
         #return self.encoder.encode_bytes( (0xff,) * 65 )
 
     def encode_block(self, blk):
         res = self.leader()
-        res += self.encoder.encode_bytes(blk.to_bytes())
+        res.append(self.encoder.encoded(blk.to_bytes()))
         return (silence(1.0), sound(res))
 
     def encode_blocks(self, blocks):
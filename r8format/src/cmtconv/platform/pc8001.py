@@ -252,6 +252,28 @@ class FileReader(object):
         return i_next
 
 
+    def read_header(self, pulses, i_next):
+        ''' Read the leader and the first block of a file, a BASIC header
+            or the first binary data block (with its checksum), returning
+            ``(i_next, block)``.
+        '''
+        i_next = self.read_leader(pulses, i_next)
+        i_start = i_next
+        try:
+            n = Block.MIN_FIRST_BLOCK_LEN
+            (i_next, bs) = self.pd.read_bytes(pulses, i_next, n)
+            (hdrblk, l) = BASICHeaderBlock.from_header(bs)
+            (i_next, bs) = self.pd.read_bytes(pulses, i_next, l)
+            hdrblk.setdata(bs)
+            return (i_next, hdrblk)
+        except ReadError:
+            (i_next, bs) = self.pd.read_bytes(pulses, i_start, 6)
+            (blk, l) = BinaryDataBlock.from_header(bs, first = True)
+            (i_next, bs) = self.pd.read_bytes(pulses, i_next, l)
+            (i_next, checksum) = self.pd.read_byte(pulses, i_next)
+            blk.setdata(bs, checksum)
+            return (i_next, blk)
+
     # read a file
     # returns ( int, ( block, ) )
     def read_file(self, pulses, i_next):
@@ -394,7 +416,7 @@ class FileEncoder(object):
     def encode_block(self, blk):
         widths = []
         widths.extend(self.block_leader)
-        widths.extend(self.encoder.encode_bytes(blk.to_bytes()))
+        widths.append(self.encoder.encoded(blk.to_bytes()))
         widths.extend(self.block_leader)
         return [sound(widths)]
 
@@ -413,7 +435,7 @@ class FileEncoder(object):
             audio = list(self.file_leader)
             audio.extend(self.block_leader)
             for b in blocks:
-                audio.extend(self.encoder.encode_bytes(b.to_bytes()))
+                audio.append(self.encoder.encoded(b.to_bytes()))
             audio.extend(self.block_leader)
             return (sound(audio),)
 
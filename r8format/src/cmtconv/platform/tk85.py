@@ -187,9 +187,8 @@ class FileReader(object):
         v3('End of leader at %d - %fs' % (i_next, pulses[i_next][0]))
         return i_next
 
-    # read a file
-    # returns ( int, ( block, ) )
-    def read_file(self, pulses, i_next):
+    def read_header(self, pulses, i_next):
+        ' Read the leader and header block, returning ``(i_next, block)``. '
         i_next = self.read_leader(pulses, i_next)
 
         n = Block.HEADER_BLOCK_LEN
@@ -200,6 +199,12 @@ class FileReader(object):
         if chksum != hdrblk.checksum:
             raise Block.ChecksumError('expected={:02X}, actual={:02X}'.format(
                 hdrblk.checksum, chksum))
+        return (i_next, hdrblk)
+
+    # read a file
+    # returns ( int, ( block, ) )
+    def read_file(self, pulses, i_next):
+        (i_next, hdrblk) = self.read_header(pulses, i_next)
 
         blk_len = hdrblk.end_addr - hdrblk.start_addr + 1
 
@@ -266,7 +271,7 @@ class FileEncoder(object):
     # audio     : [AudioMarker]
     def encode_block(self, blk):
         widths = []
-        widths.extend(self.encoder.encode_bytes(blk.to_bytes()))
+        widths.append(self.encoder.encoded(blk.to_bytes()))
         return [sound(widths)]
 
     #
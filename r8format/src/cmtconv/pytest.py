@@ -0,0 +1,73 @@
+''' Fixtures and helpers for the cmtconv unit tests.
+
+    Test modules import what they need from here. (This is not a
+    ``conftest.py`` because `cmtconv` is a namespace package; pytest would
+    put this directory on `sys.path`, where `cmtconv.logging` and
+    `cmtconv.platform` would hide the standard library modules.)
+'''
+
+from    io  import BytesIO
+import  wave
+import  pytest
+
+from    cmtconv.bytestream  import blocks_from_bin, blocks_to_audio
+import  cmtconv.analyze, cmtconv.audio, cmtconv.autodecode, cmtconv.detect
+
+####################################################################
+#   Recordings
+
+def recording(platform, files, rate=None, sampwidth=1, *,
+        lead=0, gap=0, speed=1.0, truncate=None, damage=None):
+    ''' Return a `BytesIO` of a WAV recording for `platform` of a file of
+        each ``(filename, data)`` in `files`, loaded at $1000.
+
+        `rate` and `sampwidth` are passed to `blocks_to_audio()`. The
+        recording starts with `lead` frames of silence and each file is
+        followed by `gap` frames of silence. It is then truncated to
+        `truncate` frames and 400 frames from frame `damage` replaced
+        with silence, if these are given. The header gives `speed`
+        times the rate, as for a recording played back too fast or slow.
+    '''
+    silence = b'\x80' if sampwidth == 1 else bytes(sampwidth)
+    frames = []
+    for filename, data in files:
+        blocks = blocks_from_bin(platform, BytesIO(data), loadaddr=0x1000,
+            filename=filename)
+        wav = BytesIO()
+        blocks_to_audio(platform, blocks, wav, rate, sampwidth)
+        wav.seek(0)
+        with wave.open(wav, 'rb') as w:
+            rate = w.getframerate()
+            frames.append(w.readframes(w.getnframes()) + silence * gap)
+    frames = silence * lead + b''.join(frames)
+    if truncate is not None:
+        frames = frames[:truncate * sampwidth]
+    if damage is not None:
+        start, end = damage * sampwidth, (damage + 400) * sampwidth
+        frames = frames[:start] + silence * 400 + frames[end:]
+    out = BytesIO()
+    with wave.open(out, 'wb') as w:
+        w.setnchannels(1); w.setsampwidth(sampwidth)
+        w.setframerate(int(rate * speed))
+        w.writeframes(frames)
+    out.seek(0)
+    return out
+
+####################################################################
+#   Fixtures
+
+NUMPY_MODULES = (
+    cmtconv.analyze, cmtconv.audio, cmtconv.autodecode, cmtconv.detect)
+' The modules with NumPy and pure Python implementations. '
+
+@pytest.fixture(params=['python', 'numpy'])
+def impl(request, monkeypatch):
+    ''' Run the test with the given implementation of the sample-level
+        functions, skipping the NumPy version if it is not installed.
+    '''
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        for module in NUMPY_MODULES:
+            monkeypatch.setattr(module, 'numpy', None)
+    return request.param
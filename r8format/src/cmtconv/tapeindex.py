@@ -0,0 +1,331 @@
+''' Index of the files and blocks in a tape recording.
+
+    The platform `FileReader`s read one file from a given point in the
+    pulses of a recording. `index_tape()` scans a whole WAV recording
+    once, reading each file on it in turn, and returns a `TapeIndex`
+    giving the position (as a range of sample frames), block type,
+    filename and checksum status of every block found. The index can be
+    saved as a small sidecar file beside the recording (`sidecar_path()`,
+    `TapeIndex.save()`, `TapeIndex.load()`, `load_or_index()`) so that
+    later a single file can be extracted (`read_file()`) or a single
+    block re-decoded (`read_block()`), perhaps with different decoding
+    parameters, by decoding only its part of the recording.
+
+    Platforms whose `FileReader` records the extent of each block it reads
+    in ``spans`` (currently JR-200) are indexed block by block. For the
+    others the entry for each block gives the extent of the whole file
+    containing it, and single blocks cannot be re-decoded.
+'''
+
+from    collections  import namedtuple
+import  json, os, wave
+
+from    cmtconv.audio  import SampleStats, wav_chunks
+from    cmtconv.autodecode  import reader, pulse_stream
+from    cmtconv.bytestream  import get_block_module
+from    cmtconv.logging  import *
+
+SUFFIX = '.cmtidx'
+' Suffix added to the path of a recording to give its sidecar index. '
+
+MARGIN = 0.05
+''' Time in seconds added after the end of an entry's range of samples
+    when decoding it, so that the edge ending its last pulse is seen.
+'''
+
+Entry = namedtuple('Entry', 'start end file kind blockno filename status')
+Entry.__doc__ = \
+    ''' A block found by `index_tape()`: `start` and `end` are the range
+        of sample frames it occupies, `file` is the number (from 0) of the
+        file on the tape containing it, `kind` is the name of its block
+        class, `blockno` its block number (if the platform has them),
+        `filename` the name of the file (if read), and `status` is
+        ``ok`` or the error message if it could not be read, in which
+        case `kind` and `blockno` are `None`.
+    '''
+
+class TapeIndex:
+    ''' The `Entry`s for the blocks in a recording of `frames` sample
+        frames at `rate` for `platform`, in order, along with the sample
+        statistics and decoding parameters (as for `cmtconv.autodecode`)
+        used for edge detection. `blockwise` is true if the entries give
+        the extent of each block rather than of each file.
+
+        `source` is the ``(size, mtime_ns)`` of the recording when it was
+        indexed, if known; `load()` uses it to detect stale indexes.
+    '''
+
+    VERSION = 1
+
+    def __init__(self, platform, rate, frames, mean, stdev, params=None,
+            blockwise=False, entries=(), source=None):
+        self.platform = platform
+        self.rate = rate
+        self.frames = frames
+        self.mean = mean
+        self.stdev = stdev
+        self.params = dict(params or {})
+        self.blockwise = blockwise
+        self.entries = list(entries)
+        self.source = source
+
+    def __repr__(self):
+        return '{}({!r}, {}, {}, {} entries)'.format(type(self).__name__,
+            self.platform, self.rate, self.frames, len(self.entries))
+
+    def files(self):
+        ' The numbers of the files on the tape. '
+        return sorted(set( e.file for e in self.entries ))
+
+    def file_entries(self, file):
+        ''' The `Entry`s for the blocks of `file`. Raises `ValueError`
+            if there is no such file.
+        '''
+        entries = [ e for e in self.entries if e.file == file ]
+        if not entries:
+            raise ValueError('no file {} on tape'.format(file))
+        return entries
+
+    def bad(self):
+        ' The indexes of the entries with bad blocks. '
+        return [ k for k, e in enumerate(self.entries) if e.status != 'ok' ]
+
+    def to_dict(self):
+        return dict(version=self.VERSION, platform=self.platform,
+            rate=self.rate, frames=self.frames, mean=self.mean,
+            stdev=self.stdev, params=self.params, blockwise=self.blockwise,
+            source=self.source, fields=Entry._fields,
+            entries=[ list(e) for e in self.entries ])
+
+    @classmethod
+    def from_dict(cls, d):
+        if d.get('version') != cls.VERSION:
+            raise ValueError('unknown tape index version: {}'
+                .format(d.get('version')))
+        source = d['source'] and tuple(d['source'])
+        return cls(d['platform'], d['rate'], d['frames'], d['mean'],
+            d['stdev'], d['params'], d['blockwise'],
+            ( Entry(*e) for e in d['entries'] ), source)
+
+    def save(self, path):
+        ''' Write the index to `path` as compact JSON, with one line per
+            entry. The file is written to a temporary file and renamed.
+        '''
+        d = self.to_dict()
+        entries = d.pop('entries')
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(json.dumps(d, separators=(',', ':'))[:-1])
+            f.write(',"entries":[\n')
+            f.write(',\n'.join( json.dumps(e, separators=(',', ':'))
+                for e in entries ))
+            f.write('\n]}\n')
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, recording=None):
+        ''' Read an index saved by `save()` from `path`. If `recording` is
+            given, raise `ValueError` if the index was not made from the
+            current contents of that file.
+        '''
+        with open(path) as f:
+            index = cls.from_dict(json.load(f))
+        if recording is not None and index.source != _source(recording):
+            raise ValueError('stale tape index: {}'.format(path))
+        return index
+
+def sidecar_path(recording):
+    ' The path of the sidecar index file for the recording `recording`. '
+    return recording + SUFFIX
+
+def _source(path):
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime_ns)
+
+def load_or_index(path, platform, params=None):
+    ''' Return the index of the WAV recording at `path`, loading it from
+        its sidecar file if that is up to date and for `platform`,
+        otherwise scanning the recording with `index_tape()` and saving
+        the result to the sidecar file.
+    '''
+    idxpath = sidecar_path(path)
+    try:
+        index = TapeIndex.load(idxpath, path)
+        if index.platform == platform \
+                and (params is None or index.params == params):
+            return index
+    except (OSError, ValueError, KeyError, TypeError) as ex:
+        v2('{}: {}', idxpath, ex)
+    with open(path, 'rb') as f:
+        index = index_tape(platform, f, params)
+    index.source = _source(path)
+    index.save(idxpath)
+    return index
+
+####################################################################
+#   Scanning
+
+def _filename(blocks):
+    for b in blocks:
+        fn = getattr(b, 'filename', None)
+        if isinstance(fn, (bytes, bytearray)):
+            return bytes(fn).decode('ascii', 'backslashreplace')
+        if fn is not None:
+            return str(fn)
+    return None
+
+def _start(pulses, i):
+    ' The time of the start of pulse `i`. '
+    (t, _, dur) = pulses[i]
+    return t - dur
+
+def index_tape(platform, stream, params=None):
+    ''' Scan the whole of the WAV recording `stream`, which must be
+        seekable, for files for `platform` and return a `TapeIndex` of
+        the blocks in them, using the decoding parameters `params` (see
+        `cmtconv.autodecode.PARAMS`; default: the platform's defaults).
+
+        After each file, or a failure to read one, scanning continues
+        from where reading stopped. A file that could not be read
+        completely gets an entry with the error for the part of the
+        recording where that happened, as well as entries for the blocks
+        that were read, if the platform's `FileReader` keeps them.
+    '''
+    params = dict(params or {})
+    bm = get_block_module(platform)
+    w = wave.open(stream, 'rb')
+    rate = w.getframerate()
+    st = SampleStats()
+    for chunk in wav_chunks(w):
+        st.add(chunk)
+    w.rewind()
+    (mean, stdev) = st.stats()
+    blockwise = hasattr(bm.FileReader(), 'spans')
+    index = TapeIndex(platform, rate, st.n, mean, stdev, params, blockwise)
+    pulses = pulse_stream(bm, wav_chunks(w), 1.0 / rate, mean, stdev, params)
+    frame = lambda t: min(st.n, max(0, round(t * rate)))
+
+    i, file = 0, 0
+    while True:
+        try:
+            t0 = _start(pulses, i)
+        except IndexError:
+            break
+        fr = reader(bm, params)
+        try:
+            (i_next, blocks) = fr.read_file(pulses, i)
+            error = None
+        except Exception as ex:
+            #   Decoding a bad tape can fail in many ways.
+            blocks = getattr(fr, 'blocks', ())
+            error = '{}: {}'.format(type(ex).__name__, ex)
+            i_next = pulses.highest + 1
+            if isinstance(ex, IndexError):
+                i_next = max(i_next, len(pulses))
+        at_end = pulses.exhausted and i_next >= len(pulses)
+        if error is not None and not blocks and at_end:
+            #   Nothing more on the tape.
+            break
+        t1 = pulses[min(i_next, len(pulses)) - 1][0]
+        v1('file {} at {:.3f}-{:.3f}s: {} blocks{}', file, t0, t1,
+            len(blocks), '' if error is None else ', ' + error)
+
+        entries = []
+        filename = _filename(blocks)
+        spans = getattr(fr, 'spans', None)
+        if blockwise and spans is not None and len(spans) == len(blocks):
+            for b, (s0, s1) in zip(blocks, spans):
+                entries.append([s0, s1, b, 'ok'])
+            errors = getattr(fr, 'errors', ())
+            for (s0, ex) in errors:
+                entries.append([s0, None, None,
+                    '{}: {}'.format(type(ex).__name__, ex)])
+            if error is not None and len(errors) == 0:
+                s0 = max([t0] + [ s1 for (_, s1) in spans ])
+                entries.append([s0, t1, None, error])
+            entries.sort(key=lambda e: e[0])
+            for k, e in enumerate(entries):
+                if e[1] is None:
+                    e[1] = entries[k+1][0] if k+1 < len(entries) else t1
+        else:
+            entries = [ [t0, t1, b, 'ok'] for b in blocks ]
+            if error is not None:
+                entries.append([t0, t1, None, error])
+
+        for (s0, s1, b, status) in entries:
+            index.entries.append(Entry(frame(s0), frame(s1), file,
+                None if b is None else type(b).__name__,
+                getattr(b, 'blockno', None), filename, status))
+        file += 1
+        if at_end or i_next <= i:
+            break
+        i = i_next
+    return index
+
+####################################################################
+#   Random access
+
+def read_frames(stream, index, start, end, params=None):
+    ''' Return a `PulseStream` of the pulses in sample frames `start`
+        to `end` of the WAV recording `stream`, which is the recording
+        indexed by `index`, using the index's sample statistics and
+        decoding parameters (or `params`, if given). `MARGIN` seconds
+        are added to the end of the range. `stream` must be seekable;
+        it is rewound to read the WAV header.
+    '''
+    bm = get_block_module(index.platform)
+    if params is None:
+        params = index.params
+    margin = round(MARGIN * index.rate)
+    end = min(index.frames, end + margin)
+    stream.seek(0)
+    w = wave.open(stream, 'rb')
+    w.setpos(start)
+    chunks = wav_chunks(w, limit=end - start)
+    return pulse_stream(bm, chunks, 1.0 / index.rate, index.mean,
+        index.stdev if end - start >= 2 else None, params)
+
+def read_file(stream, index, file, params=None):
+    ''' Read file number `file` from the WAV recording `stream` indexed
+        by `index`, decoding only its part of the recording, and return
+        its blocks. As when indexing, blocks that cannot be read are
+        skipped if the platform's `FileReader` can do so.
+    '''
+    if params is None:
+        params = index.params
+    entries = index.file_entries(file)
+    pulses = read_frames(stream, index,
+        min( e.start for e in entries ), max( e.end for e in entries ),
+        params)
+    fr = reader(get_block_module(index.platform), params)
+    (_, blocks) = fr.read_file(pulses, 0)
+    return blocks
+
+def read_block(stream, index, k, params=None):
+    ''' Re-decode the block given by entry `k` of `index` from the WAV
+        recording `stream`, using decoding parameters `params` (default:
+        those of the index), and return it. For a data block the file
+        header, the first entry for the file, is re-decoded as well to
+        find how the block was recorded.
+
+        Raises `ValueError` if the index does not give the extent of each
+        block, or the file header cannot be found.
+    '''
+    if not index.blockwise:
+        raise ValueError('{}: tape index does not locate single blocks'
+            .format(index.platform))
+    if params is None:
+        params = index.params
+    e = index.entries[k]
+    first = index.entries.index(index.file_entries(e.file)[0])
+    bm = get_block_module(index.platform)
+    fr = reader(bm, params)
+    pulses = read_frames(stream, index, e.start, e.end, params)
+    if k == first:
+        (_, block) = fr.read_file_header(pulses, 0)
+        return block
+    if index.entries[first].status != 'ok':
+        raise ValueError('no file header for file {}'.format(e.file))
+    header = read_block(stream, index, first, index.params)
+    (_, block) = fr.read_block(fr.bit_decoder(header), pulses, 0)
+    return block
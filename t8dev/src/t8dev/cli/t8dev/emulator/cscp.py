@@ -77,8 +77,8 @@ class CSCP(Suite):
                 ri = RomImage(filename, path.download('rom-image'), loadspec)
                 #   Use applicable patchspecs and remove from list.
                 ri.patches(self.args.patchspecs) 
-            except FileNotFoundError as ex:
-                exits.err(ex)
+            except (FileNotFoundError, ValueError) as ex:
+                exits.err(ex)           # ValueError: SHA-256 mismatch
             except HTTPError as ex:
                 exits.err(f'{ex}: {ex.url}')
             ri.writefile(self.emudir(filename))
@@ -4,7 +4,7 @@
 from    t8dev  import path
 from    t8dev.cli  import exits
 from    binary.tool.asl  import parse_obj
-from    binary.tool.intelhex  import intelhex, EOFREC as INTELHEX_EOFREC
+from    binary.tool.intelhex  import iterhex, EOFREC as INTELHEX_EOFREC
 
 import  serial                  # https://pythonhosted.org/pyserial/
 from    serial  import Serial, SerialException
@@ -55,6 +55,8 @@ def parseargs(args=None):
         help='delay M milliseconds after sending each line or record')
     an('-c', '--char-delay', metavar='M', type=int,
         help='delay M milliseconds after sending each character')
+    an('-r', '--record-length', metavar='N', type=int,
+        help='data bytes per record for record formats (default 16)')
     an('file', nargs='?', help='file to send (stdin if not specified)')
 
     p_term = subparsers.add_parser('term',
@@ -262,7 +264,10 @@ def send_fmt_intelhex(conf, ser):
         mem = parse_obj(fp)
     except ValueError as ex:
         exits.err(f'{PROG}: intelhex: Cannot parse input file: {ex}')
-    hexrecs = intelhex(mem)
+    reclen = conf.param('record_length')
+    if not 1 <= reclen <= 255:
+        exits.err(f'{PROG}: intelhex: record_length must be 1-255: {reclen}')
+    hexrecs = iterhex(mem, reclen=reclen)
 
     CR = b'\r'; LF = b'\n'
     ser_write(conf, ser, conf.bytesparam('send_prefix'))
@@ -306,6 +311,7 @@ class Config:
         'send_format',
         'send_prefix',  # data to send before `send_format` data
         'send_suffix',  # data to send after `send_format` data
+        'record_length',    # data bytes per record for record formats
     )
     ' Valid parameter names in the order they are generally read/used. '
 
@@ -318,6 +324,7 @@ class Config:
         'char_delay':   0,
         'send_prefix':  '',
         'send_suffix':  '',
+        'record_length': 16,
     }
     ' Internal default values for each parameter. '
 
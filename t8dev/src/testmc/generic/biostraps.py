@@ -0,0 +1,82 @@
+''' Python implementations of the tmc BIOS console routines.
+
+    Each CPU's ``testmc/*/tmc/bioscode.asm`` implements the same small set
+    of console routines (``prchar``, ``rdchar``, ``prnl`` and ``errbeep``)
+    by reading and writing ``charinport``/``charoutport``. Code under test
+    that does a lot of I/O spends most of its time simulating these, so
+    `trapbios()` replaces them with traps (see `GenericMachine.settrap()`)
+    that do the same port reads and writes directly from Python. The ports'
+    I/O functions (e.g., from `IOMem.setiostreams()`) are used as before.
+
+    The traps for each CPU, in `BIOS_TRAPS`, leave ``A`` and the flags as
+    the instructions of that CPU's assembled BIOS do: ``rdchar`` is a
+    load of ``A`` from ``charinport``, and ``prchar`` (which ``prnl``
+    and ``errbeep`` load ``A`` and jump to) destroys ``A`` with ``EOR
+    #$FF`` on the 6502 and ``DEC A`` on the 6800 and 8080.
+'''
+
+def _out(m):
+    ' Write A to `charoutport` and return it. '
+    a = m.regs.a
+    m.deposit(m.symtab.charoutport, a)
+    return a
+
+def _in(m):
+    ' Return a byte read from `charinport`. '
+    return m.byte(m.symtab.charinport)
+
+def _traps(prchar, rdchar):
+    ' Return the `trapbios()` functions using `prchar` and `rdchar`. '
+    def prnl(m):
+        m.setregs(m.Registers(a=0x0A))      # LF; see bioscode.asm
+        prchar(m)
+    def errbeep(m):
+        m.setregs(m.Registers(a=0x07))      # BEL
+        prchar(m)
+    return { 'prchar': prchar, 'rdchar': rdchar,
+        'prnl': prnl, 'errbeep': errbeep }
+
+####################################################################
+#   CPU-specific routines
+
+def _mos65_prchar(m):
+    a = _out(m) ^ 0xFF                              # EOR #$FF
+    m.setregs(m.Registers(a=a, N=bool(a & 0x80), Z=a == 0))
+
+def _mos65_rdchar(m):
+    a = _in(m)                                      # LDA charinport
+    m.setregs(m.Registers(a=a, N=bool(a & 0x80), Z=a == 0))
+
+def _mc6800_prchar(m):
+    old = _out(m)
+    a = (old - 1) & 0xFF                            # DEC A
+    m.setregs(m.Registers(a=a, N=bool(a & 0x80), Z=a == 0, V=old == 0x80))
+
+def _mc6800_rdchar(m):
+    a = _in(m)                                      # LDA A,charinport
+    m.setregs(m.Registers(a=a, N=bool(a & 0x80), Z=a == 0, V=False))
+
+def _i8080_prchar(m):
+    a = (_out(m) - 1) & 0xFF                        # DCR A
+    m.setregs(m.Registers(a=a, S=bool(a & 0x80), Z=a == 0,
+        H=(a & 0xF) != 0xF, P=bin(a).count('1') % 2 == 0))
+
+def _i8080_rdchar(m):
+    m.setregs(m.Registers(a=_in(m)))                # LDA: no flags
+
+BIOS_TRAPS = {
+    'mos65':    _traps(_mos65_prchar,  _mos65_rdchar),
+    'mc6800':   _traps(_mc6800_prchar, _mc6800_rdchar),
+    'i8080':    _traps(_i8080_prchar,  _i8080_rdchar),
+}
+''' The trap functions for each BIOS routine, by the name of the BIOS
+    (`GenericMachine.biosname()`).
+'''
+
+def trapbios(m):
+    ''' Set traps on `m` for its BIOS's routines in `BIOS_TRAPS`, using
+        their addresses from `m.symtab`, which must include the BIOS
+        symbols.
+    '''
+    for name, f in BIOS_TRAPS[m.biosname()].items():
+        m.settrap(m.symtab[name], f)
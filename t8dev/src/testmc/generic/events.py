@@ -0,0 +1,87 @@
+''' Clock-driven event scheduling for simulated devices.
+
+    Devices attached to a machine (timers, serial ports and the like)
+    often need to do something at a particular time rather than only when
+    the CPU happens to access them: raise an interrupt after a timer
+    expires, make a received character available after the appropriate
+    bit time has elapsed, and so on.
+
+    An `EventQueue` holds callbacks keyed on the machine's `clock`, a count
+    that increases monotonically as the machine executes. The queue is a
+    heap, so scheduling and removing events is O(log n), and finding the
+    time of the next event is O(1). This last is important: the machine's
+    run loop checks only a single integer, `EventQueue.nextdue()`, after
+    each step, and does further work only when that is reached.
+'''
+
+from    heapq  import heappop, heappush
+from    itertools  import count
+
+NEVER = 1 << 62
+''' A clock value that will never be reached. (We use this rather than
+    ``float('inf')`` so that the run loop compares only integers.)
+'''
+
+class EventQueue:
+    ''' A priority queue of callbacks to be run when a clock reaches
+        a given value.
+
+        Each entry is a list of ``[when, seq, f]``, which is also the
+        handle returned by `push()` for use with `cancel()`. The
+        sequence number ensures that events scheduled for the same
+        time run in the order they were scheduled, and that we never
+        compare the callbacks themselves.
+
+        Cancelled events are not removed from the heap, since that is an
+        O(n) operation; instead the callback is set to `None` and the entry
+        is discarded when it reaches the top of the heap. (This is the
+        technique recommended in the `heapq` documentation.)
+    '''
+
+    def __init__(self):
+        self.heap = []
+        self.seq = count()
+
+    def __len__(self):
+        ' The number of events (including cancelled ones) in the queue. '
+        return len(self.heap)
+
+    def push(self, when, f):
+        ''' Schedule `f` to be run when the clock reaches `when`.
+            Returns a handle that may be passed to `cancel()`.
+        '''
+        if not callable(f):
+            raise ValueError('Not callable: {}'.format(repr(f)))
+        entry = [when, next(self.seq), f]
+        heappush(self.heap, entry)
+        return entry
+
+    def cancel(self, entry):
+        ''' Cancel a scheduled event, given the handle returned by `push()`.
+            Cancelling an event that has already run or been cancelled
+            is a no-op.
+        '''
+        entry[2] = None
+
+    def nextdue(self):
+        ''' Return the clock value at which the next (non-cancelled) event
+            is due, or `NEVER` if there are no events scheduled.
+        '''
+        heap = self.heap
+        while heap and heap[0][2] is None:
+            heappop(heap)
+        return heap[0][0] if heap else NEVER
+
+    def popdue(self, clock):
+        ''' Remove and return, in time order, the callbacks of all events
+            due at or before `clock`.
+
+            This is a generator, so events pushed by callbacks run from
+            this (e.g., periodic timers rescheduling themselves) will also
+            be returned if they are due at or before `clock`.
+        '''
+        heap = self.heap
+        while heap and heap[0][0] <= clock:
+            _, _, f = heappop(heap)
+            if f is not None:
+                yield f
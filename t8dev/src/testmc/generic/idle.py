@@ -0,0 +1,79 @@
+''' Detection of polling loops.
+
+    Programs waiting for a device typically spin in a short loop that
+    reads a status port and branches back if the device is not ready:
+
+        loop    ldaa status
+                bita #1
+                beq  loop
+
+    Each iteration of such a loop leaves the machine in exactly the same
+    state, so once we have seen that happen we know that nothing will
+    change until the device does. The simulator can then block on the
+    device (or skip ahead to the next scheduled event) rather than
+    executing millions of identical iterations.
+'''
+
+class PollLoop:
+    ''' Detect a machine spinning in a loop polling an I/O address.
+
+        Call `polled()` from the I/O function for the address each time it
+        is read. It compares the machine state (registers and the count of
+        memory writes, which must be available as a ``writes`` attribute
+        on the machine's memory, as with `IOMem`) with that seen at the
+        previous read; if it is the same and at most `maxlen` ticks of
+        `GenericMachine.clock` have passed, the machine is in a loop where
+        the only changing state is the read from the I/O address.
+
+        `skip()` may then be used to advance the clock by whole iterations
+        of the loop, leaving the machine state as it would have been had
+        those iterations actually been executed.
+    '''
+
+    MAXLEN = 64
+
+    def __init__(self, m, maxlen=MAXLEN):
+        self.m = m
+        self.maxlen = maxlen
+        self.last = None
+        self.loopcycles = None
+
+    def _state(self):
+        m = self.m
+        return (m.regs, getattr(m.get_memory_seq(), 'writes', None))
+
+    def polled(self):
+        ''' Note a read of the polled address. If this read completes
+            an iteration of an idle loop, return the length of the loop
+            in clock ticks; otherwise return `None`.
+        '''
+        m = self.m
+        state = self._state()
+        cycles = getattr(m, 'cycles', None)
+        last, self.last = self.last, (m.clock, cycles, state)
+        if last is None or state[1] is None:
+            return None
+        lastclock, lastcycles, laststate = last
+        ticks = m.clock - lastclock
+        if not (0 < ticks <= self.maxlen) or state != laststate:
+            return None
+        self.loopcycles = None if cycles is None else cycles - lastcycles
+        return ticks
+
+    def iterations_to_event(self, ticks):
+        ''' Return the number of whole iterations of a loop `ticks` long
+            that can be skipped without reaching the next scheduled event.
+        '''
+        m = self.m
+        return max(0, (m.events.nextdue() - 1 - m.clock) // ticks)
+
+    def skip(self, ticks, iterations):
+        ''' Advance the machine's clock (and its ``cycles`` count, if
+            it has one) by `iterations` executions of a loop `ticks`
+            long, as returned by `polled()`.
+        '''
+        m = self.m
+        m.clock += ticks * iterations
+        if self.loopcycles is not None:
+            m.cycles += self.loopcycles * iterations
+        self.last = None
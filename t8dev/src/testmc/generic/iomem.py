@@ -40,6 +40,20 @@ class IOMem(bytearray):
     def __init__(self, size=65536):
         super().__init__(size)
         self.iofs = {}          # address → f(location, byte)
+        self.writes = 0         # count of non-I/O writes, for `PollLoop`
+        self._setread()
+
+    def _setread(self):
+        ''' Set `read` to a function returning the byte at an address,
+            as ``self[addr]`` does but without the checks of `__getitem__`
+            when no I/O functions are set. This is for CPU simulators
+            reading from addresses they have already limited to the
+            address space; the address must be valid.
+        '''
+        if self.iofs:
+            self.read = self.__getitem__
+        else:
+            self.read = bytearray.__getitem__.__get__(self)
 
     def setiostreams(self, addr, input=None, output=None):
         ''' Attach binary I/O streams to a memory location, and return the
@@ -128,6 +142,7 @@ class IOMem(bytearray):
                 raise ValueError('iof function already set at address'
                     ' ${:04X}; remove it first.'.format(addr))
             self.iofs[addr] = iof
+        self._setread()
 
     def _slice_to_range(self, s):
         ''' Convert a slice to a range.
@@ -154,18 +169,21 @@ class IOMem(bytearray):
             return bytearray(
                 ( self[addr] for addr in self._slice_to_range(key) )) # recurse
 
-        self._check_index(key)
-        if key in self.iofs:
-            iof = self.iofs[key]
-            val = iof(key, None)
-            if not isinstance(val, int):
-                raise TypeError(f'I/O address ${key:04X}: non-int {val!r}'
-                    f" returned by {iof!r}")
-            if val < 0 or val > 0xFF:
-                raise ValueError(f'I/O address ${key:04X}: bad int ${val:02X}'
-                    f' (<0 or >$FF) by {iof!r}')
-            return val
-        return super().__getitem__(key)
+        #   This is on the hot path of every simulator memory read, so the
+        #   common case (not I/O, valid address) is checked first.
+        if key not in self.iofs:
+            if 0 <= key < len(self):
+                return bytearray.__getitem__(self, key)
+            self._check_index(key)
+        iof = self.iofs[key]
+        val = iof(key, None)
+        if not isinstance(val, int):
+            raise TypeError(f'I/O address ${key:04X}: non-int {val!r}'
+                f" returned by {iof!r}")
+        if val < 0 or val > 0xFF:
+            raise ValueError(f'I/O address ${key:04X}: bad int ${val:02X}'
+                f' (<0 or >$FF) by {iof!r}')
+        return val
 
     def _badlen(self, alen, vlen):
         msg = "'{}' object cannot change length" \
@@ -182,10 +200,12 @@ class IOMem(bytearray):
                 self[a] = v  # recurse
             return
 
-        self._check_index(key)
         if key in self.iofs:
             return self.iofs[key](key, value)
-        return super().__setitem__(key, value)
+        if not 0 <= key < len(self):
+            self._check_index(key)
+        self.writes += 1
+        return bytearray.__setitem__(self, key, value)
 
     def __delitem__(self, key):
         raise TypeError("'{}' object doesn't support item deletion"
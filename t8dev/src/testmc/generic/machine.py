@@ -1,8 +1,12 @@
 from    abc  import abstractmethod, abstractproperty
 from    collections.abc   import Container
 from    itertools  import repeat
+from    os.path  import isfile
+from    sys  import stderr
+from    testmc.generic.events  import EventQueue, NEVER
 from    testmc.generic.memory  import MemoryAccess
 from    binary.symtab  import SymTab
+from    binary  import loader
 from    binary.tool  import asl, asxxxx
 
 class GenericMachine(MemoryAccess): # MemoryAccess is already an ABC
@@ -20,6 +24,10 @@ class GenericMachine(MemoryAccess): # MemoryAccess is already an ABC
         - ◑`__init__()`: See method docstring below.
         - `regs`: The current machine registers and flags.
         - `setregs()`: Set some or all machine registers and flags.
+        - `clock`, `schedule()`, `cancel()`: Clock-driven device events.
+        - `irq()`, `nmi()`: Interrupt inputs. These require the subclass
+          to implement `_irq()` and `_nmi()`.
+        - `settrap()`: Run Python code in place of a subroutine.
     '''
 
     def biosname(self):
@@ -41,6 +49,13 @@ class GenericMachine(MemoryAccess): # MemoryAccess is already an ABC
             `Registers.srname`, but not both.
         '''
         self.symtab = SymTab()      # symtab initially empty
+        self.clock = 0
+        self.events = EventQueue()
+        self.irqline = False
+        self.irqvector = None
+        self.nmipending = False
+        self._nextcheck = NEVER
+        self.traps = {}             # address → f(machine)
         for regspec in self.Registers.registers:
             if regspec.split8:
                 self.Registers.init_split8(type(self._regsobj()), regspec)
@@ -133,12 +148,18 @@ class GenericMachine(MemoryAccess): # MemoryAccess is already an ABC
             * ``.p`` output from Macroassembler AS and its associated
               ``.map`` file.
             * ``.bin`` CoCo binary format and associated ASxxxx ``.rst``
-              linker listing file.
+              linker listing file. `path` is the basename, without the
+              ``.bin`` extension.
+            * Any other file in a format known to `binary.loader`, such
+              as Intel HEX or Motorola S-records. No symbols are loaded
+              for these.
         '''
         path = str(path)                    # We accept path-like objects
         if path.lower().endswith('.p'):
             #   Assume it's Macro Assembler AS output.
             image, symtab = self._load_asl(path)
+        elif isfile(path):
+            image, symtab = loader.load_fromfile(path), None
         else:
             #   Assume it's the basename of ASxxxx toolchain output.
             #   (This should probably be changed to require something
@@ -146,7 +167,8 @@ class GenericMachine(MemoryAccess): # MemoryAccess is already an ABC
             image, symtab = self._load_asxxxx(path)
 
         entrypoint = self.load_memimage(image, setPC)
-        self.symtab.merge(symtab, style=mergestyle)
+        if symtab is not None:
+            self.symtab.merge(symtab, style=mergestyle)
         return entrypoint
 
     def _load_asl(self, path):
@@ -163,6 +185,7 @@ class GenericMachine(MemoryAccess): # MemoryAccess is already an ABC
 
     def _load_asxxxx(self, path):
         image = asxxxx.parse_cocobin_fromfile(path + '.bin')
+        symtab = None
         try:
             symtab = asxxxx.AxSymTab.readsymtabpath(path)
         except FileNotFoundError as err:
@@ -232,6 +255,12 @@ class GenericMachine(MemoryAccess): # MemoryAccess is already an ABC
     def getretaddr(self):
         ' Return the address at the top of the stack that RTS would use. '
 
+    @abstractmethod
+    def popretaddr(self):
+        ''' Remove the return address from the top of the stack, as RTS
+            would, and return it.
+        '''
+
     ####################################################################
     #   Execution - implementation
 
@@ -246,11 +275,28 @@ class GenericMachine(MemoryAccess): # MemoryAccess is already an ABC
             If `trace` is `True`, the current machine state and instruction
             about to be executed will be printed before executing the step.
 
+            If the PC is at an address set with `settrap()`, the trap
+            function is called and a return simulated instead of executing
+            an instruction. When no traps are set this costs nothing more
+            than a check that the trap table is empty.
+
+            After each instruction `clock` is incremented and, if it has
+            reached the time of the next scheduled event or an interrupt
+            is pending, events are run and interrupts delivered. Otherwise
+            this costs only a single integer comparison per instruction.
+
             XXX This should check for stack under/overflow.
         '''
+        traps = self.traps
         for _ in repeat(None, count):
             if trace: print(self.traceline())
-            self._step()
+            if traps and self._getpc() in traps:
+                self._trap()
+            else:
+                self._step()
+            self.clock += 1
+            if self.clock >= self._nextcheck:
+                self._service()
 
     def stepto(self, addr=None, *, stopat=set(), stopon=set(), nstop=1,
         trace=False, maxsteps=MAXSTEPS, raisetimeout=True):
@@ -272,7 +318,8 @@ class GenericMachine(MemoryAccess): # MemoryAccess is already an ABC
             exits from the other parameters here.
 
             `stopat` and `stopon` are checked to ensure that they are
-            `collections.abc.Container` instances.
+            `collections.abc.Container` instances. `stopon` is not checked
+            at trapped addresses, since those opcodes are not executed.
         '''
         assert isinstance(stopat, Container), \
             "'stopat' must be a collections.abc.Container"
@@ -286,7 +333,8 @@ class GenericMachine(MemoryAccess): # MemoryAccess is already an ABC
         while True:
             self.step(trace=trace)
             pc = self._getpc()
-            if pc in stopat or self.byte(pc) in stopon:
+            if pc in stopat or (self.byte(pc) in stopon
+                                and pc not in self.traps):
                 nstop -= 1
                 if nstop == 0: break
             if remaining <= 0:
@@ -364,13 +412,129 @@ class GenericMachine(MemoryAccess): # MemoryAccess is already an ABC
             if maxremain <= 0:
                 self._raiseTimeout(maxsteps)
             opcode = self.byte(pc)
-            if opcode in stopon and nstop <= 0:
+            if opcode in stopon and nstop <= 0 and pc not in self.traps:
                 raise self.Abort('Abort on opcode=${:02X}: {}' \
                     .format(self.byte(pc), self.regs))
             maxremain -= self.stepto(
                 stopat=stopat, stopon=allstopon,
                 maxsteps=maxremain, raisetimeout=False, trace=trace)
 
+    ####################################################################
+    #   Clock, events and interrupts
+
+    def schedule(self, ticks, f):
+        ''' Schedule `f` to be called with this machine as its argument
+            when `clock` has advanced by `ticks` from its current value.
+            Returns a handle that may be passed to `cancel()`.
+
+            `clock` counts instructions executed by `step()`; it is
+            deliberately not related to real time so that test results are
+            deterministic. A callback may schedule further events (e.g., to
+            implement a periodic timer) and call `irq()` or `nmi()`.
+        '''
+        if ticks < 0:
+            raise ValueError('Cannot schedule event in the past: {}' \
+                .format(ticks))
+        event = self.events.push(self.clock + ticks, f)
+        self._nextcheck = min(self._nextcheck, self.clock + ticks)
+        return event
+
+    def cancel(self, event):
+        ' Cancel an event previously returned by `schedule()`. '
+        self.events.cancel(event)
+
+    def irq(self, level=True, *, vector=None):
+        ''' Set the level of the (maskable, level-triggered) interrupt
+            request line: `True` asserts it and `False` releases it.
+
+            While the line is asserted the interrupt will be taken before
+            each instruction for which the CPU's interrupt mask allows it,
+            so the device (or the callback simulating it) must release the
+            line when the interrupt is acknowledged, as with real hardware.
+
+            `vector` is CPU-specific information supplied by the
+            interrupting device, e.g. the ``RST`` instruction on an 8080.
+            It is ignored by CPUs that use fixed interrupt vectors.
+        '''
+        self.irqline = level
+        self.irqvector = vector
+        if level: self._nextcheck = self.clock
+
+    def nmi(self):
+        ''' Signal a non-maskable interrupt. This is edge-triggered: the
+            interrupt will be taken once, before the next instruction.
+        '''
+        self.nmipending = True
+        self._nextcheck = self.clock
+
+    def _service(self):
+        ''' Run all events that are due and then deliver any pending
+            interrupts. This is the "slow path" of `step()`, called
+            only when `clock` has reached `_nextcheck`.
+        '''
+        for f in self.events.popdue(self.clock):
+            f(self)
+        if self.nmipending:
+            self._nmi()
+            self.nmipending = False
+        if self.irqline:
+            self._irq()
+        if self.irqline:
+            #   Keep checking until the line is released; the interrupt
+            #   may currently be masked or may be taken again.
+            self._nextcheck = self.clock + 1
+        else:
+            self._nextcheck = self.events.nextdue()
+
+    def _irq(self):
+        ''' If the CPU's interrupt mask allows it, take a maskable
+            interrupt (using `irqvector` if the CPU needs it) and return
+            `True`. Otherwise, leave the CPU state unchanged and return
+            `False`. Subclasses that support interrupts must override this.
+        '''
+        raise NotImplementedError(
+            '{} does not support interrupts'.format(type(self).__name__))
+
+    def _nmi(self):
+        ''' Take a non-maskable interrupt. Subclasses that support
+            interrupts must override this.
+        '''
+        raise NotImplementedError(
+            '{} does not support interrupts'.format(type(self).__name__))
+
+    ####################################################################
+    #   Traps
+
+    def settrap(self, addr, f=None):
+        ''' Set a function `f` to be called when the machine is about to
+            execute an instruction at `addr`. This is used to implement
+            subroutines (usually BIOS routines) in Python: `f` is called
+            with this machine as its argument, should make the changes
+            to registers and memory that the subroutine would, and after
+            it returns the machine simulates a return from subroutine.
+            If `f` returns an address instead of `None`, execution will
+            instead continue at that address without popping the stack
+            (e.g., to simulate a jump to a warm start routine).
+
+            Passing `None` as the function will clear an existing trap at
+            that address. Multiple functions may not be set at the same
+            address; clear an existing trap before replacing it.
+        '''
+        if f is None:
+            del self.traps[addr]
+            return
+        if not callable(f):
+            raise ValueError('Not callable: {}'.format(repr(f)))
+        if addr in self.traps:
+            raise ValueError('trap function already set at address'
+                ' ${:04X}; remove it first.'.format(addr))
+        self.traps[addr] = f
+
+    def _trap(self):
+        pc = self.traps[self._getpc()](self)
+        if pc is None: pc = self.popretaddr()
+        self.setregs(self.Registers(pc=pc))
+
     ####################################################################
     #   Tracing and similar information
 
@@ -1,6 +1,8 @@
 from    abc  import ABC, abstractmethod, abstractproperty
 from    collections.abc  import Sequence
 from    numbers  import Integral
+from    struct  import Struct, error as StructError
+from    binary  import hexdump as _hexdump
 
 
 class MemoryAccess(ABC):
@@ -15,6 +17,12 @@ class MemoryAccess(ABC):
 
         Subclasses must define attributes `is_little_endian` and
         `get_memory_seq()`; see their docstrings below for details.
+
+        The bulk methods `ints()`, `depints()`, `words()` and `depwords()`
+        convert whole arrays of 1-, 2-, 3- or 4-byte values with `struct`
+        rather than a byte at a time. When the store supports the buffer
+        protocol (e.g., `bytearray`, `IOMem`) and no I/O is mapped in the
+        range, they work directly on a `view()` of the store.
     '''
 
     @abstractmethod
@@ -69,11 +77,131 @@ class MemoryAccess(ABC):
         else:
             return b0 * 0x100 + b1
 
-    def words(self, addr, n):
+    def words(self, addr, n, signed=False):
         ''' Return a sequence of `n` words (decoding native endianness)
-            starting `addr`. '
+            starting `addr`, optionally `signed` (two's complement).
         '''
-        return tuple( self.word(i) for i in range(addr, addr+n*2, 2) )
+        return self.ints(addr, n, 2, signed)
+
+    def view(self, addr, n):
+        ''' Return a zero-copy `memoryview` of the `n` bytes of the
+            backing store starting at `addr`.
+
+            This raises a `ValueError` if the store does not support the
+            buffer protocol (e.g., it is a `list`) or if any I/O functions
+            (see `IOMem.setio()`) are set in that range, since reads and
+            writes through the view would bypass them. Writes through the
+            view are also not counted in `IOMem.writes`.
+        '''
+        view = self._view(addr, n)
+        if view is None:
+            _memerr(addr, 'no direct view of {} bytes', n)
+        return view
+
+    def _view(self, addr, n):
+        ''' Return a `memoryview` as per `view()`, or `None` if a view is
+            not possible. Raises an `IndexError` if the range is outside
+            of memory.
+        '''
+        mem = self.get_memory_seq()
+        if addr < 0:
+            _memerr(addr, 'bad location', ex=IndexError)
+        if addr + n > len(mem):
+            _memerr(addr+n-1, 'bad location', ex=IndexError)
+        iofs = getattr(mem, 'iofs', None)
+        if iofs and any( addr <= a < addr + n for a in iofs ):
+            return None
+        try:
+            return memoryview(mem)[addr:addr+n]
+        except TypeError:
+            return None
+
+    _INTCODES = { (1, False): 'B', (1, True): 'b', (2, False): 'H',
+        (2, True): 'h', (4, False): 'I', (4, True): 'i', }
+
+    def _struct(self, n, size, signed):
+        ''' Return a `Struct` for `n` values of `size` bytes in native
+            endianness, or `None` for 3-byte values, which `struct`
+            does not support.
+        '''
+        if size == 3:
+            return None
+        code = self._INTCODES.get((size, bool(signed)))
+        if code is None:
+            raise ValueError('bad int size: {}'.format(size))
+        return Struct('{}{}{}'.format(
+            '<' if self.is_little_endian else '>', n, code))
+
+    def ints(self, addr, n, size=2, signed=False):
+        ''' Return a `tuple` of `n` integers of `size` bytes each (1, 2, 3
+            or 4) starting at `addr`, decoding native endianness and, if
+            `signed` is true, two's complement.
+        '''
+        fmt = self._struct(n, size, signed)
+        data = self._view(addr, n*size)
+        if data is None:
+            data = self.bytes(addr, n*size)
+        if fmt is not None:
+            return fmt.unpack_from(data)
+        order = 'little' if self.is_little_endian else 'big'
+        data = bytes(data)
+        return tuple( int.from_bytes(data[i:i+3], order, signed=signed)
+            for i in range(0, n*3, 3) )
+
+    def depints(self, addr, values, size=2, signed=False):
+        ''' Deposit the sequence of integers `values`, each encoded in
+            native endianness as `size` bytes (1, 2, 3 or 4), at `addr`.
+            If `signed` is true the values are two's complement and may
+            be negative. Memory is not changed if any value is out of
+            range. Returns a `bytes` of the deposited data.
+        '''
+        values = tuple(values)
+        fmt = self._struct(len(values), size, signed)
+        try:
+            if fmt is not None:
+                data = fmt.pack(*values)
+            else:
+                order = 'little' if self.is_little_endian else 'big'
+                data = b''.join( v.to_bytes(3, order, signed=signed)
+                    for v in values )
+        except (StructError, OverflowError, TypeError, AttributeError):
+            lo, hi = (-1 << (size*8-1), 1 << (size*8-1)) if signed \
+                else (0, 1 << (size*8))
+            for v in values:
+                if not isinstance(v, Integral):
+                    _memerr(addr, 'non-integral value {}', repr(v))
+                if not lo <= v < hi:
+                    _memerr(addr, 'invalid {}-byte value ${:02X}', size, v)
+            raise
+        view = self._view(addr, len(data))
+        if view is None:
+            self.get_memory_seq()[addr:addr+len(data)] = data
+        else:
+            view[:] = data
+            mem = self.get_memory_seq()
+            if hasattr(mem, 'writes'):
+                mem.writes += len(data)
+        return data
+
+    def depwords(self, addr, values, signed=False):
+        ''' Deposit the sequence of 16-bit words `values`, optionally
+            `signed`, at `addr`. See `depints()`.
+        '''
+        return self.depints(addr, values, 2, signed)
+
+    def ndarray(self, addr, n, size=1, signed=False):
+        ''' Return a read-only NumPy array of `n` integers of `size` bytes
+            (1, 2 or 4) in native endianness starting at `addr`. The data
+            are copied from memory. This requires the `numpy` module.
+        '''
+        import numpy
+        if size not in (1, 2, 4):
+            raise ValueError('bad int size for ndarray: {}'.format(size))
+        dtype = '{}{}{}'.format('<' if self.is_little_endian else '>',
+            'i' if signed else 'u', size)
+        data = self._view(addr, n*size)
+        data = self.bytes(addr, n*size) if data is None else bytes(data)
+        return numpy.frombuffer(data, dtype=dtype)
 
     def deposit(self, addr, *values):
         ''' Deposit bytes to memory at `addr`. Remaining parameters
@@ -97,6 +225,8 @@ class MemoryAccess(ABC):
             if isinstance(value, Integral):
                 assertvalue(value)
                 vlist.append(value)
+            elif isinstance(value, (bytes, bytearray)):
+                vlist += value              # always valid byte values
             elif isinstance(value, Sequence):
                 list(map(assertvalue, value))
                 vlist += list(value)
@@ -137,17 +267,12 @@ class MemoryAccess(ABC):
             else:
                 _memerr(addr, 'invalid argument {}', repr(value))
 
-        data = []
-        for word in words:
-            if self.is_little_endian:
-                data.append(word & 0xFF)            # LSB first
-                data.append((word & 0xFF00) >> 8)   # MSB
-            else:
-                data.append((word & 0xFF00) >> 8)   # MSB first
-                data.append(word & 0xFF)            # LSB
-        self.deposit(addr, data)
-
-        return self.bytes(addr, len(words)*2)
+        if addr < 0:
+            _memerr(addr, "bad location", ex=IndexError)
+        mem = self.get_memory_seq()
+        if addr + len(words)*2 > len(mem):
+            _memerr(addr + len(words)*2 - 1, "bad location", ex=IndexError)
+        return self.depints(addr, words, 2)
 
     def hexdump(self, addr, length):
         ''' Return a human-readable hexadecimal dump of of `length` bytes
@@ -155,10 +280,17 @@ class MemoryAccess(ABC):
 
             This is useful for printing debugging information in unit tests.
         '''
-        s = '{:04X}:'.format(addr)
-        for b in self.bytes(addr, length):
-            s += ' {:02X}'.format(b)
-        return s
+        data = self.bytes(addr, length)
+        return '{:04X}:{}{}'.format(addr, ' ' if data else '',
+            data.hex(' ').upper())
+
+    def dump(self, addr, length, file=None, collapse=True):
+        ''' Write a multi-line dump of `length` bytes of this memory
+            starting at `addr` to `file` (default `sys.stdout`) in the
+            `binary.hexdump` format. If `collapse` is true, runs of
+            identical lines are shown as a single ``*`` line.
+        '''
+        _hexdump.dump(addr, self.bytes(addr, length), file, collapse)
 
 
 ####################################################################
@@ -0,0 +1,405 @@
+''' A minimal CP/M 2.2 environment for running ``.COM`` programs.
+
+    This loads a ``.COM`` file into the TPA at $0100 of a
+    `testmc.i8080.Machine`, sets up page zero (the warm start and BDOS
+    vectors, default FCBs and command tail) as the CCP would, and traps
+    ``CALL 5`` to BDOS functions implemented in Python. Console I/O goes to
+    streams that tests can examine, and files are read from and written to
+    a host directory.
+
+    This is far faster than starting an external emulator such as RunCPM,
+    letting tests run many CP/M program invocations with ordinary pytest
+    assertions on the console output and files produced:
+
+        cpm = CPM(Machine(), tmp_path, input=b'y\\r')
+        cpm.load('HELLO.COM', 'FOO.TXT')
+        cpm.run()
+        assert b'Hello' in cpm.output.getvalue()
+
+    Only the commonly used BDOS functions are implemented, and there is
+    no disk or user number support: all drives are the host directory.
+    Calling an unimplemented function raises `CPM.BDOSError`.
+'''
+
+from    pathlib  import Path
+
+from    testmc.generic.mbytesio  import MBytesIO
+
+TPA         = 0x0100
+BDOS        = 0xE406        # BDOS entry; CP/M programs treat this as TPA top
+BIOS        = 0xF200        # BIOS jump table
+DMA_DEFAULT = 0x0080
+FCB1        = 0x005C
+FCB2        = 0x006C
+RECLEN      = 128
+EOF_BYTE    = 0x1A          # ^Z, padding at end of text files
+
+class CPM:
+    ''' A CP/M 2.2 BDOS and minimal page zero/BIOS for Machine `m`.
+
+        `dir` is the host directory used for all files. File names are
+        matched against CP/M names case-insensitively; new files are
+        created with upper-case names.
+
+        `input` and `output` are the console streams; if `input` has no
+        ``read()`` method it's used as the initial value of an `MBytesIO`,
+        and if `output` is not given a new `MBytesIO` is used.
+    '''
+
+    class BDOSError(RuntimeError):
+        ' An unimplemented or invalid BDOS function was called. '
+
+    def __init__(self, m, dir='.', *, input=b'', output=None):
+        self.m = m
+        self.dir = Path(dir)
+        if callable(getattr(input, 'read', None)):
+            self.input = input
+        else:
+            self.input = MBytesIO(input)
+        self.output = MBytesIO() if output is None else output
+        self.dma = DMA_DEFAULT
+        self.search = None          # remaining names for search next
+
+        self._setup_pagezero()
+        m.settrap(0x0005, self.bdos)
+        for n, name in enumerate(self.BIOS_CALLS):
+            if name is not None: m.settrap(BIOS + 3*n, getattr(self, name))
+
+    def _setup_pagezero(self):
+        m = self.m
+        JP, HLT = 0xC3, 0x76
+        m.deposit(0x0000, [JP, (BIOS+3) & 0xFF, (BIOS+3) >> 8])
+        m.deposit(0x0005, [JP, BDOS & 0xFF, BDOS >> 8])
+        #   Untrapped BIOS entries halt, which the simulator will not
+        #   execute, rather than running off into empty memory.
+        for n in range(17):
+            m.deposit(BIOS + 3*n, [HLT] * 3)
+
+    def load(self, path, args=''):
+        ''' Load the ``.COM`` file at `path` into the TPA and set up the
+            default FCBs and command tail from `args`, the command line
+            arguments after the program name.
+        '''
+        with open(path, 'rb') as f:
+            code = f.read()
+        self.m.deposit(TPA, code)
+
+        args = args.upper()
+        tail = (' ' + args if args else '').encode('ASCII')[:127]
+        self.m.deposit(0x80, [len(tail)])
+        self.m.deposit(0x81, tail + b'\x00' * (127 - len(tail)))
+        words = args.split()
+        for addr, word in zip((FCB1, FCB2), words + ['', '']):
+            self.m.deposit(addr, fcbname(word) + bytes(4))
+        self.m.deposit(FCB1 + 32, bytes(4))     # CR and random record
+
+    def run(self, **kwargs):
+        ''' Run the loaded program from the start of the TPA until it
+            returns to the CCP or warm-starts. This uses `Machine.call()`,
+            to which `kwargs` (e.g., ``maxsteps``) are passed.
+        '''
+        m = self.m
+        m.call(TPA, m.Registers(sp=BDOS & 0xFF00), retaddr=0x0000,
+            stopat=[0x0000], **kwargs)
+
+    ####################################################################
+    #   BIOS
+
+    def wboot(self, m):
+        return 0x0000
+
+    def const(self, m):
+        m.a = 0xFF if self._peek() else 0x00
+
+    def conin(self, m):
+        m.a = self._getc()
+
+    def conout(self, m):
+        self._putc(m.c)
+
+    BIOS_CALLS = (None, 'wboot', 'const', 'conin', 'conout')
+
+    ####################################################################
+    #   BDOS
+
+    def bdos(self, m):
+        if m.c == 0:                # system reset
+            return 0x0000           # warm start
+        f = self.BDOS_FUNCTIONS.get(m.c)
+        if f is None:
+            raise self.BDOSError('Unimplemented BDOS function {} at {}'
+                .format(m.c, m.regs))
+        ret = f(self, m)
+        if ret is None:
+            return None
+        #   8-bit results are returned in A and L, with B=H=0;
+        #   16-bit results in HL, with A=L and B=H.
+        m.hl = ret
+        m.a = ret & 0xFF
+        m.b = ret >> 8
+        return None
+
+    def conin1(self, m):        # 1
+        c = self._getc()
+        self._putc(c)
+        return c
+
+    def conout2(self, m):       # 2
+        self._putc(m.e)
+
+    def dirio(self, m):         # 6
+        if m.e == 0xFF:
+            return self._getc() if self._peek() else 0
+        if m.e == 0xFE:
+            return 0xFF if self._peek() else 0
+        self._putc(m.e)
+
+    def prstr(self, m):         # 9
+        addr = m.de
+        while True:
+            c = m.byte(addr)
+            if c == ord('$'): break
+            self._putc(c)
+            addr += 1
+
+    def rdbuf(self, m):         # 10
+        maxlen = m.byte(m.de)
+        chars = []
+        while len(chars) < maxlen:
+            c = self._getc()
+            if c in (0x0D, 0x0A): break
+            self._putc(c)
+            chars.append(c)
+        self._putc(0x0D)
+        m.deposit(m.de + 1, [len(chars)] + chars)
+
+    def const11(self, m):       # 11
+        return 0xFF if self._peek() else 0x00
+
+    def version(self, m):       # 12
+        return 0x0022
+
+    def resetdisk(self, m):     # 13
+        self.dma = DMA_DEFAULT
+        return 0
+
+    def selectdisk(self, m):    # 14
+        return 0
+
+    def open(self, m):          # 15
+        path = self._path(m.de)
+        if path is None: return 0xFF
+        m.deposit(m.de + 14, [0])                   # S2
+        self._setrc(m.de, path)
+        return 0
+
+    def close(self, m):         # 16
+        return 0 if self._path(m.de) else 0xFF
+
+    def searchfirst(self, m):   # 17
+        pattern = m.bytes(m.de + 1, 11)
+        self.search = sorted( n for n in self._cpmnames()
+            if fcbmatch(pattern, n) )
+        return self.searchnext(m)
+
+    def searchnext(self, m):    # 18
+        if not self.search: return 0xFF
+        name = self.search.pop(0)
+        path = self._path_for(name)
+        records = (path.stat().st_size + RECLEN - 1) // RECLEN
+        entry = bytearray(32)
+        entry[1:12] = fcbname(name)[1:12]
+        entry[12] = min(records // RECLEN, 31)          # EX
+        entry[15] = min(records - entry[12] * RECLEN, RECLEN)
+        m.deposit(self.dma, entry)
+        m.deposit(self.dma + 32, bytes(96))
+        return 0
+
+    def delete(self, m):        # 19
+        pattern = m.bytes(m.de + 1, 11)
+        names = [ n for n in self._cpmnames() if fcbmatch(pattern, n) ]
+        for n in names:
+            self._path_for(n).unlink()
+        return 0 if names else 0xFF
+
+    def readseq(self, m):       # 20
+        record = self._seqrecord(m.de)
+        ret = self._read(m.de, record)
+        if ret == 0: self._setseqrecord(m.de, record + 1)
+        return ret
+
+    def writeseq(self, m):      # 21
+        record = self._seqrecord(m.de)
+        ret = self._write(m.de, record)
+        if ret == 0: self._setseqrecord(m.de, record + 1)
+        return ret
+
+    def make(self, m):          # 22
+        path = self._path(m.de) or self.dir.joinpath(fcbhostname(m, m.de))
+        path.write_bytes(b'')
+        m.deposit(m.de + 12, bytes(4))              # EX, S1, S2, RC
+        m.deposit(m.de + 32, [0])                   # CR
+        return 0
+
+    def rename(self, m):        # 23
+        old = self._path(m.de)
+        if old is None: return 0xFF
+        old.rename(self.dir.joinpath(fcbhostname(m, m.de + 16)))
+        return 0
+
+    def curdisk(self, m):       # 25
+        return 0
+
+    def setdma(self, m):        # 26
+        self.dma = m.de
+
+    def readrand(self, m):      # 33
+        record = self._randrecord(m.de)
+        ret = self._read(m.de, record)
+        if ret == 0: self._setseqrecord(m.de, record)
+        return ret
+
+    def writerand(self, m):     # 34
+        record = self._randrecord(m.de)
+        ret = self._write(m.de, record)
+        if ret == 0: self._setseqrecord(m.de, record)
+        return ret
+
+    def filesize(self, m):      # 35
+        path = self._path(m.de)
+        if path is None: return 0xFF
+        records = (path.stat().st_size + RECLEN - 1) // RECLEN
+        m.deposit(m.de + 33, records.to_bytes(3, 'little'))
+        return 0
+
+    def setrandom(self, m):     # 36
+        record = self._seqrecord(m.de)
+        m.deposit(m.de + 33, record.to_bytes(3, 'little'))
+
+    BDOS_FUNCTIONS = {
+                        1: conin1,      2: conout2,     6: dirio,
+        9: prstr,       10: rdbuf,      11: const11,    12: version,
+        13: resetdisk,  14: selectdisk, 15: open,       16: close,
+        17: searchfirst, 18: searchnext, 19: delete,    20: readseq,
+        21: writeseq,   22: make,       23: rename,     25: curdisk,
+        26: setdma,     33: readrand,   34: writerand,  35: filesize,
+        36: setrandom,
+    }
+
+    ####################################################################
+    #   Console support
+
+    def _peek(self):
+        ''' Return `True` if there is console input available. '''
+        if hasattr(self.input, 'peek'):
+            return bool(self.input.peek(1))
+        pos = self.input.tell()
+        avail = self.input.read(1)
+        self.input.seek(pos)
+        return bool(avail)
+
+    def _getc(self):
+        bs = self.input.read(1)
+        if len(bs) == 0:
+            raise EOFError('No more console input available')
+        return bs[0]
+
+    def _putc(self, c):
+        self.output.write(bytes((c,)))
+
+    ####################################################################
+    #   File support
+
+    def _cpmnames(self):
+        ' The CP/M names (``NAME.TYP``) of all files in the directory. '
+        return [ p.name.upper() for p in self.dir.iterdir() if p.is_file() ]
+
+    def _path_for(self, cpmname):
+        for p in self.dir.iterdir():
+            if p.is_file() and p.name.upper() == cpmname:
+                return p
+        return None
+
+    def _path(self, fcb):
+        ' The host path of the file named in `fcb`, or `None`. '
+        return self._path_for(fcbhostname(self.m, fcb))
+
+    def _setrc(self, fcb, path):
+        ' Set RC to the number of records in the current extent. '
+        records = (path.stat().st_size + RECLEN - 1) // RECLEN
+        extent = self._seqrecord(fcb) // RECLEN
+        rc = max(0, min(RECLEN, records - extent * RECLEN))
+        self.m.deposit(fcb + 15, [rc])
+
+    def _seqrecord(self, fcb):
+        m = self.m
+        ex, s2, cr = m.byte(fcb + 12), m.byte(fcb + 14), m.byte(fcb + 32)
+        return ((s2 << 5) + (ex & 0x1F)) * RECLEN + cr
+
+    def _setseqrecord(self, fcb, record):
+        extent, cr = divmod(record, RECLEN)
+        self.m.deposit(fcb + 12, [extent & 0x1F])
+        self.m.deposit(fcb + 14, [extent >> 5])
+        self.m.deposit(fcb + 32, [cr])
+
+    def _randrecord(self, fcb):
+        return int.from_bytes(self.m.bytes(fcb + 33, 3), 'little')
+
+    def _read(self, fcb, record):
+        ''' Read `record` of the file in `fcb` into the DMA buffer,
+            returning the BDOS result code.
+        '''
+        path = self._path(fcb)
+        if path is None: return 0xFF
+        with open(path, 'rb') as f:
+            f.seek(record * RECLEN)
+            data = f.read(RECLEN)
+        if not data: return 1                       # end of file
+        data += bytes([EOF_BYTE]) * (RECLEN - len(data))
+        self.m.deposit(self.dma, data)
+        return 0
+
+    def _write(self, fcb, record):
+        path = self._path(fcb)
+        if path is None: return 0xFF
+        with open(path, 'r+b') as f:
+            f.seek(record * RECLEN)
+            f.write(self.m.bytes(self.dma, RECLEN))
+        self._setrc(fcb, path)
+        return 0
+
+####################################################################
+#   FCB names
+
+def fcbname(name):
+    ''' Given a CP/M file name, e.g. ``B:FOO.TXT``, return the first twelve
+        bytes (drive, name and type) of an FCB for it. A ``*`` in the name
+        or type is expanded to ``?`` characters.
+    '''
+    drive = 0
+    if len(name) > 1 and name[1] == ':':
+        drive = ord(name[0].upper()) - ord('A') + 1
+        name = name[2:]
+    base, _, ext = name.upper().partition('.')
+    def field(s, n):
+        if '*' in s: s = s[:s.index('*')].ljust(n, '?')
+        return s[:n].ljust(n).encode('ASCII')
+    return bytes([drive]) + field(base, 8) + field(ext, 3)
+
+def fcbmatch(pattern, name):
+    ''' Return `True` if the 11 name and type bytes `pattern` from an FCB
+        match file name `name`. As in CP/M, ``?`` in `pattern` matches any
+        character, including the space padding.
+    '''
+    try:
+        nametype = fcbname(name)[1:]
+    except UnicodeEncodeError:
+        return False                # not a valid CP/M name
+    return all( p == ord('?') or p & 0x7F == n
+        for p, n in zip(pattern, nametype) )
+
+def fcbhostname(m, fcb):
+    ' Return the host file name ``NAME.TYP`` for the FCB at `fcb`. '
+    s = bytes( b & 0x7F for b in m.bytes(fcb + 1, 11) ).decode('ASCII')
+    name, ext = s[:8].rstrip(), s[8:].rstrip()
+    return name + '.' + ext if ext else name
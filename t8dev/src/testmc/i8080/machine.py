@@ -2,7 +2,7 @@ from    itertools  import chain
 
 from    testmc.generic  import *
 from    testmc.i8080.opcodes  import OPCODES, Instructions as I
-from    testmc.i8080.opimpl  import InvalidOpcode, incword, readbyte
+from    testmc.i8080.opimpl  import InvalidOpcode, incword, readbyte, rst
 
 class Machine(GenericMachine):
 
@@ -14,6 +14,8 @@ class Machine(GenericMachine):
         self.pc = self.a = self.bc = self.de = self.hl = 0
         self.sp = 0xE000
         self.S = self.Z = self.H = self.P = self.C = False
+        self.IE = False                 # interrupt enable flip-flop
+        self.ei_clock = -2              # `clock` when last EI executed
 
     is_little_endian = True
     def get_memory_seq(self):
@@ -55,6 +57,25 @@ class Machine(GenericMachine):
                 .format(opcode, incword(self.pc, -1)))
         fn(self)
 
+    def _irq(self):
+        ''' The interrupting device supplies an instruction to execute,
+            which we accept only if it is an ``RST`` (the usual case);
+            ``irqvector`` defaults to ``RST 7``. Acknowledging the
+            interrupt disables further interrupts.
+        '''
+        if not self.IE or self.clock <= self.ei_clock + 1:
+            return False
+        vector = 0xFF if self.irqvector is None else self.irqvector
+        if vector & 0b11000111 != 0b11000111:
+            raise ValueError(
+                'irqvector ${:02X} is not an RST instruction'.format(vector))
+        self.IE = False
+        rst(self, vector & 0b00111000)
+        return True
+
+    def _nmi(self):
+        raise NotImplementedError('8080 has no non-maskable interrupt')
+
     def pushretaddr(self, word):
         self.depword(self.sp-2, word)
         self.sp -= 2
@@ -62,6 +83,11 @@ class Machine(GenericMachine):
     def getretaddr(self):
         return self.word(self.sp)
 
+    def popretaddr(self):
+        addr = self.word(self.sp)
+        self.sp += 2
+        return addr
+
     ####################################################################
     #   Tracing and similar information
 
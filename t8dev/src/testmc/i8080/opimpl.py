@@ -4,8 +4,6 @@
 #   XXX This contains a _lot_ of code copied from testmc.mc6800.opimpl;
 #   the common code should be pulled up to testmc.generic.opimpl.
 
-from    warnings  import warn
-
 ####################################################################
 
 class InvalidOpcode(RuntimeError):
@@ -366,24 +364,14 @@ def daa(m):
 def nop(m):         return
 
 def di(m):
-    ''' Disabling interrupts is a no-op as we don't (currently)
-        generate interrupts in the simulator.
-    '''
-    pass
+    m.IE = False
 
 def ei(m):
-    ''' Enabling interrupts is a no-op as we don't (currently)
-        generate interrupts in the simulator.
-
-        However, we do emit a warning on encountering this, as if someone
-        is testing code with an ``EI`` in it, they may have made an error
-        somewhere.
-
-        The warning will by default appear only once when this routine
-        is called outside of pytest; for dealing with this in pytest
-        see the pytest docs_.
-
-        docs_: https://docs.pytest.org/en/stable/how-to/capture-warnings.html
+    ''' Interrupts are not enabled until after the instruction following
+        the ``EI`` has been executed, so that an ``EI`` ``RET`` sequence
+        at the end of an interrupt handler returns before another
+        interrupt can be taken. We record the clock at which the ``EI``
+        executed for `Machine._irq()` to check.
     '''
-    warn(f'EI (${m.byte(m.pc-1):02X}) at ${m.pc:04X},'
-        ' but simulator will not generate interrupts')
+    m.IE = True
+    m.ei_clock = m.clock
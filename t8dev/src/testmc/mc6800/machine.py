@@ -3,6 +3,7 @@ from    testmc.generic  import *
 from    testmc.mc6800.opcodes  import OPCODES, Instructions
 from    testmc.mc6800.opimpl  import (
             InvalidOpcode, incword, readbyte, signedbyteat,
+            interrupt, IRQVEC, NMIVEC,
             )
 
 class Machine(GenericMachine):
@@ -64,6 +65,15 @@ class Machine(GenericMachine):
                 .format(opcode, incword(self.pc, -1)))
         f(self)
 
+    def _irq(self):
+        if self.I: return False
+        interrupt(self, IRQVEC)
+        return True
+
+    def _nmi(self):
+        interrupt(self, NMIVEC)
+        return True
+
     def pushretaddr(self, word):
         self.sp -= 2
         self.depword(self.sp+1, word)
@@ -71,6 +81,11 @@ class Machine(GenericMachine):
     def getretaddr(self):
         return self.word(self.sp+1)
 
+    def popretaddr(self):
+        addr = self.word(self.sp+1)
+        self.sp += 2
+        return addr
+
     ####################################################################
     #   Tracing and similar information
 
@@ -161,6 +161,25 @@ def rti(m):
     m.x  = popword(m)
     m.pc = popword(m)
 
+def interrupt(m, vector):
+    ''' Push the machine state on the stack, set the interrupt mask and
+        load the PC from `vector`. This is the common sequence for
+        ``SWI``, ``IRQ`` and ``NMI``; the pushed PC is the address of the
+        next instruction to execute, to which ``RTI`` will return.
+    '''
+    pushword(m, m.pc)
+    pushword(m, m.x)
+    pushbyte(m, m.a)
+    pushbyte(m, m.b)
+    pushbyte(m, 1 << 7 | 1 << 6 \
+                | m.H << 5 | m.I << 4 | m.N << 3 | m.Z << 2 | m.V << 1 | m.C)
+    m.pc = m.word(vector)
+    m.I = True
+
+IRQVEC = 0xFFFF - 7                 # PRM vector addresses for 16-bit bus
+SWIVEC = 0xFFFF - 5
+NMIVEC = 0xFFFF - 3
+
 def swi(m):
     ''' The definition of SWI is that it should set the PC to the address
         at (n-5), "where n is the address corresponding to a high state on
@@ -173,16 +192,7 @@ def swi(m):
     #   explicitly shows the PC being incremented past the instruction: "PC
     #   ← (PC) + 0001". Presumably it shows it here but not elsewhere just
     #   to make clear which PC value is being pushed on the stack.
-    pushword(m, m.pc)
-    pushword(m, m.x)
-    pushbyte(m, m.a)
-    pushbyte(m, m.b)
-    pushbyte(m, 1 << 7 | 1 << 6 \
-                | m.H << 5 | m.I << 4 | m.N << 3 | m.Z << 2 | m.V << 1 | m.C)
-
-    swivec = 0xFFFF - 5             # PRM definition for 16-bit address bus
-    m.pc = m.word(swivec)
-    m.I = True
+    interrupt(m, SWIVEC)
 
 ####################################################################
 #   Flag Changes
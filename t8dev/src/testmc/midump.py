@@ -1,15 +1,16 @@
 ''' testmc.midump - Dump a memory image in human-readable format
 
-    This currently reads only CoCo Disk BASIC binary files, as
-    produced by ASlink. It should be fairly easy to extend to do work
-    with 16-bit Intel hex or Motoroala S-record files, though we'd
-    have either to add an option to force the file format, try to do
-    auto-detection, or both.
+    This reads any file format known to `binary.loader`, including
+    ASL ``.p`` files, CoCo Disk BASIC binary files as produced by
+    ASlink, Intel HEX and Motorola S-records. The format is detected
+    automatically, or may be given with ``-f``.
 
     Ouput lines are in a typical standard address/hex/char format,
     though not exactly the same as either `hexdump -C` or `xxd`. The
     biggest difference is that the line address is always a multiple
-    of 16 and locations without data are displayed as spaces.
+    of 16 and locations without data are displayed as spaces. As with
+    `hexdump`, runs of identical lines are shown as ``*`` unless ``-v``
+    is given. The formatting is done by `binary.hexdump`.
 
     Lines are displayed in order of memory location, regardless of the
     order of records in the input file. If there are overlapping
@@ -19,25 +20,18 @@
     dump.
 '''
 
-from    binary.memimage  import MemImage
+from    binary  import loader
+from    binary  import hexdump
 from    argparse  import ArgumentParser
 
-def dump_memoryimage(mi):
+def dump_memoryimage(mi, collapse=True):
     #   Overlapping records are displayed in adjacent lines.
     #   Possibly we should have an option to warn about this
     #   a bit more clearly.
-    for mr in sorted(mi):
-        dump_memrecord(mr)
+    hexdump.dumpimage(mi, collapse=collapse)
 
-def dump_memrecord(mr):
-    #print('MEMRECORD @{:04x}: {}'.format(mr.addr, mr.data))
-    print(format_memline(mr.addr, mr.data))
-    pos, curaddr = alignmentshift(mr.addr)
-    while True:
-        curaddr += 16; pos += 16
-        curdata = mr.data[pos:pos+16]
-        if not curdata: return
-        print(format_memline(curaddr, curdata))
+def dump_memrecord(mr, collapse=True):
+    hexdump.dump(mr.addr, mr.data, collapse=collapse)
 
 def alignmentshift(addr):
     ''' Given an address, return a pair of the offset to the 16-byte
@@ -52,28 +46,11 @@ def format_memline(addr, data):
         first 16 bytes of those data starting at the the first 16-byte
         aligned address at or below `addr`.
 
-        Missing data positions will be filled in with `None`; data
-        `None` indicates that nothing (spaces) should be printed for
-        that location.
+        Positions before `addr` and after the end of the data are
+        displayed as spaces.
     '''
-    #   Ensure we have at least 16 bytes, filling with `None` on right.
-    if len(data) < 16:
-        data = tuple(data) + ((None,) * (16-len(data)))
-
-    #   Align our start address down to a 16-byte boundary.
     shift, addr = alignmentshift(addr)
-    data = (None,)*(-shift) + tuple(data)
-
-    line = '{:04x}: '.format(addr)
-    for i in range(0, 8):
-        line += hexfield(data[i])
-    line += '- '
-    for i in range(8, 16):   line += hexfield(data[i])
-    line += ' '
-    for i in range(0, 8):   line += charfield(data[i])
-    line += ' '
-    for i in range(8, 16):   line += charfield(data[i])
-    return line
+    return hexdump.formatline(addr, memoryview(bytes(data[:16+shift])), -shift)
 
 def hexfield(i):
     ' Return string with formatted hex field displaying integer i. '
@@ -82,23 +59,22 @@ def hexfield(i):
 
 def charfield(i):
     ' Return string with formatted char field displaying integer i. '
-    if i is None:
-        return ' '
-    else:
-        if i >= 0x20 and i < 0x7f:
-            return chr(i)
-        else:
-            return '.'
+    if i is None: return ' '
+    else:         return chr(hexdump.PRINTABLE[i])
 
 def parseargs():
     p = ArgumentParser(description='midump')
     arg = p.add_argument
+    arg('-f', '--format', choices=loader.FORMATS,
+        help='input file format (default: detect automatically)')
+    arg('-v', '--no-collapse', action='store_true',
+        help="display all lines rather than '*' for repeated lines")
     arg('inputfile')
     return p.parse_args()
 
 def main():
     args = parseargs()
-    mi = MemImage.parse_cocobin_fromfile(args.inputfile)
-    dump_memoryimage(mi)
+    mi = loader.load_fromfile(args.inputfile, args.format)
+    dump_memoryimage(mi, collapse=not args.no_collapse)
 
 if __name__ == '__main__': main()
@@ -1,11 +1,13 @@
 ''' testmc.mos65 - test framework for 6502 microcomputer code
 
-    This uses the py65 emulator to emulate a 6502 microcomputer system.
+    `Machine` is a native 6502 simulator. `Py65Machine` is an alternative
+    that uses the py65 emulator, if it is installed.
 '''
 
 from    testmc.mos65.instructions  import Instructions
 from    testmc.mos65.machine  import Machine
+from    testmc.mos65.py65machine  import Machine as Py65Machine
 
 I = Instructions
 
-__all__ = ['Machine', 'Instructions', 'I']
+__all__ = ['Machine', 'Py65Machine', 'Instructions', 'I']
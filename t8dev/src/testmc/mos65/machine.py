@@ -1,42 +1,39 @@
-''' The test "machine" itself.
-    Wraps py65 in an API suitable for use in unit tests.
-'''
+''' The test "machine" itself: a 6502 simulator.
 
-try:
-    from py65.devices.mpu6502 import MPU
-except ModuleNotFoundError:
-    #   Delay the ModuleNotFoundError until someone actually tries to use the
-    #   Machine class, rather than just loading it. This allows people to
-    #   load the framework (where __init__.py loads all these modules) and
-    #   use the parts that are supported.
-    class MPU:
-        def __init__(self):
-            raise ModuleNotFoundError('mos65 simulator requires py65 module')
+    This is a native implementation, independent of py65, using the same
+    design as the other `GenericMachine` simulators. The py65-based
+    machine is still available as `testmc.mos65.py65machine.Machine`.
+'''
 
-from    numbers  import Integral
-from    sys import stderr
+from    collections.abc  import Container
 
 from    testmc.generic  import *
-from    testmc.generic.iomem  import IOMem
 from    testmc.mos65.instructions  import Instructions
+from    testmc.mos65.opcodes  import OPCODES, DISPATCH, CYCLES
+from    testmc.mos65.opimpl  import (
+            InvalidOpcode, incword, interrupt, IRQVEC, NMIVEC, RESVEC,
+            )
 
-from    binary.tool import asl, asxxxx
+class Machine(GenericMachine):
 
-#   We don't use ObservableMemory, but if we did, we'd need this.
-#
-#class ObservableMemorySeq(ObservableMemory):
-#    ''' Our GenericMachine (`testmc.generic.memory.MemoryAccess`, actually)
-#        needs a standard sequence function that ObservableMemory does not
-#        provide.
-#    '''
-#    def __len__(self):
-#        return len(self._subject)
+    def __init__(self, *, memsize=65536):
+        ''' Initialize the machine.
 
-class Machine(GenericMachine):
+            As with py65, the stack pointer is initialized to $FF and all
+            other registers, flags and memory to zero.
+        '''
+        super().__init__()
+        self.mem = IOMem(memsize)
+        self.mem.copyapi(self)
+
+        self.pc = self.a = self.x = self.y = 0
+        self.sp = 0xFF
+        self.N = self.V = self.D = self.I = self.Z = self.C = False
+        self.cycles = 0
 
     is_little_endian = True
     def get_memory_seq(self):
-        return self.mpu.memory
+        return self.mem
 
     class Registers(GenericRegisters):
         machname = '6502'
@@ -47,34 +44,11 @@ class Machine(GenericMachine):
                     Flag('D'), Flag('I'), Flag('Z'), Flag('C'), )
         srname = 'p'
 
-    ####################################################################
-
-    def __init__(self):
-        super().__init__()
-
-        #   To implement functions simulating memory-mapped I/O we could
-        #   use py65.memory.ObservableMemory, but it's almost 3× slower
-        #   than the list of int that MPU() uses by default. Instead we use
-        #   our own IOMem which is only about 15% slower than the list of
-        #   int (perhaps because it's a bytearray and/or because it
-        #   subclasses instead of accessing a separate object.)
-        #
-        #   py65 may rely on the memory returning an int instead of some
-        #   sort of byte when individual elements are accessed, but if it
-        #   does it doesn't matter because bytearray's [] returns an int
-        #   when a single element is read. But this hasn't been tested with
-        #   py65's unit tests (though it has with many of 8bitdev's tests).
-        #
-        self.mpu = MPU(memory=IOMem())      # defaults to 64K
-        self.get_memory_seq().copyapi(self)
-
-        self.regsobj = self.mpu
-
     def _stackaddr(self, depth, size):
         ''' Return the address of `size` bytes of data on the stack
             at `depth` bytes above the current head of the stack.
         '''
-        addr = 0x100 + self.mpu.sp + 1 + depth
+        addr = 0x100 + self.sp + 1 + depth
         if addr >= 0x201 - size:
             raise IndexError("stack underflow: addr={:04X} size={}" \
                 .format(addr, size))
@@ -87,26 +61,148 @@ class Machine(GenericMachine):
         return self.word(self._stackaddr(depth, 2))
 
     ####################################################################
-    #   Execution
+    #   Instruction Execution
+
+    _ABORT_opcodes  = set([Instructions.BRK])
+
+    def reset(self):    self.pc = self.word(RESVEC)
 
-    _ABORT_opcodes      = set([Instructions.BRK])
+    def _getpc(self):   return self.pc
+    def _getsp(self):   return self.sp
 
-    def reset(self):    self.pc = self.word(0xFFFC)
+    InvalidOpcode = InvalidOpcode
 
-    def _getpc(self):   return self.mpu.pc
-    def _getsp(self):   return self.mpu.sp
-    def _step(self):    self.mpu.step()
+    def _step(self):
+        pc = self.pc
+        opcode = self.mem.read(pc)
+        self.pc = (pc + 1) & 0xFFFF
+        DISPATCH[opcode](self)
+        self.cycles += CYCLES[opcode]
+
+    def step(self, count=1, *, trace=False):
+        ''' As `GenericMachine.step()`, but when not tracing and with no
+            traps set, `_step()` is inlined into a loop with the memory
+            and dispatch tables in local variables. Once an event or
+            interrupt sets a trap, the remaining steps are done by
+            `GenericMachine.step()`.
+        '''
+        if trace or self.traps:
+            return super().step(count, trace=trace)
+        mem = self.mem
+        read = mem.read
+        dispatch, cycles = DISPATCH, CYCLES
+        for i in range(count):
+            pc = self.pc
+            opcode = read(pc)
+            self.pc = (pc + 1) & 0xFFFF
+            dispatch[opcode](self)
+            self.cycles += cycles[opcode]
+            self.clock += 1
+            if self.clock >= self._nextcheck:
+                self._service()
+                if self.traps:
+                    return super().step(count - i - 1)
+                read = mem.read         # I/O may have been set
+
+    def stepto(self, addr=None, *, stopat=set(), stopon=set(), nstop=1,
+        trace=False, maxsteps=GenericMachine.MAXSTEPS, raisetimeout=True):
+        ''' As `GenericMachine.stepto()`, with `step()` inlined in the
+            same way when not tracing and with no traps set.
+        '''
+        if trace or self.traps:
+            return super().stepto(addr, stopat=stopat, stopon=stopon,
+                nstop=nstop, trace=trace, maxsteps=maxsteps,
+                raisetimeout=raisetimeout)
+        assert isinstance(stopat, Container), \
+            "'stopat' must be a collections.abc.Container"
+        assert isinstance(stopon, Container), \
+            "'stopon' must be a collections.abc.Container"
+
+        if addr is not None:
+            self.setregs(self.Registers(pc=addr))
+
+        mem = self.mem
+        read = mem.read
+        dispatch, cycles = DISPATCH, CYCLES
+        remaining = maxsteps - 1
+        while True:
+            pc = self.pc
+            opcode = read(pc)
+            self.pc = (pc + 1) & 0xFFFF
+            dispatch[opcode](self)
+            self.cycles += cycles[opcode]
+            self.clock += 1
+            if self.clock >= self._nextcheck:
+                self._service()
+                read = mem.read
+            pc = self.pc
+            if pc in stopat or (read(pc) in stopon and pc not in self.traps):
+                nstop -= 1
+                if nstop == 0: break
+            if remaining <= 0:
+                if raisetimeout:
+                    self._raiseTimeout(maxsteps)
+                else:
+                    return maxsteps
+            remaining -= 1
+            if self.traps:
+                #   Set by an event; continue without inlining.
+                return maxsteps - 1 - remaining + super().stepto(
+                    stopat=stopat, stopon=stopon, nstop=nstop,
+                    maxsteps=remaining + 1, raisetimeout=raisetimeout)
+        return maxsteps - remaining
+
+    def _irq(self):
+        if self.I: return False
+        interrupt(self, IRQVEC, self.pc)
+        self.cycles += 7
+        return True
+
+    def _nmi(self):
+        interrupt(self, NMIVEC, self.pc)
+        self.cycles += 7
+        return True
 
     def pushretaddr(self, addr):
         ''' Like JSR, this pushes `addr` - 1; RTS compensates for this.
             See MC6800 Family Programming Manual §8.1 p.108.
         '''
-        self.mpu.sp -= 2
-        self.depword(self._stackaddr(0, 2), addr - 1)
+        self.sp -= 2
+        self.depword(self._stackaddr(0, 2), incword(addr, -1))
 
     def getretaddr(self):
         ''' Like RTS, we compensate for the return address pointing to the
             last byte of the JSR operand instead of the first byte of the
             next instruction. See MC6800 Family Programming Manual §8.2 p.108.
         '''
-        return self.word(self._stackaddr(0, 2)) + 1
+        return incword(self.word(self._stackaddr(0, 2)), 1)
+
+    def popretaddr(self):
+        addr = self.getretaddr()
+        self.sp += 2
+        return addr
+
+    ####################################################################
+    #   Tracing and similar information
+
+    def disasm(self):
+        ''' Disassemble a 6502 opcode and its operands at the PC. '''
+        pc = self.regs.pc
+        op = self.byte(pc)
+        if op not in OPCODES:
+            return '.byte ${:02X}'.format(op)
+        name, mode, _, _ = OPCODES[op]
+        b = self.byte(incword(pc, 1))
+        w = b | self.byte(incword(pc, 2)) << 8
+        if mode == '':  return name
+        if mode == 'A': return name + ' A'
+        if mode == 'r':
+            return '{} ${:04X}'.format(name, incword(pc, 2 + b - (b & 0x80)*2))
+        fmt = {
+            '#':  '#${:02X}',   'z':  '${:02X}',    'zx': '${:02X},X',
+            'zy': '${:02X},Y',  'a':  '${:04X}',    'ax': '${:04X},X',
+            'ay': '${:04X},Y',  'i':  '(${:04X})',  'ix': '(${:02X},X)',
+            'iy': '(${:02X}),Y',
+            }[mode]
+        return '{} {}'.format(name,
+            fmt.format(w if mode in ('a', 'ax', 'ay', 'i') else b))
@@ -0,0 +1,241 @@
+''' Opcode and instruction mappings.
+'''
+
+from    testmc.mos65.opimpl  import *
+
+__all__ = ( 'OPCODES', 'MODES', 'DISPATCH', 'CYCLES', 'mnemonic',
+    'InvalidOpcode' )
+
+####################################################################
+#   Map opcodes to instruction names, addressing modes, implementations
+#   and base cycle counts. Opcodes not listed here are invalid.
+#
+#   The addressing modes are the lower-case suffixes used by `Instructions`
+#   (see its docstring), with the addition of ``#`` for immediate, ``A``
+#   for accumulator and ``r`` for relative. (The empty string is implied.)
+#   For instructions with an operand the implementation is an operation
+#   function taking the effective address as its second argument; the
+#   others take only the machine.
+
+OPCODES = {
+    0x00: ('BRK', '',   brk,  7),
+    0x01: ('ORA', 'ix', ora,  6),
+    0x05: ('ORA', 'z',  ora,  3),
+    0x06: ('ASL', 'z',  asl,  5),
+    0x08: ('PHP', '',   php,  3),
+    0x09: ('ORA', '#',  ora,  2),
+    0x0A: ('ASL', 'A',  asla, 2),
+    0x0D: ('ORA', 'a',  ora,  4),
+    0x0E: ('ASL', 'a',  asl,  6),
+    0x10: ('BPL', 'r',  bpl,  2),
+    0x11: ('ORA', 'iy', ora,  5),
+    0x15: ('ORA', 'zx', ora,  4),
+    0x16: ('ASL', 'zx', asl,  6),
+    0x18: ('CLC', '',   clc,  2),
+    0x19: ('ORA', 'ay', ora,  4),
+    0x1D: ('ORA', 'ax', ora,  4),
+    0x1E: ('ASL', 'ax', asl,  7),
+    0x20: ('JSR', 'a',  jsr,  6),
+    0x21: ('AND', 'ix', and_, 6),
+    0x24: ('BIT', 'z',  bit,  3),
+    0x25: ('AND', 'z',  and_, 3),
+    0x26: ('ROL', 'z',  rol,  5),
+    0x28: ('PLP', '',   plp,  4),
+    0x29: ('AND', '#',  and_, 2),
+    0x2A: ('ROL', 'A',  rola, 2),
+    0x2C: ('BIT', 'a',  bit,  4),
+    0x2D: ('AND', 'a',  and_, 4),
+    0x2E: ('ROL', 'a',  rol,  6),
+    0x30: ('BMI', 'r',  bmi,  2),
+    0x31: ('AND', 'iy', and_, 5),
+    0x35: ('AND', 'zx', and_, 4),
+    0x36: ('ROL', 'zx', rol,  6),
+    0x38: ('SEC', '',   sec,  2),
+    0x39: ('AND', 'ay', and_, 4),
+    0x3D: ('AND', 'ax', and_, 4),
+    0x3E: ('ROL', 'ax', rol,  7),
+    0x40: ('RTI', '',   rti,  6),
+    0x41: ('EOR', 'ix', eor,  6),
+    0x45: ('EOR', 'z',  eor,  3),
+    0x46: ('LSR', 'z',  lsr,  5),
+    0x48: ('PHA', '',   pha,  3),
+    0x49: ('EOR', '#',  eor,  2),
+    0x4A: ('LSR', 'A',  lsra, 2),
+    0x4C: ('JMP', 'a',  jmp,  3),
+    0x4D: ('EOR', 'a',  eor,  4),
+    0x4E: ('LSR', 'a',  lsr,  6),
+    0x50: ('BVC', 'r',  bvc,  2),
+    0x51: ('EOR', 'iy', eor,  5),
+    0x55: ('EOR', 'zx', eor,  4),
+    0x56: ('LSR', 'zx', lsr,  6),
+    0x58: ('CLI', '',   cli,  2),
+    0x59: ('EOR', 'ay', eor,  4),
+    0x5D: ('EOR', 'ax', eor,  4),
+    0x5E: ('LSR', 'ax', lsr,  7),
+    0x60: ('RTS', '',   rts,  6),
+    0x61: ('ADC', 'ix', adc,  6),
+    0x65: ('ADC', 'z',  adc,  3),
+    0x66: ('ROR', 'z',  ror,  5),
+    0x68: ('PLA', '',   pla,  4),
+    0x69: ('ADC', '#',  adc,  2),
+    0x6A: ('ROR', 'A',  rora, 2),
+    0x6C: ('JMP', 'i',  jmp,  5),
+    0x6D: ('ADC', 'a',  adc,  4),
+    0x6E: ('ROR', 'a',  ror,  6),
+    0x70: ('BVS', 'r',  bvs,  2),
+    0x71: ('ADC', 'iy', adc,  5),
+    0x75: ('ADC', 'zx', adc,  4),
+    0x76: ('ROR', 'zx', ror,  6),
+    0x78: ('SEI', '',   sei,  2),
+    0x79: ('ADC', 'ay', adc,  4),
+    0x7D: ('ADC', 'ax', adc,  4),
+    0x7E: ('ROR', 'ax', ror,  7),
+    0x81: ('STA', 'ix', sta,  6),
+    0x84: ('STY', 'z',  sty,  3),
+    0x85: ('STA', 'z',  sta,  3),
+    0x86: ('STX', 'z',  stx,  3),
+    0x88: ('DEY', '',   dey,  2),
+    0x8A: ('TXA', '',   txa,  2),
+    0x8C: ('STY', 'a',  sty,  4),
+    0x8D: ('STA', 'a',  sta,  4),
+    0x8E: ('STX', 'a',  stx,  4),
+    0x90: ('BCC', 'r',  bcc,  2),
+    0x91: ('STA', 'iy', sta,  6),
+    0x94: ('STY', 'zx', sty,  4),
+    0x95: ('STA', 'zx', sta,  4),
+    0x96: ('STX', 'zy', stx,  4),
+    0x98: ('TYA', '',   tya,  2),
+    0x99: ('STA', 'ay', sta,  5),
+    0x9A: ('TXS', '',   txs,  2),
+    0x9D: ('STA', 'ax', sta,  5),
+    0xA0: ('LDY', '#',  ldy,  2),
+    0xA1: ('LDA', 'ix', lda,  6),
+    0xA2: ('LDX', '#',  ldx,  2),
+    0xA4: ('LDY', 'z',  ldy,  3),
+    0xA5: ('LDA', 'z',  lda,  3),
+    0xA6: ('LDX', 'z',  ldx,  3),
+    0xA8: ('TAY', '',   tay,  2),
+    0xA9: ('LDA', '#',  lda,  2),
+    0xAA: ('TAX', '',   tax,  2),
+    0xAC: ('LDY', 'a',  ldy,  4),
+    0xAD: ('LDA', 'a',  lda,  4),
+    0xAE: ('LDX', 'a',  ldx,  4),
+    0xB0: ('BCS', 'r',  bcs,  2),
+    0xB1: ('LDA', 'iy', lda,  5),
+    0xB4: ('LDY', 'zx', ldy,  4),
+    0xB5: ('LDA', 'zx', lda,  4),
+    0xB6: ('LDX', 'zy', ldx,  4),
+    0xB8: ('CLV', '',   clv,  2),
+    0xB9: ('LDA', 'ay', lda,  4),
+    0xBA: ('TSX', '',   tsx,  2),
+    0xBC: ('LDY', 'ax', ldy,  4),
+    0xBD: ('LDA', 'ax', lda,  4),
+    0xBE: ('LDX', 'ay', ldx,  4),
+    0xC0: ('CPY', '#',  cpy,  2),
+    0xC1: ('CMP', 'ix', cmp,  6),
+    0xC4: ('CPY', 'z',  cpy,  3),
+    0xC5: ('CMP', 'z',  cmp,  3),
+    0xC6: ('DEC', 'z',  dec,  5),
+    0xC8: ('INY', '',   iny,  2),
+    0xC9: ('CMP', '#',  cmp,  2),
+    0xCA: ('DEX', '',   dex,  2),
+    0xCC: ('CPY', 'a',  cpy,  4),
+    0xCD: ('CMP', 'a',  cmp,  4),
+    0xCE: ('DEC', 'a',  dec,  6),
+    0xD0: ('BNE', 'r',  bne,  2),
+    0xD1: ('CMP', 'iy', cmp,  5),
+    0xD5: ('CMP', 'zx', cmp,  4),
+    0xD6: ('DEC', 'zx', dec,  6),
+    0xD8: ('CLD', '',   cld,  2),
+    0xD9: ('CMP', 'ay', cmp,  4),
+    0xDD: ('CMP', 'ax', cmp,  4),
+    0xDE: ('DEC', 'ax', dec,  7),
+    0xE0: ('CPX', '#',  cpx,  2),
+    0xE1: ('SBC', 'ix', sbc,  6),
+    0xE4: ('CPX', 'z',  cpx,  3),
+    0xE5: ('SBC', 'z',  sbc,  3),
+    0xE6: ('INC', 'z',  inc,  5),
+    0xE8: ('INX', '',   inx,  2),
+    0xE9: ('SBC', '#',  sbc,  2),
+    0xEA: ('NOP', '',   nop,  2),
+    0xEC: ('CPX', 'a',  cpx,  4),
+    0xED: ('SBC', 'a',  sbc,  4),
+    0xEE: ('INC', 'a',  inc,  6),
+    0xF0: ('BEQ', 'r',  beq,  2),
+    0xF1: ('SBC', 'iy', sbc,  5),
+    0xF5: ('SBC', 'zx', sbc,  4),
+    0xF6: ('INC', 'zx', inc,  6),
+    0xF8: ('SED', '',   sed,  2),
+    0xF9: ('SBC', 'ay', sbc,  4),
+    0xFD: ('SBC', 'ax', sbc,  4),
+    0xFE: ('INC', 'ax', inc,  7),
+}
+
+####################################################################
+#   Addressing mode functions.
+#
+#   Instructions that read memory take an extra cycle when indexing crosses
+#   a page; these use the second function of the pair.
+
+MODES = {
+    '#':  (imm,  imm),
+    'z':  (zp,   zp),
+    'zx': (zpx,  zpx),
+    'zy': (zpy,  zpy),
+    'a':  (ab,   ab),
+    'ax': (abx,  abx_r),
+    'ay': (aby,  aby_r),
+    'i':  (ind,  ind),
+    'ix': (indx, indx),
+    'iy': (indy, indy_r),
+}
+
+READS = frozenset((
+    ora, and_, eor, adc, sbc, bit, cmp, cpx, cpy, lda, ldx, ldy ))
+
+def mnemonic(opcode):
+    ''' Return the `Instructions` name for `opcode`, or `None` if it is
+        not a valid opcode.
+    '''
+    if opcode not in OPCODES:
+        return None
+    name, mode, _, _ = OPCODES[opcode]
+    if mode in ('', '#', 'A', 'r') or opcode in (0x20, 0x4C):  # JSR, JMP
+        return name
+    return name + mode
+
+def _dispatchf(mode, f):
+    ''' Return the function executing an instruction with addressing mode
+        `mode` and implementation `f`. For the common immediate, zero page
+        and absolute modes the operand is read here rather than by a
+        separate addressing mode function.
+    '''
+    if mode not in MODES:
+        return f
+    if mode == '#':
+        def op(m):
+            pc = m.pc
+            m.pc = (pc + 1) & 0xFFFF
+            f(m, pc)
+    elif mode == 'z':
+        def op(m):
+            pc = m.pc
+            m.pc = (pc + 1) & 0xFFFF
+            f(m, m.mem.read(pc))
+    elif mode == 'a':
+        def op(m):
+            pc = m.pc
+            m.pc = (pc + 2) & 0xFFFF
+            read = m.mem.read
+            f(m, read(pc) | read((pc + 1) & 0xFFFF) << 8)
+    else:
+        addrf = MODES[mode][f in READS]
+        def op(m):
+            f(m, addrf(m))
+    return op
+
+#   The dispatch tables used by `Machine._step()`, indexed by opcode.
+DISPATCH = tuple(
+    _dispatchf(*OPCODES[op][1:3]) if op in OPCODES else invalid
+    for op in range(0x100))
+CYCLES = tuple(OPCODES[op][3] if op in OPCODES else 0 for op in range(0x100))
@@ -0,0 +1,318 @@
+''' Implementation of opcodes.
+
+    Instructions that take an operand are split into an addressing mode
+    function, which is passed a reference to a `Machine` instance with the
+    program counter pointing to the byte after the opcode and consumes the
+    operand, returning the effective address, and an operation function
+    which is passed the `Machine` and that address. Instructions without an
+    operand (implied, accumulator and relative modes) are a single function
+    that is passed only the `Machine`. `testmc.mos65.opcodes` combines these
+    into the opcode dispatch table.
+
+    The results, including flags in decimal mode and cycle counts, follow
+    the py65 simulator so that the two may be tested against each other.
+'''
+
+####################################################################
+
+class InvalidOpcode(RuntimeError):
+    ''' Since it is designed for testing code, the simulator
+        will not execute invalid opcodes, instead raising an exception.
+    '''
+    def __init__(self, opcode, regs):
+        self.opcode = opcode; self.regs = regs
+        super().__init__('op=${:02X}, {}'.format(opcode, regs))
+
+def invalid(m):
+    #   The PC PC has already been advanced past the opcode; undo this.
+    pc = incword(m.pc, -1)
+    regs = m.regs.clone(pc=pc)
+    raise InvalidOpcode(m.mem.read(pc), regs)
+
+####################################################################
+#   Address handling, reading data at the PC
+
+def incbyte(byte, addend):
+    ''' Return 8-bit `byte` incremented by `addend` (which may be negative).
+        This returns an 8-bit unsigned result, wrapping at $FF/$00.
+    '''
+    return (byte + addend) & 0xFF
+
+def incword(word, addend):
+    ''' Return 16-bit `word` incremented by `addend` (which may be negative).
+        This returns a 16-bit unsigned result, wrapping at $FFFF/$0000.
+    '''
+    return (word + addend) & 0xFFFF
+
+def readbyte(m):
+    ' Consume a byte at [PC] and return it. '
+    pc = m.pc
+    m.pc = (pc + 1) & 0xFFFF
+    return m.mem.read(pc)
+
+def readword(m):
+    ' Consume a little-endian word at [PC] and return it. '
+    # Careful! PC may wrap between bytes.
+    lsb = readbyte(m)
+    return lsb | readbyte(m) << 8
+
+def pageword(m, addr):
+    ''' Return the little-endian word at `addr`, reading the MSB from the
+        same page as the LSB. The 6502 does not carry into the high byte of
+        the address when reading indirect zero-page pointers (which thus
+        wrap from $FF to $00) or the `JMP (addr)` pointer.
+    '''
+    return m.mem.read(addr) | m.mem.read((addr & 0xFF00) | ((addr + 1) & 0xFF)) << 8
+
+####################################################################
+#   Addressing modes
+
+def imm(m):
+    pc = m.pc
+    m.pc = (pc + 1) & 0xFFFF
+    return pc
+
+def zp(m):      return readbyte(m)
+def zpx(m):     return (readbyte(m) + m.x) & 0xFF
+def zpy(m):     return (readbyte(m) + m.y) & 0xFF
+def ab(m):      return readword(m)
+def abx(m):     return (readword(m) + m.x) & 0xFFFF
+def aby(m):     return (readword(m) + m.y) & 0xFFFF
+def ind(m):     return pageword(m, readword(m))
+def indx(m):    return pageword(m, (readbyte(m) + m.x) & 0xFF)
+def indy(m):    return (pageword(m, readbyte(m)) + m.y) & 0xFFFF
+
+def pagecross(m, base, index):
+    ''' Return `base` + `index`, adding the extra cycle taken by
+        instructions that read memory when this crosses a page boundary.
+    '''
+    addr = (base + index) & 0xFFFF
+    if (addr ^ base) & 0xFF00:
+        m.cycles += 1
+    return addr
+
+def abx_r(m):   return pagecross(m, readword(m), m.x)
+def aby_r(m):   return pagecross(m, readword(m), m.y)
+def indy_r(m):  return pagecross(m, pageword(m, readbyte(m)), m.y)
+
+####################################################################
+#   Flags
+
+def getp(m):
+    ''' Return the processor status register. The B and unused bits are
+        always set, as when it is pushed by ``PHP`` or ``BRK``.
+    '''
+    return m.N << 7 | m.V << 6 | 0b00110000 \
+        | m.D << 3 | m.I << 2 | m.Z << 1 | m.C
+
+def setp(m, p):
+    m.N = bool(p & 0x80); m.V = bool(p & 0x40); m.D = bool(p & 0x08)
+    m.I = bool(p & 0x04); m.Z = bool(p & 0x02); m.C = bool(p & 0x01)
+
+def nz(m, val):
+    ' Set the N and Z flags for `val` and return it. '
+    m.N = val >= 0x80
+    m.Z = val == 0
+    return val
+
+def clc(m): m.C = False
+def cld(m): m.D = False
+def cli(m): m.I = False
+def clv(m): m.V = False
+def sec(m): m.C = True
+def sed(m): m.D = True
+def sei(m): m.I = True
+
+def nop(m): pass
+
+####################################################################
+#   Stack, jumps and branches
+
+def pushbyte(m, byte):
+    ' Push a byte on to the stack. '
+    m.mem[0x100 | m.sp] = byte
+    m.sp = (m.sp - 1) & 0xFF
+
+def popbyte(m):
+    ' Pop a byte off the stack and return it. '
+    m.sp = (m.sp + 1) & 0xFF
+    return m.mem.read(0x100 | m.sp)
+
+def pushword(m, word):
+    ' Push a word on to the stack, MSB followed by LSB. '
+    pushbyte(m, word >> 8)
+    pushbyte(m, word & 0xFF)
+
+def popword(m):
+    ' Pop a word off the stack and return it. '
+    lsb = popbyte(m)
+    return lsb | popbyte(m) << 8
+
+def pha(m): pushbyte(m, m.a)
+def php(m): pushbyte(m, getp(m))
+def pla(m): m.a = nz(m, popbyte(m))
+def plp(m): setp(m, popbyte(m))
+
+def jmp(m, addr):
+    m.pc = addr
+
+def jsr(m, addr):
+    ' Like the CPU, we push the address of the last byte of the JSR. '
+    pushword(m, incword(m.pc, -1))
+    m.pc = addr
+
+def rts(m): m.pc = incword(popword(m), 1)
+
+def rti(m):
+    setp(m, popbyte(m))
+    m.pc = popword(m)
+
+def interrupt(m, vector, pc, b=0):
+    ''' Push `pc` and the status register (with the B bit set to `b`),
+        set the interrupt mask and load the PC from `vector`.
+    '''
+    pushword(m, pc)
+    pushbyte(m, getp(m) & ~0x10 | b << 4)
+    m.I = True
+    m.pc = m.mem.read(vector) | m.mem.read(vector + 1) << 8
+
+NMIVEC = 0xFFFA
+RESVEC = 0xFFFC
+IRQVEC = 0xFFFE
+
+def brk(m):
+    ''' The byte after the BRK opcode is skipped on return with RTI,
+        allowing it to be used as a signature for the break.
+    '''
+    interrupt(m, IRQVEC, incword(m.pc, 1), b=1)
+
+def branchif(m, predicate):
+    ''' A taken branch takes an extra cycle, and another if the target
+        is in a different page from the following instruction.
+    '''
+    pc = m.pc
+    offset = m.mem.read(pc)
+    pc = m.pc = (pc + 1) & 0xFFFF
+    if predicate:
+        target = (pc + offset - ((offset & 0x80) << 1)) & 0xFFFF
+        m.cycles += 2 if (pc ^ target) & 0xFF00 else 1
+        m.pc = target
+
+def bcc(m): branchif(m, not m.C)
+def bcs(m): branchif(m, m.C)
+def bne(m): branchif(m, not m.Z)
+def beq(m): branchif(m, m.Z)
+def bpl(m): branchif(m, not m.N)
+def bmi(m): branchif(m, m.N)
+def bvc(m): branchif(m, not m.V)
+def bvs(m): branchif(m, m.V)
+
+####################################################################
+#   Loads, stores and transfers
+
+def lda(m, addr):   a = m.a = m.mem.read(addr); m.N = a >= 0x80; m.Z = a == 0
+def ldx(m, addr):   x = m.x = m.mem.read(addr); m.N = x >= 0x80; m.Z = x == 0
+def ldy(m, addr):   y = m.y = m.mem.read(addr); m.N = y >= 0x80; m.Z = y == 0
+def sta(m, addr):   m.mem[addr] = m.a
+def stx(m, addr):   m.mem[addr] = m.x
+def sty(m, addr):   m.mem[addr] = m.y
+
+def tax(m): m.x = nz(m, m.a)
+def tay(m): m.y = nz(m, m.a)
+def txa(m): m.a = nz(m, m.x)
+def tya(m): m.a = nz(m, m.y)
+def tsx(m): m.x = nz(m, m.sp)
+def txs(m): m.sp = m.x
+
+#   These, and the loads, are common enough that `nz()` is inlined.
+def inx(m): x = m.x = (m.x + 1) & 0xFF; m.N = x >= 0x80; m.Z = x == 0
+def iny(m): y = m.y = (m.y + 1) & 0xFF; m.N = y >= 0x80; m.Z = y == 0
+def dex(m): x = m.x = (m.x - 1) & 0xFF; m.N = x >= 0x80; m.Z = x == 0
+def dey(m): y = m.y = (m.y - 1) & 0xFF; m.N = y >= 0x80; m.Z = y == 0
+
+####################################################################
+#   Arithmetic and logic
+
+def ora(m, addr):   m.a = nz(m, m.a | m.mem.read(addr))
+def and_(m, addr):  m.a = nz(m, m.a & m.mem.read(addr))
+def eor(m, addr):   m.a = nz(m, m.a ^ m.mem.read(addr))
+
+def bit(m, addr):
+    val = m.mem.read(addr)
+    m.N = bool(val & 0x80); m.V = bool(val & 0x40)
+    m.Z = not (m.a & val)
+
+def compare(m, reg, addr):
+    val = m.mem.read(addr)
+    m.C = reg >= val
+    m.Z = reg == val
+    m.N = bool((reg - val) & 0x80)
+
+def cmp(m, addr):   compare(m, m.a, addr)
+def cpx(m, addr):   compare(m, m.x, addr)
+def cpy(m, addr):   compare(m, m.y, addr)
+
+def adc(m, addr):
+    ''' In decimal mode the N, V and Z flags are set from the binary
+        (unadjusted) result of the nybble additions, as on the NMOS 6502.
+    '''
+    data = m.mem.read(addr); a = m.a; c = m.C
+    if m.D:
+        lo = (a & 0xF) + (data & 0xF) + c
+        hi = (a >> 4) + (data >> 4) + (lo > 9)
+        result = ((hi & 0xF) << 4) | (lo & 0xF)
+        m.C = hi > 9
+        lo += 6 * (lo > 9); hi += 6 * (hi > 9)
+        m.a = ((hi & 0xF) << 4) | (lo & 0xF)
+    else:
+        result = a + data + c
+        m.C = result > 0xFF
+        result &= 0xFF
+        m.a = result
+    m.V = bool(~(a ^ data) & (a ^ result) & 0x80)
+    nz(m, result)
+
+def sbc(m, addr):
+    ''' As with `adc`, the flags are set from the binary result in
+        decimal mode.
+    '''
+    data = m.mem.read(addr); a = m.a; c = m.C
+    result = a + (data ^ 0xFF) + c
+    m.C = result > 0xFF
+    result &= 0xFF
+    m.V = bool((a ^ data) & (a ^ result) & 0x80)
+    nz(m, result)
+    if m.D:
+        halfcarry = (a & 0xF) + (~data & 0xF) + c > 0xF
+        lo = result if halfcarry else result + 10
+        hi = result if (a >> 4) + ((data ^ 0xFF) >> 4) + halfcarry > 0xF \
+            else result + 0xA0
+        m.a = (hi & 0xF0) | (lo & 0x0F)
+    else:
+        m.a = result
+
+def _asl(m, val):   m.C = val >= 0x80;  return nz(m, (val << 1) & 0xFF)
+def _lsr(m, val):   m.C = bool(val & 1); return nz(m, val >> 1)
+
+def _rol(m, val):
+    c, m.C = m.C, val >= 0x80
+    return nz(m, (val << 1) & 0xFF | c)
+
+def _ror(m, val):
+    c, m.C = m.C, bool(val & 1)
+    return nz(m, val >> 1 | c << 7)
+
+def _inc(m, val):   return nz(m, (val + 1) & 0xFF)
+def _dec(m, val):   return nz(m, (val - 1) & 0xFF)
+
+def asla(m):    m.a = _asl(m, m.a)
+def lsra(m):    m.a = _lsr(m, m.a)
+def rola(m):    m.a = _rol(m, m.a)
+def rora(m):    m.a = _ror(m, m.a)
+
+def asl(m, addr):   m.mem[addr] = _asl(m, m.mem.read(addr))
+def lsr(m, addr):   m.mem[addr] = _lsr(m, m.mem.read(addr))
+def rol(m, addr):   m.mem[addr] = _rol(m, m.mem.read(addr))
+def ror(m, addr):   m.mem[addr] = _ror(m, m.mem.read(addr))
+def inc(m, addr):   m.mem[addr] = _inc(m, m.mem.read(addr))
+def dec(m, addr):   m.mem[addr] = _dec(m, m.mem.read(addr))
@@ -9,6 +9,7 @@
 
 import  pytest
 from    t8dev  import path
+from    testmc.generic.biostraps  import trapbios
 
 @pytest.fixture
 def m(request):
@@ -98,16 +99,23 @@ def loadbios(m, S):
         ``istream, ostream`` (with ``istream`` usually ignored) is returned
         for the test to query.
 
+        If `traps` is `True`, the BIOS console routines are replaced with
+        much faster Python implementations; see `testmc.generic.biostraps`.
+        This is useful for tests generating a lot of output. The traps
+        leave the registers and flags as the assembled routines do, but
+        changes to ``bioscode.asm`` will not be seen.
+
         Sample usage::
 
             _, ostream = loadbios('mc6800', b'some input\n')
             ...
             assert b'Hello, world!' == ostream.getvalue()
     '''
-    def loadbios(*, input=None, output=None, biosname=None):
+    def loadbios(*, input=None, output=None, biosname=None, traps=False):
         biosname = biosname or m.biosname()
         bioscode = path.obj('testmc/', biosname, 'tmc/bioscode.p')
         m.load(bioscode, mergestyle='prefcur', setPC=False)
+        if traps: trapbios(m)
         assert S['charinport'] == S['charoutport']
         #   XXX Doesn't work for I/O address spaces.
         return m.setiostreams(S.charinport, input, output)
@@ -5,11 +5,14 @@
     in the `testmc.*.tmc` modules.
 '''
 
+from    contextlib  import contextmanager
 from    functools  import partial
 from    importlib.resources  import files as resfiles
-from    os  import isatty
+from    os  import isatty, read
 from    pathlib  import Path
+from    select  import select
 from    sys  import stdin, stdout
+from    time  import monotonic
 from    traceback  import print_exception
 from    types  import ModuleType as module
 from    typing import Optional
@@ -17,6 +20,9 @@ import  argparse
 import  termios, tty
 
 import  t8dev.cli.exits as exits, t8dev.path as path
+from    testmc.generic.biostraps  import trapbios
+from    testmc.generic.events  import NEVER
+from    testmc.generic.idle  import PollLoop
 import  testmc
 
 def main():
@@ -29,7 +35,7 @@ def main():
     #   XXX This thing where the CPU name is separate from the CPU module
     #   (i.e., mapped in SIMULATORS) is a bit awkward; we should look at
     #   finding a way to have the module or Machine know its own CPU name.
-    exec(cpuname, cpumodule, binpath(cpuname, args.file))
+    exec(cpuname, cpumodule, binpath(cpuname, args.file), args.trap_bios)
 
 def parseargs(args=None):
     parser = argparse.ArgumentParser(description='tmc XXX', epilog='XXX')
@@ -38,6 +44,9 @@ def parseargs(args=None):
         help='XXX print dir with tmc support files for given CPU')
     a('-L', '--list-simulators', nargs=0, action=ListSimulators,
         help='Print a list of available simulators.')
+    a('-t', '--trap-bios', action='store_true',
+        help='run the BIOS console routines in Python (faster, but'
+        ' ignores changes to bioscode.asm)')
     a('cpu', help='select CPU simulator')
     a('file', help='file to load and run (.p added if necessary)')
     return parser.parse_args(args)
@@ -63,11 +72,11 @@ def binpath(cpu:str, binpath:str) -> Path:
 
 ####################################################################
 
-def exec(cpuname:str, cpumodule:module, exepath:Path):
+def exec(cpuname:str, cpumodule:module, exepath:Path, traps:bool=False):
     print(f'{cpumodule.__name__} executing {path.pretty(exepath)}')
     m = cpumodule.Machine()
     entrypoint = m.load(exepath)
-    setupIO(m, cpuname)
+    setupIO(m, cpuname, traps)
 
     m.reset()
     #   If we have an entrypoint in the object file, we start there for
@@ -81,15 +90,24 @@ def exec(cpuname:str, cpumodule:module, exepath:Path):
         tb = None   # Traceback not usually useful. Add option to print it?
         print_exception(None, ex, tb)
 
-def setupIO(m, cpuname):
+def setupIO(m, cpuname, traps=False):
     ''' Load the BIOS, set up `charoutport` for writes to stdout,
-        `charinport` for blocking reads from stdin, and `exitport`
-        for exiting the process.
+        `charinport` for blocking reads from stdin, `charstatport` for
+        checking if input is available, and `exitport` for exiting
+        the process.
+
+        If `traps` is true the BIOS console routines are trapped to run
+        in Python (see `testmc.generic.biostraps`), which is much faster
+        than simulating them, as with ``loadbios(traps=True)``.
     '''
     bioscode = path.obj('testmc', cpuname, 'tmc/bioscode.p')
     m.load(bioscode, mergestyle='prefcur', setPC=False)
+    if traps: trapbios(m)
     m.setio(m.symtab.charinport, consoleio)
     m.setio(m.symtab.exitport, partial(exitport, exitcmd=m.symtab.exitportcmd))
+    charstatport = getattr(m.symtab, 'charstatport', None)
+    if charstatport is not None:    # not in BIOS built by older versions
+        m.setio(charstatport, ConsoleStatus(m))
 
 def consoleio(_addr, char):
     if char is None:
@@ -102,6 +120,68 @@ def exitport(_addr, val, exitcmd=None):
     if val == exitcmd: exit(0)
     return exitcmd
 
+#   Nominal speed of the simulated machine, used only to convert between
+#   `clock` ticks and real time when sleeping in an idle loop.
+TICKS_PER_SECOND = 1000000
+
+class ConsoleStatus:
+    ''' I/O function for `charstatport`: reads return $01 if a character
+        is available from `stream` or $00 if not; writes are ignored.
+
+        When the program is found to be spinning in a loop polling this
+        port (see `PollLoop`) we block until input is available or the
+        next scheduled event is due, instead of using 100% of the host CPU.
+        The clock is advanced by as many whole iterations of the loop as
+        would have executed in the time we waited, at `ticks_per_second`.
+    '''
+
+    def __init__(self, m, stream=stdin, ticks_per_second=TICKS_PER_SECOND):
+        self.m = m
+        self.stream = stream
+        self.ticks_per_second = ticks_per_second
+        self.poll = PollLoop(m)
+
+    def __call__(self, _addr, val):
+        if val is not None: return
+        if self.ready(0): return 1
+        ticks = self.poll.polled()
+        if ticks is not None: self.idle(ticks)
+        return int(self.ready(0))
+
+    def ready(self, timeout):
+        ''' Return `True` if `stream` becomes readable within `timeout`
+            seconds (`None` to wait indefinitely).
+        '''
+        return bool(select([self.stream], [], [], timeout)[0])
+
+    def idle(self, ticks):
+        m = self.m
+        maxiter = self.poll.iterations_to_event(ticks)
+        if m.events.nextdue() == NEVER:
+            timeout = None
+        else:
+            timeout = maxiter * ticks / self.ticks_per_second
+        start = monotonic()
+        with rawtty(self.stream.fileno()):
+            self.ready(timeout)
+        elapsed = int((monotonic() - start) * self.ticks_per_second)
+        self.poll.skip(ticks, min(maxiter, elapsed // ticks))
+
+@contextmanager
+def rawtty(fd):
+    ''' Put the terminal on `fd` (if it is a terminal) into raw mode,
+        restoring the previous mode on exit.
+    '''
+    if not isatty(fd):
+        yield
+        return
+    prevattrs = termios.tcgetattr(fd)
+    try:
+        tty.setraw(fd, termios.TCSADRAIN)
+        yield
+    finally:
+        termios.tcsetattr(fd, termios.TCSANOW, prevattrs)
+
 def getchar():
     ''' Blocking read of a charater from stdin, in raw mode.
 
@@ -112,15 +192,10 @@ def getchar():
         XXX Echo probably should be disabled all the time to avoid echoing
         typeahead.
     '''
+    #   We read directly from the file descriptor so that no input is left
+    #   in a Python buffer where `ConsoleStatus` cannot see it.
     fd = stdin.fileno()
-    if not isatty(fd):
-        bs = stdin.buffer.read(1)
-    else:
-        prevattrs = termios.tcgetattr(fd)
-        try:
-            tty.setraw(fd, termios.TCSADRAIN)
-            bs = stdin.buffer.read(1)
-        finally:
-            termios.tcsetattr(fd, termios.TCSANOW, prevattrs)
+    with rawtty(fd):
+        bs = read(fd, 1)
     if bs == b'':  raise EOFError('no more input')
     return bs[0]